@@ -20,8 +20,22 @@ DATA_PATH = os.path.join(cwd, 'data')
 LINK_DATA_PATH = os.path.join(cwd, 'data/link')
 NORMALIZE_DATA_PATH = os.path.join(cwd, 'data/normalize')
 RESOURCE_PATH = os.path.join(cwd, 'resource')
+# Caches built at runtime (close match indexes, lexicons, parsed addresses),
+# stored with the data rather than with the sources. Can be moved by setting
+# MERGE_MACHINE_CACHE_PATH
+DYNAMIC_RESOURCE_PATH = os.environ.get('MERGE_MACHINE_CACHE_PATH', os.path.join(DATA_PATH, 'cache'))
+
+# Number of processes on which each transform job runs modules chunk by chunk
+# (1 to run them in the worker itself). Deployments with more CPUs than
+# workers can raise it
+TRANSFORM_PROCESSES = 1
+
+# Memory (in bytes) that the data of a job may take in a worker. Chunk sizes
+# (for reading, transforming and Elasticsearch) are chosen to fit in it
+WORKER_MEMORY_BUDGET = 1024 * 2**20
 
 print('DATA_PATH\n', DATA_PATH)
 print('LINK_DATA_PATH\n', LINK_DATA_PATH)
 print('NORMALIZE_DATA_PATH\n', NORMALIZE_DATA_PATH)
-print('RESOURCE_PATH\n', RESOURCE_PATH)
\ No newline at end of file
+print('RESOURCE_PATH\n', RESOURCE_PATH)
+print('DYNAMIC_RESOURCE_PATH\n', DYNAMIC_RESOURCE_PATH)
\ No newline at end of file
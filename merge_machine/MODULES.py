@@ -8,8 +8,8 @@ Created on Mon Apr 24 17:18:28 2017
 
 from es_linker import es_linker
 from results_analyzer import link_results_analyzer
-from missing_values import infer_mvs, replace_mvs, sample_mvs_ilocs
-from preprocess_fields_v3 import infer_types, normalize_values, sample_types_ilocs
+from missing_values import infer_mvs, replace_mvs, sample_mvs_ilocs, TopValuesSummaries
+from preprocess_fields_v3 import infer_types, normalize_values, sample_types_ilocs, NormalizationMemo
 # from restrict_reference import infer_restriction, perform_restriction
 
 
@@ -48,7 +48,8 @@ NORMALIZE_MODULES = {
                     'recode_types': {
                                'func':  normalize_values,
                                'desc': normalize_values.__doc__,
-                               'use_in_full_run': True
+                               'use_in_full_run': True,
+                               'memo': NormalizationMemo
                            },
                     'concat_with_init': {
                                'desc': 'Merge intial and transformed files (cannot be called)',
@@ -59,7 +60,8 @@ NORMALIZE_MODULES = {
                 'infer_mvs': {
                                 'func': infer_mvs,
                                 'write_to': 'replace_mvs',
-                                'desc': infer_mvs.__doc__
+                                'desc': infer_mvs.__doc__,
+                                'summaries': TopValuesSummaries
                             },
                 'infer_types': {
                                'func': infer_types,
@@ -88,7 +90,10 @@ LINK_MODULES = {
                     'es_linker': {
                                'func': es_linker,
                                'desc': es_linker.__doc__,
-                               'use_in_full_run': True
+                               'use_in_full_run': True,
+                               # I/O bound: chunks are sent to Elasticsearch
+                               # from threads sharing the connection
+                               'worker_type': 'thread'
                             }
                     },
         'infer':{
@@ -9,12 +9,15 @@ https://www.elastic.co/guide/en/elasticsearch/reference/current/vm-max-map-count
 https://www.elastic.co/guide/en/elasticsearch/guide/current/heap-sizing.html
 # ES can fail, try increasing heap size in jvm config file: /etc/elasticsearch/jvm.options
 """
-from collections import defaultdict
+from collections import defaultdict, deque
 import copy
+from functools import partial
 import gc
 import json
 import logging
-from itertools import tee
+from itertools import chain, tee
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
 import time
 
@@ -24,11 +27,68 @@ import numpy as np
 import pandas as pd
 
 from abstract_project import AbstractProject, NOT_IMPLEMENTED_MESSAGE
+from checkpoints import Checkpoint
+from CONFIG import TRANSFORM_PROCESSES
+from chunk_planner import PLANNING_ROWS, peak_rss, plan_chunksize, row_bytes
+from excel_writer import write_xlsx
+from modified_bitmaps import is_modified_column, modified_path
+from sampling import RowSample, SAMPLE_CAPACITY
 from LINKER_CONFIG import DEFAULT_ANALYZER
 from es_connection import es, ic
+from storage import CsvStorage, STORAGE_BACKENDS, intermediate_storage, \
+                    modified_counts, move, remove, storage_for
 
 MINI_PREFIX = 'MINI__'
 
+# Transform module (function, parameters and memo) run by the current worker
+# process of a parallel transform (see _init_transform_worker)
+WORKER_TRANSFORM = None
+
+def _run_transform_func(func, params, memo, data):
+    '''Calls a transform module function on data (without __MODIFIED columns)'''
+    if memo is not None:
+        new_data, modified = func(data, params, memo=memo)
+    else:
+        new_data, modified = func(data, params)
+    return new_data, modified, None
+
+def _init_transform_worker(func, params, memo):
+    '''Initializer of the worker processes of a parallel transform'''
+    global WORKER_TRANSFORM
+    if memo is not None:
+        memo.for_worker()
+    WORKER_TRANSFORM = (func, params, memo)
+
+def _skip_rows(tab_gen, resume):
+    '''
+    Generates the DataFrames of tab_gen without the rows that an interrupted
+    run of the same job already wrote. The number of rows to skip is only
+    known once write_data starts consuming data (see checkpoints.py).
+    
+    INPUT:
+        - resume: dict shared by all generators reading the data in memory
+                (mem_data_info['resume'])
+    '''
+    to_skip = None
+    for part_tab in tab_gen:
+        if to_skip is None:
+            to_skip = resume['skip_rows']
+            resume['started'] = True
+        if to_skip >= len(part_tab):
+            to_skip -= len(part_tab)
+            continue
+        if to_skip:
+            part_tab = part_tab.iloc[to_skip:]
+            to_skip = 0
+        yield part_tab
+
+def _run_transform_in_worker(data):
+    '''Runs the transform of the worker process on data and returns the
+    updates of its memo along with the results'''
+    func, params, memo = WORKER_TRANSFORM
+    new_data, modified, _ = _run_transform_func(func, params, memo, data)
+    return new_data, modified, memo.drain() if memo is not None else None
+
 class AbstractDataProject(AbstractProject):
     '''
     Allows loading and writing of data objects (pandas DataFrames) and 
@@ -36,7 +96,27 @@ class AbstractDataProject(AbstractProject):
     '''    
     default_module_log = {'completed': False, 'skipped': False}    
     
+    # Chunk sizes are chosen from the memory budget of workers (see 
+    # chunk_planner.py) unless ADAPTIVE_CHUNKSIZE is False, in which case 
+    # chunks have CHUNKSIZE rows
+    ADAPTIVE_CHUNKSIZE = True
     CHUNKSIZE = 3000
+    
+    # Number of rows (the first of the data) on which inference is run, 
+    # whatever the size of chunks
+    INFER_ROWS = 3000
+    
+    # Modules whose data is only read back by the project (through load_data)
+    # and is thus stored with the intermediate storage backend (see storage.py)
+    INTERMEDIATE_MODULES = []
+
+    # Number of workers on which transform modules are run chunk by chunk
+    # (1 to run them in the current process)
+    TRANSFORM_PROCESSES = TRANSFORM_PROCESSES
+
+    # Chunks read ahead per worker, which bounds the memory used by parallel
+    # transforms
+    CHUNKS_IN_FLIGHT_PER_PROCESS = 2
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)    
@@ -46,6 +126,7 @@ class AbstractDataProject(AbstractProject):
         self.run_info_buffer = dict()
         self.log_buffer = [] # List of logs not yet written to metadata.json    
         self.last_written = {}
+        self.memos = dict() # Memos of transform modules (by module name) not yet written
 
 
     def _default_log(self):
@@ -100,8 +181,58 @@ class AbstractDataProject(AbstractProject):
         return (module_name, file_name)
 
 
+    def _data_paths(self, module_name, file_name):
+        '''Paths the data of a file in a module can be stored at (one per
+        storage backend), starting with the path it should be written to'''
+        if module_name not in self.INTERMEDIATE_MODULES:
+            return [self.path_to(module_name, file_name)]
+        base_name = os.path.splitext(file_name)[0]
+        extensions = [intermediate_storage().EXTENSION] \
+                    + [backend.EXTENSION for backend in STORAGE_BACKENDS.values()]
+        return [self.path_to(module_name, base_name + ext) \
+                for i, ext in enumerate(extensions) if ext not in extensions[:i]]
+    
+    def _data_path(self, module_name, file_name):
+        '''Path the data of a file in a module is stored at (or should be
+        written to if it was not written yet)'''
+        file_paths = self._data_paths(module_name, file_name)
+        return next(filter(os.path.isfile, file_paths), file_paths[0])
+
     def _is_file(self, module_name, file_name):
-        return os.path.isfile(self.path_to(module_name, file_name))
+        return any(os.path.isfile(file_path) \
+                   for file_path in self._data_paths(module_name, file_name))
+
+    def _remove(self, module_name='', file_name=''):
+        '''Removes a file from the project (in all storage formats)'''
+        file_paths = list(filter(os.path.isfile, self._data_paths(module_name, file_name)))
+        if not file_paths:
+            return super()._remove(module_name, file_name)
+        for file_path in file_paths:
+            remove(file_path)
+        if os.path.isfile(self._sample_path(module_name, file_name)):
+            os.remove(self._sample_path(module_name, file_name))
+
+    def path_to_csv(self, module_name, file_name, expand_modified=False):
+        '''Path to the data of a file in a module as csv. Data stored in 
+        another format is written as csv first (for download or indexing).
+        
+        If expand_modified, __MODIFIED columns (stored as bitmaps) are 
+        written as columns, in a separate csv file (for download).'''
+        csv_path = self.path_to(module_name, file_name)
+        file_path = self._data_path(module_name, file_name)
+        if (file_path != csv_path) and not os.path.isfile(csv_path):
+            logging.info('Writing {0} as csv'.format(file_path))
+            tab_gen = self._static_load_data(file_path)
+            CsvStorage().write(csv_path + '.tmp', tab_gen)
+            move(csv_path + '.tmp', csv_path)
+        if expand_modified and os.path.isfile(modified_path(csv_path)):
+            expanded_path = os.path.splitext(csv_path)[0] + '__expanded.csv'
+            logging.info('Writing {0} with __MODIFIED columns'.format(file_path))
+            tab_gen = self._static_load_data(csv_path)
+            CsvStorage().write(expanded_path + '.tmp', tab_gen, modified_bitmaps=False)
+            os.replace(expanded_path + '.tmp', expanded_path)
+            return expanded_path
+        return csv_path
 
     def clean_after(self, module_name, file_name, delete_current_module=True):
         '''Removes all occurences of file (file_name) and transformations
@@ -140,8 +271,8 @@ class AbstractDataProject(AbstractProject):
 
     def _get_header(self, module_name, file_name):
         #TODO: this is a cheap fix for a specific use. DO NOT USE
-        file_path = self.path_to(module_name, file_name)
-        return list(pd.read_csv(file_path, encoding='utf-8', nrows=1).columns)
+        file_path = self._data_path(module_name, file_name)
+        return storage_for(file_path).header(file_path)
 
     def upload_init_data(self, file, file_name, user_given_name=None):
         raise NotImplementedError(NOT_IMPLEMENTED_MESSAGE)
@@ -224,34 +355,61 @@ class AbstractDataProject(AbstractProject):
         else:
             return str
     
-    def _static_load_data(self, file_path, nrows=None, columns=None): 
+    def _chunksize_for(self, tab, use='transform'):
+        '''
+        Number of rows of chunks for data of which tab holds the first rows
+        (see chunk_planner.py for uses)
         '''
-        Load a pandas DataFrame into memory from a csv in file_path. dtype will 
-        be str by default except for some column names with '__'. This function 
-        is intended to be used to read results of normalization and/or matching.
-        Only the first rows will be read (the number of rows being self.CHUNKSIZE)
+        if not self.ADAPTIVE_CHUNKSIZE:
+            return self.CHUNKSIZE
+        copies = 1
+        if (use == 'transform') and (self.TRANSFORM_PROCESSES > 1):
+            copies = self.TRANSFORM_PROCESSES * self.CHUNKS_IN_FLIGHT_PER_PROCESS
+        return plan_chunksize(row_bytes(tab), use, copies)
+
+    def _file_chunksize(self, file_path, columns=None, use='transform'):
+        '''Number of rows of chunks for the data of a file (estimated from
+        its first rows)'''
+        if not self.ADAPTIVE_CHUNKSIZE:
+            return self._chunksize_for(None, use)
+        storage = storage_for(file_path)
+        if columns is None:
+            columns = storage.header(file_path)
+        dtype = {col: self._choose_dtype(col) for col in columns}
+        tab = next(iter(storage.read(file_path, dtype, columns=columns, 
+                                     nrows=PLANNING_ROWS, chunksize=PLANNING_ROWS)), 
+                   pd.DataFrame(columns=columns))
+        return self._chunksize_for(tab, use)
+    
+    def _static_load_data(self, file_path, nrows=None, columns=None, chunksize=None): 
+        '''
+        Load a pandas DataFrame into memory from a csv (or a file of another 
+        storage backend) in file_path. dtype will be str by default except for 
+        some column names with '__'. This function is intended to be used to 
+        read results of normalization and/or matching.
         
         INPUT:
             file_path: path to csv file
             nrows: number of rows to read
             columns: columns to load
+            chunksize: number of rows of DataFrames (chosen for the file 
+                        if None, see _file_chunksize)
         
         OUTPUT:
-            tab: pandas DataFrame
+            tab: generator of pandas DataFrames
         '''
+        storage = storage_for(file_path)
         if columns is None:
-            columns = pd.read_csv(file_path, encoding='utf-8', dtype=str, 
-                                  nrows=0, usecols=columns).columns
+            columns = storage.header(file_path)
             
         dtype = {col: self._choose_dtype(col) for col in columns}
 
         if nrows is not None:
             logging.debug('Nrows is: {0}'.format(nrows))
-            tab = pd.read_csv(file_path, encoding='utf-8', dtype=dtype, 
-                                nrows=nrows, usecols=columns, chunksize=self.CHUNKSIZE)
-        else:
-            tab = pd.read_csv(file_path, encoding='utf-8', dtype=dtype, 
-                                        usecols=columns, chunksize=self.CHUNKSIZE)
+        if chunksize is None:
+            chunksize = self._file_chunksize(file_path, columns)
+        tab = storage.read(file_path, dtype, columns=columns, nrows=nrows, 
+                           chunksize=chunksize)
 
         return tab
         
@@ -271,48 +429,72 @@ class AbstractDataProject(AbstractProject):
         '''
         logging.debug('Columns selected to load are: {0}'.format(columns))
 
-        file_path = self.path_to(module_name, file_name)     
-        self.mem_data = self._static_load_data(file_path, nrows, columns)
+        file_path = self._data_path(module_name, file_name)     
+        stat = os.stat(file_path)
         self.mem_data_info = {'file_name': file_name,
                               'module_name': module_name,
                               'nrows': nrows, 
                               'columns': columns,
-                              'data_was_transformed': False}
+                              'chunksize': self._file_chunksize(file_path, columns),
+                              'data_was_transformed': False,
+                              # Used to resume jobs from checkpoints
+                              'source': [file_path, stat.st_size, stat.st_mtime],
+                              'transforms': [],
+                              'resume': {'skip_rows': 0, 'started': False, 
+                                         'checkpoints': []}}
+        self.mem_data = self._skip_resumed_rows(
+                            self._static_load_data(file_path, nrows, columns, 
+                                                   self.mem_data_info['chunksize']))
+
+    def _skip_resumed_rows(self, tab_gen):
+        '''Skips rows of tab_gen written by an interrupted run of the job
+        (for data loaded with load_data)'''
+        if 'resume' not in self.mem_data_info:
+            return tab_gen
+        return _skip_rows(tab_gen, self.mem_data_info['resume'])
 
 
-    def to_xls(self, module_name, file_name):
+    def to_xls(self, module_name, file_name, modified_columns=False):
         '''
-        Takes the file specified by module and file names and writes an xls in 
+        Takes the file specified by module and file names and writes an xlsx in
         the same directory with the same name (changing the file extension).
-        
+
         Columns of the original file will be written in the first sheet.
-        Columns containing "__" will be written the second sheet
-        
+        Columns containing "__" will be written the second sheet. Data is
+        written by chunks, and sheets are continued in new sheets when they
+        reach the row limit of Excel (see excel_writer.py)
+
         Use for download only!
-        
+
         INPUT:
             - module_name:
             - file_name:
+            - modified_columns: include the __MODIFIED columns
+        OUTPUT:
+            - new_file_name: name of the xlsx file
         '''
-        raise DeprecationWarning('Excel download currently not supported due'\
-                                 'to potential memory issues with large files')
-        
-        file_path = self.path_to(module_name, file_name)
-        
+        file_path = self._data_path(module_name, file_name)
+
         assert file_name[-4:] == '.csv'
-        new_file_name = file_name[:-4] + '.xlsx'
+        new_file_name = file_name[:-4] + ('__expanded.xlsx' if modified_columns else '.xlsx')
         new_file_path = self.path_to(module_name, new_file_name)
-        
-        tab = pd.read_csv(file_path, encoding='utf-8', dtype=str)
-        
-        
-        columns_og = [x for x in tab.columns if '__' not in x]
-        columns_new = [x for x in tab.columns if '__' in x]
-        
-        writer = pd.ExcelWriter(new_file_path)
-        tab[columns_og].to_excel(writer, 'original_file', index=False)
-        tab[columns_new].to_excel(writer, 'normalization', index=False)
-        writer.save()        
+
+        # Written again only if the data was written since
+        if os.path.isfile(new_file_path) \
+                and os.path.getmtime(new_file_path) >= os.path.getmtime(file_path):
+            return new_file_name
+
+        columns = storage_for(file_path).header(file_path)
+        if not modified_columns:
+            columns = [x for x in columns if not is_modified_column(x)]
+        columns_og = [x for x in columns if '__' not in x]
+        columns_new = [x for x in columns if '__' in x]
+
+        logging.info('Writing {0} as xlsx'.format(file_path))
+        tab_gen = self._static_load_data(file_path, columns=columns)
+        write_xlsx(new_file_path + '.tmp', tab_gen,
+                   [('original_file', columns_og), ('normalization', columns_new)])
+        os.replace(new_file_path + '.tmp', new_file_path)
         return new_file_name
 
 
@@ -334,7 +516,7 @@ class AbstractDataProject(AbstractProject):
         self._check_mem_data()
         
         self.mem_data, tab_gen = tee(self.mem_data)
-        part_tab = next(tab_gen)
+        part_tab = self._sample_tab(next(tab_gen))
         
         sample_params.setdefault('randomize', True)
         
@@ -379,6 +561,38 @@ class AbstractDataProject(AbstractProject):
         sample = sub_tab.to_dict('records')    
         return sample
     
+    def _sample_path(self, module_name, file_name):
+        return self.path_to(module_name, file_name + RowSample.FILE_SUFFIX)
+
+    def _load_sample(self, file_name, module_name='INIT'):
+        '''Sample of the rows of a file built on upload, or collected when the
+        file was written in module_name (None if there is none)'''
+        return RowSample.load(self._sample_path(module_name, file_name))
+
+    def _sample_tab(self, part_tab):
+        '''
+        Rows of the data in memory among which samples are selected: the rows
+        at the positions of the sample of the entire file built on upload
+        (see sampling.py), as stored with the file loaded, or the first 
+        DataFrame if there is no such sample (MINI files, which are samples 
+        already, or data transformed since it was loaded).
+        
+        INPUT:
+            - part_tab: first DataFrame of the data in memory
+        '''
+        if self.mem_data_info['data_was_transformed']:
+            return part_tab
+        sample = self._load_sample(self.mem_data_info['file_name'], 
+                                   self.mem_data_info['module_name'])
+        if (sample is None) \
+                or any(col not in sample.rows.columns for col in part_tab.columns):
+            return part_tab
+        
+        sample_tab = sample.rows[list(part_tab.columns)]
+        if self.mem_data_info.get('nrows') is not None:
+            sample_tab = sample_tab[sample_tab.index < self.mem_data_info['nrows']]
+        return sample_tab
+    
     @staticmethod
     def _is_mini(file_name):
         '''Does name match with that of a "mini" file'''
@@ -402,6 +616,8 @@ class AbstractDataProject(AbstractProject):
         INPUT:
             - params:
                 sample_size: Number of rows to include in the "MINI" file
+                            (default: SAMPLE_CAPACITY, so that the sample
+                            built on upload is used)
                 randomize: chose sample_size elements randomly from the file in
                             memory
         '''
@@ -410,7 +626,7 @@ class AbstractDataProject(AbstractProject):
         self._check_mem_data()
     
         # Set defaults
-        sample_size = params.get('sample_size', self.CHUNKSIZE - 1)
+        sample_size = params.get('sample_size', SAMPLE_CAPACITY)
         randomize = params.get('randomize', True)       
         new_file_name = self._mini_from_og(self.mem_data_info['file_name'])
 
@@ -419,22 +635,41 @@ class AbstractDataProject(AbstractProject):
             raise Exception('make_mini can only be called on data in memory from the INIT module')
        
         part_tab = next(self.mem_data)
+        tab_gen = chain([part_tab], self.mem_data)
+        
+        if randomize:
+            # Use the sample of the entire file built on upload, or sample 
+            # the file in a single pass if it has none (or a smaller one)
+            sample = self._load_sample(self.mem_data_info['file_name'])
+            if (sample is None) \
+                    or ((sample.capacity < sample_size) and (sample.nrows > sample.capacity)) \
+                    or any(col not in sample.rows.columns for col in part_tab.columns):
+                sample = RowSample(capacity=sample_size)
+                for tab in tab_gen:
+                    sample.update(tab)
+            num_rows = sample.nrows
+            sample_tab = sample.subsample(sample_size)[list(part_tab.columns)]
+        else:
+            # Read the first rows only
+            parts = []
+            num_rows = 0
+            for tab in tab_gen:
+                parts.append(tab)
+                num_rows += len(tab)
+                if num_rows > sample_size:
+                    break
+            sample_tab = pd.concat(parts).iloc[:sample_size]
         
         # Only create file if it is larger than sample size
-        if part_tab.shape[0] > sample_size:            
+        if num_rows > sample_size:            
             logging.info('Running make_mini')
             self.clean_after('INIT', new_file_name) # TODO: check module_name for clean_after
             
             # Initiate log
             log = self._init_active_log('INIT', 'transform')  # TODO: hack here: module_name should be 'make_mini'
             
-            if randomize:
-                sample_index = np.random.permutation(part_tab.index)[:sample_size]
-            else:
-                sample_index = part_tab.index[:sample_size]
-            
             # Replace data in memory
-            self.mem_data = (x for x in [part_tab.loc[sample_index, :]])
+            self.mem_data = (x for x in [sample_tab.reset_index(drop=True)])
             
             # Update metadata and log
             self.metadata['has_mini'] = True
@@ -507,6 +742,12 @@ class AbstractDataProject(AbstractProject):
             config_file_name = file_name + '__run_info.json'
             self.upload_config_data(run_info, module_name, config_file_name)
         self.run_info_buffer = dict()
+
+    def _write_memos(self):
+        '''Writes the memos of transform modules run since the last call and clears them.'''
+        for memo in self.memos.values():
+            memo.save()
+        self.memos = dict()
         
     def write_data(self):
         '''Write data stored in memory to proper module.
@@ -521,8 +762,8 @@ class AbstractDataProject(AbstractProject):
         dir_path = self.path_to(self.mem_data_info['module_name'])
         if not os.path.isdir(dir_path):
             os.makedirs(dir_path)        
-        file_path = self.path_to(self.mem_data_info['module_name'], 
-                                 self.mem_data_info['file_name'])
+        file_path = self._data_path(self.mem_data_info['module_name'], 
+                                    self.mem_data_info['file_name'])
 
         
         # TODO: move this. This was done to avoid concat with init when no changes were made
@@ -536,31 +777,55 @@ class AbstractDataProject(AbstractProject):
 
         else:
             print(self.mem_data_info)
-            with open(file_path, 'w') as w:
-                # If any data was transformed: write the transformed data
-                # if self.mem_data_info['data_was_transformed']:
-                try:
-                    # Enumerate to know whether or not to write header (i==0)
-                    for i, part_tab in enumerate(self.mem_data):
-                        if i == 0:
-                            columns = part_tab.columns
-                        logging.debug('At part {0}'.format(i))
-                        part_tab[columns].to_csv(w, encoding='utf-8', 
-                                             index=False,  
-                                             header=i==0)
-                                             #quoting=csv.QUOTE_NONNUMERIC)
-                        nrows += len(part_tab)
-                        
-                except KeyboardInterrupt as e:
-                    logging.error(e)
+            module_name = self.mem_data_info['module_name']
+            file_name = self.mem_data_info['file_name']
+            sample = None
+            if module_name != 'INIT':
+                # Rows at the positions of the sample of the uploaded file, 
+                # collected as the data is written (see _sample_tab)
+                upload_sample = self._load_sample(file_name)
+                if upload_sample is not None:
+                    sample = upload_sample.follower(self._sample_path(module_name, file_name))
+                    self.mem_data = (sample.follow(part_tab) for part_tab in self.mem_data)
+            
+            # If any data was transformed: write the transformed data
+            # if self.mem_data_info['data_was_transformed']:
+            try:
+                if 'resume' in self.mem_data_info:
+                    nrows = self._write_checkpointed(file_path)
+                else:
+                    storage = storage_for(file_path)
+                    nrows = storage.write(file_path + '.tmp', self.mem_data)
+                    move(file_path + '.tmp', file_path)
+            except KeyboardInterrupt as e:
+                logging.error(e)
 
             if nrows == 0:
                 raise Exception('No data was written, make sure you loaded data before'
                                + ' calling write_data')
+            
+            # Rows skipped when resuming are missing from the sample
+            if (sample is not None) \
+                    and not self.mem_data_info.get('resume', {}).get('skip_rows'):
+                sample.save()
+            elif (module_name != 'INIT') \
+                    and os.path.isfile(self._sample_path(module_name, file_name)):
+                os.remove(self._sample_path(module_name, file_name))
 
         # TODO: check if valid also when no changes are made...
         logging.info('Wrote to: {0}'.format(file_path))
+        
+        # Count of values flagged in __MODIFIED columns (by any module)
+        run_info_key = (self.mem_data_info['module_name'], self.mem_data_info['file_name'])
+        counts = modified_counts(file_path)
+        if (counts is not None) and (run_info_key in self.run_info_buffer):
+            self.run_info_buffer[run_info_key]['modified_count'] = counts
+        # Chunk size used and memory taken (to adjust the memory budget)
+        for run_info in self.run_info_buffer.values():
+            run_info['chunksize'] = self.mem_data_info.get('chunksize')
+            run_info['peak_rss'] = peak_rss()
         self._write_log_buffer(written=True)
+        self._write_memos()
         self._write_run_info_buffer()
 
         # Reset data_was_transformed
@@ -569,6 +834,89 @@ class AbstractDataProject(AbstractProject):
         return nrows
 
         
+    def _job_signature(self):
+        '''What the data in memory was computed from: checkpoints are only 
+        resumed by jobs with the same signature'''
+        return {key: self.mem_data_info[key] \
+                for key in ['source', 'nrows', 'columns', 'transforms']}
+
+    def _mod_counts(self):
+        '''Modification counts in the run_info buffer (saved with checkpoints)'''
+        return [[module_name, file_name, 
+                 {col: int(count) for col, count in run_info['mod_count'].items()}] \
+                for (module_name, file_name), run_info in self.run_info_buffer.items() \
+                if 'mod_count' in run_info]
+
+    def _write_checkpointed(self, file_path):
+        '''
+        Writes data in memory to file_path through a checkpoint (see 
+        checkpoints.py), resuming an interrupted run of the same job if 
+        possible, and returns the number of rows written.
+        
+        Outputs of modules written during the same pass (_write_through) 
+        are resumed from the same row.
+        '''
+        resume = self.mem_data_info['resume']
+        checkpoint = Checkpoint(file_path, self._job_signature())
+        checkpoints = resume['checkpoints'] + [checkpoint]
+        
+        if resume['started']:
+            # Data was read before writing started: rows can not be skipped
+            for c in checkpoints:
+                c.discard()
+        
+        # Resume all outputs from the same chunk (chunks written for one 
+        # output but not the others are written again)
+        skip_rows = min(c.rows for c in checkpoints)
+        skip_rows = min(c.truncate(skip_rows) for c in checkpoints)
+        if skip_rows:
+            logging.warning('Resuming writing of {0} at row {1}'.format(file_path, skip_rows))
+            for module_name, file_name, mod_count in checkpoint.info:
+                if (module_name, file_name) in self.run_info_buffer:
+                    self._add_mod(self.run_info_buffer[(module_name, file_name)]['mod_count'], 
+                                  mod_count)
+        resume['skip_rows'] = skip_rows
+        
+        storage = storage_for(file_path)
+        for _ in checkpoint.write_through(storage, self.mem_data, skip_rows, 
+                                          self._mod_counts):
+            pass
+        for c in resume['checkpoints']:
+            c.finalize(storage_for(c.file_path))
+            logging.info('Wrote to: {0}'.format(c.file_path))
+        resume['checkpoints'] = []
+        return checkpoint.finalize(storage)
+
+    def _write_through(self, module_name, file_name, tab_gen):
+        '''Generates the DataFrames of tab_gen, writing them to the data of a
+        file in a module as they go (to write the output of a module without
+        interrupting a pipeline of transforms)'''
+        dir_path = self.path_to(module_name)
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        file_path = self._data_path(module_name, file_name)
+        storage = storage_for(file_path)
+        
+        if 'resume' not in self.mem_data_info:
+            def _write_through(tab_gen):
+                writer = storage.writer(file_path)
+                try:
+                    for part_tab in tab_gen:
+                        writer.write(part_tab)
+                        yield part_tab
+                finally:
+                    writer.close()
+            return _write_through(tab_gen)
+
+        # Resumed along with the output of write_data, which finalizes it 
+        # (consumers such as zip may not exhaust the generator)
+        resume = self.mem_data_info['resume']
+        checkpoint = Checkpoint(file_path, self._job_signature())
+        resume['checkpoints'].append(checkpoint)
+        def _write_through_checkpoint(tab_gen):
+            yield from checkpoint.write_through(storage, tab_gen, resume['skip_rows'])
+        return _write_through_checkpoint(tab_gen)
+        
     def clear_memory(self):
         '''Removes the table loaded in memory'''
         self.mem_data = None
@@ -588,16 +936,38 @@ class AbstractDataProject(AbstractProject):
         else:
             self._check_mem_data()
             self.mem_data, tab_gen = tee(self.mem_data)
-            data = next(tab_gen) # Selecting the first chunk of data to perform inference
+            # Selecting the first rows of data to perform inference
+            parts = []
+            num_rows = 0
+            for part_tab in tab_gen:
+                parts.append(part_tab)
+                num_rows += len(part_tab)
+                if num_rows >= self.INFER_ROWS:
+                    break
+            data = pd.concat(parts).iloc[:self.INFER_ROWS]
+            del parts, tab_gen
             valid_columns = [col for col in data if '__MODIFIED' not in col]
             data = data[valid_columns]
             
         # Initiate log
         log = self._init_active_log(module_name, 'infer')
         
+        # Use the summaries of the entire file computed on upload (if the 
+        # module uses some and data was not transformed since)
+        kwargs = dict()
+        summaries_class = self.MODULES['infer'][module_name].get('summaries')
+        if (summaries_class is not None) and (data is not None) \
+                and (self.mem_data_info['module_name'] == 'INIT'):
+            file_name = self.mem_data_info['file_name']
+            if self._is_mini(file_name):
+                file_name = self._og_from_mini(file_name)
+            summaries = summaries_class.load(self.path_to('INIT', file_name + summaries_class.FILE_SUFFIX))
+            if (summaries is not None) and summaries.covers(data.columns):
+                kwargs['summaries'] = summaries
+        
         # We duplicate the generator to load a full version of the table and
         # while leaving self.mem_data unchanged
-        infered_params = self.MODULES['infer'][module_name]['func'](data, params)
+        infered_params = self.MODULES['infer'][module_name]['func'](data, params, **kwargs)
         del data
     
         # Write result of inference
@@ -645,8 +1015,21 @@ class AbstractDataProject(AbstractProject):
         modified_columns = [col for col in partial_data if '__MODIFIED' in col]
         old_modified = partial_data[modified_columns]
         
-        new_partial_data, modified = self.MODULES['transform'][module_name] \
-                                    ['func'](partial_data[valid_columns], params)
+        new_partial_data, modified, _ = _run_transform_func(
+                self.MODULES['transform'][module_name]['func'], params,
+                self.memos.get(module_name), partial_data[valid_columns])
+        return self._merge_transform_results(module_name, new_partial_data,
+                                             modified, old_modified)
+
+    def _merge_transform_results(self, module_name, new_partial_data, modified,
+                                 old_modified):
+        '''
+        Stores modifications made by a module on a chunk in the run_info 
+        buffer and adds the __MODIFIED columns to the transformed chunk.
+        '''
+        if module_name in self.memos:
+            self.run_info_buffer[(module_name, self.mem_data_info['file_name'])]['memo'] = \
+                self.memos[module_name].stats()
 
         # Store modificiations in run_info_buffer
         self.run_info_buffer[(module_name, self.mem_data_info['file_name'])]['mod_count'] = \
@@ -660,6 +1043,72 @@ class AbstractDataProject(AbstractProject):
             else:
                 new_partial_data[col] = modified[col]
         return new_partial_data
+
+    def _parallel_transform_workers(self, module_name):
+        '''Number of workers on which to run module_name (1 if the module 
+        must be run in the current process)'''
+        processes = self.TRANSFORM_PROCESSES
+        if self.MODULES['transform'][module_name].get('worker_type') != 'thread' \
+                and multiprocessing.current_process().daemon:
+            # Daemonic processes (such as those of a multiprocessing pool)
+            # are not allowed to have children
+            processes = 1
+        if self.mem_data_info.get('file_name', '').startswith(MINI_PREFIX):
+            # MINI files fit in a chunk
+            processes = 1
+        return processes
+
+    def run_transform_module_parallel(self, module_name, tab_gen, params, processes):
+        '''
+        Generator of the results of run_transform_module on each DataFrame 
+        of tab_gen, computed on a pool of workers. At most 
+        CHUNKS_IN_FLIGHT_PER_PROCESS chunks per worker are read ahead and 
+        results are generated in the order of tab_gen.
+        
+        Modules are run in worker processes (forked, so that they start with
+        the lexicons and memo of the current process) whose memo updates are
+        merged back into the memo of the project. Modules with a worker_type 
+        of 'thread' (I/O bound modules sharing a connection, such as 
+        es_linker) are run in threads of the current process instead and 
+        should not use a memo.
+        '''
+        func = self.MODULES['transform'][module_name]['func']
+        memo = self.memos.get(module_name)
+        if self.MODULES['transform'][module_name].get('worker_type') == 'thread':
+            pool = ThreadPool(processes)
+            run = partial(_run_transform_func, func, params, None)
+        else:
+            pool = multiprocessing.get_context('fork').Pool(processes,
+                            initializer=_init_transform_worker,
+                            initargs=(func, params, memo))
+            run = _run_transform_in_worker
+        max_in_flight = processes * self.CHUNKS_IN_FLIGHT_PER_PROCESS
+
+        in_flight = deque()
+        def _next_result():
+            old_modified, result = in_flight.popleft()
+            new_partial_data, modified, memo_updates = result.get()
+            if memo_updates is not None:
+                memo.merge(memo_updates)
+            return self._merge_transform_results(module_name, new_partial_data,
+                                                 modified, old_modified)
+
+        try:
+            for partial_data in tab_gen:
+                logging.info('At module: {0}'.format(module_name))
+                valid_columns = [col for col in partial_data if '__MODIFIED' not in col]
+                modified_columns = [col for col in partial_data if '__MODIFIED' in col]
+                in_flight.append((partial_data[modified_columns],
+                                  pool.apply_async(run, (partial_data[valid_columns],))))
+                if len(in_flight) >= max_in_flight:
+                    yield _next_result()
+            while in_flight:
+                yield _next_result()
+            pool.close()
+        finally:
+            # Stops workers if the generator is not run to the end
+            pool.terminate()
+            pool.join()
     
     def transform(self, module_name, params):
         '''
@@ -680,13 +1129,25 @@ class AbstractDataProject(AbstractProject):
         run_info['mod_count'] = defaultdict(int)
         self.run_info_buffer[(module_name, run_info['file_name'])] = run_info
 
+        # Load the memo persisted by the module in previous runs (if it keeps one)
+        memo_class = self.MODULES['transform'][module_name].get('memo')
+        if memo_class is not None:
+            self.memos[module_name] = memo_class.load(self.path_to(module_name, memo_class.FILE_NAME))
+
         # TODO: catch module errors and add to log
         # Run module on pandas DataFrame 
         logging.info('Running transform: {0}'.format(module_name))
-        self.mem_data = (self.run_transform_module(module_name, data, params) \
-                                                 for data in self.mem_data)
+        processes = self._parallel_transform_workers(module_name)
+        if processes > 1:
+            self.mem_data = self.run_transform_module_parallel(module_name, 
+                                                self.mem_data, params, processes)
+        else:
+            self.mem_data = (self.run_transform_module(module_name, data, params) \
+                                                     for data in self.mem_data)
         self.mem_data_info['module_name'] = module_name
         self.mem_data_info['data_was_transformed'] = True
+        if 'transforms' in self.mem_data_info:
+            self.mem_data_info['transforms'].append([module_name, params])
 
         # Complete log
         log = self._end_active_log(log, error=False)
@@ -694,6 +1155,7 @@ class AbstractDataProject(AbstractProject):
         return log, run_info
     
 class ESAbstractDataProject(AbstractDataProject):
+    # Number of rows inserted at once when ADAPTIVE_CHUNKSIZE is False
     es_insert_chunksize = 40000
     es = es
     ic = ic
@@ -701,6 +1163,11 @@ class ESAbstractDataProject(AbstractDataProject):
     def __init__(self, *argv, **kwargs):
         super().__init__(*argv, **kwargs)
         self.index_name = self.project_id
+
+    def _chunksize_for(self, tab, use='transform'):
+        if (use == 'es_insert') and (not self.ADAPTIVE_CHUNKSIZE):
+            return self.es_insert_chunksize
+        return super()._chunksize_for(tab, use)
     
     def fetch_by_id(self, size=5, from_=0, order='asc'):
         '''For an indexed table'''
@@ -823,11 +1290,16 @@ class ESAbstractDataProject(AbstractDataProject):
 
     def ES_to_csv(self, module_name, file_name, columns=None, thresh=None):
         num_rows = ic.stats(self.index_name)['_all']['total']['docs']['count']
-        self.mem_data = self.from_ES(columns, chunksize=self.CHUNKSIZE, thresh=thresh)
+        chunksize = self.CHUNKSIZE
+        if self.ADAPTIVE_CHUNKSIZE:
+            tab = next(iter(self.from_ES(columns, chunksize=PLANNING_ROWS)), pd.DataFrame())
+            chunksize = self._chunksize_for(tab, 'es_export')
+        self.mem_data = self.from_ES(columns, chunksize=chunksize, thresh=thresh)
         self.mem_data_info = {'file_name': file_name,
                               'module_name': module_name,
                               'nrows': num_rows, 
                               'columns': columns,
+                              'chunksize': chunksize,
                               'data_was_transformed': False}
         self.write_data()
 
@@ -858,19 +1330,37 @@ class ESAbstractDataProject(AbstractDataProject):
         http.client._MAXHEADERS = 1000
         
         testing = True
+        
+        # Rows indexed by an interrupted run for the same file and columns 
+        # are not indexed again
+        stat = os.stat(ref_path)
+        checkpoint = Checkpoint(self.path_to('', 'es_index'), 
+                                {'source': [ref_path, stat.st_size, stat.st_mtime],
+                                 'columns_to_index': columns_to_index})
+        resume = (checkpoint.rows > 0) and (not force) and self.has_index()
+        if not resume:
+            checkpoint.discard()
+        skip_rows = checkpoint.rows
 
+        # Read through the storage backend (for __MODIFIED columns stored
+        # as bitmaps). Chunks keep the row numbers of the file as index.
         dtype = {col: self._choose_dtype(col) for col in columns_to_index.keys()}
-        ref_gen = pd.read_csv(ref_path, 
-                          usecols=columns_to_index.keys(),
-                          dtype=dtype, chunksize=self.es_insert_chunksize)
-        
-        if self.has_index() and (force or (not self.valid_index())):
+        chunksize = self._file_chunksize(ref_path, list(columns_to_index.keys()), 'es_insert')
+        logging.info('Indexing by chunks of {0} rows'.format(chunksize))
+        ref_gen = storage_for(ref_path).read(ref_path, dtype, 
+                                             columns=list(columns_to_index.keys()),
+                                             chunksize=chunksize)
+        ref_gen = _skip_rows(ref_gen, {'skip_rows': skip_rows, 'started': False})
+        
+        if resume:
+            logging.warning('Resuming indexing at row {0}'.format(skip_rows))
+        elif self.has_index() and (force or (not self.valid_index())):
             print('[create_index] Deleting index')
             self.ic.delete(self.index_name)
         
         columns_to_index_str = {key: val for key, val in columns_to_index.items() \
                                 if not isinstance(val, str)}
-        if self.has_index() and (not no_delete):
+        if self.has_index() and (not no_delete) and (not resume):
             mapping = ic.get_mapping(self.project_id)[self.project_id]['mappings']['structure']['properties']
             for col, analyzers in columns_to_index_str.items():
                 if any(mapping.get(col, {'fields': None})['fields'].get(a) is None for a in analyzers):
@@ -881,18 +1371,20 @@ class ESAbstractDataProject(AbstractDataProject):
                     self.ic.delete(self.index_name)
                     break
         
-        if not self.has_index():
+        if resume or (not self.has_index()):
             logging.info('Creating new index')
             log = self._init_active_log('INIT', 'transform') # TODO: is this right ?
-                    
-            logging.warning('Creating index')
-            es_insert.create_index(self.es, self.index_name, columns_to_index,
-                                   default_analyzer=DEFAULT_ANALYZER, 
-                                   analyzer_definitions=ANALYZERS, force=force)
             
+            if not resume:
+                logging.warning('Creating index')
+                es_insert.create_index(self.es, self.index_name, columns_to_index,
+                                       default_analyzer=DEFAULT_ANALYZER, 
+                                       analyzer_definitions=ANALYZERS, force=force)
             
             logging.warning('Inserting in index')
-            es_insert.index(es, ref_gen, self.index_name, testing, action='index')
+            es_insert.index(es, checkpoint.track(ref_gen), self.index_name, testing, action='index')
+            checkpoint.discard()
+            logging.info('Peak memory while indexing: {0}'.format(peak_rss()))
         
             log = self._end_active_log(log, error=False)
             logging.warning('Finished indexing')
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import atexit, collections, logging, multiprocessing, os, pickle
+
+from CONFIG import DYNAMIC_RESOURCE_PATH
+from storage import load_versioned_pickle, save_versioned_pickle
+
+# Address parsing service wrapping libpostal's parse_address, for both the address type matcher and gridding.
+
+# Input strings are deduplicated and looked up in a bounded LRU cache of parse results keyed by normalized string,
+# which is persisted on disk across runs. Cache misses are parsed in batches by a pool of worker processes, each of
+# which loads the libpostal model once.
+
+# New parse results are appended to a log next to the cache file (by any number of processes, each append being a
+# single write), which gets merged into the cache file once it is large enough. Processes thus only write what they
+# parsed, and do not overwrite each other's results.
+ADDRESS_CACHE_PATH = os.path.join(DYNAMIC_RESOURCE_PATH, 'address_cache.pickle')
+ADDRESS_LOG_SUFFIX = '.log'
+# Size of the log (in bytes) above which it is merged into the cache file
+ADDRESS_LOG_MAX_SIZE = 32 * 2 ** 20
+# Max number of parse results kept in the cache (least recently used ones get evicted first)
+ADDRESS_CACHE_SIZE = 500000
+# If set to False, the cache will only live as long as the process (and not be stored)
+USE_ADDRESS_CACHE = True
+# Version of the layout of the cache file and of log records (see save_versioned_pickle in storage.py)
+ADDRESS_CACHE_VERSION = 1
+# Number of worker processes parsing cache misses (1 to parse them in the calling process)
+ADDRESS_PARSING_PROCESSES = min(4, multiprocessing.cpu_count())
+# Number of strings sent to a worker process at once
+ADDRESS_BATCH_SIZE = 500
+# Min number of cache misses for them to be parsed by worker processes (spawning the pool and loading the model in
+# each worker takes several seconds)
+MIN_POOL_MISSES = 2000
+
+# Parse results by normalized string, from least to most recently used
+CACHE = collections.OrderedDict()
+CACHE_STATS = {'loaded': False, 'hits': 0, 'misses': 0}
+# Normalized strings parsed by this process whose results were not appended to the log yet
+UNSAVED = []
+POOL = None
+
+def address_key(s):
+	''' Normalized form of an address string (libpostal lowercases its input and splits it on whitespace anyway). '''
+	return ' '.join(s.lower().split())
+
+def libpostal_parser():
+	''' Returns libpostal's parse_address function (importing the libpostal module loads its model). '''
+	from postal.parser import parse_address
+	return parse_address
+
+def parse_batch(keys):
+	parse_address = libpostal_parser()
+	return [parse_address(k) for k in keys]
+
+def worker_pool():
+	global POOL
+	if POOL is None:
+		POOL = multiprocessing.Pool(ADDRESS_PARSING_PROCESSES, initializer = libpostal_parser)
+		atexit.register(POOL.terminate)
+	return POOL
+
+def parse_keys(keys):
+	''' Parses a list of normalized strings, spreading them over worker processes if there are enough of them. '''
+	if ADDRESS_PARSING_PROCESSES < 2 or len(keys) < MIN_POOL_MISSES: return parse_batch(keys)
+	if multiprocessing.current_process().daemon:
+		logging.warning('Cannot spawn address parsing processes from a daemonic process: parsing addresses in-process')
+		return parse_batch(keys)
+	batches = [keys[i:i + ADDRESS_BATCH_SIZE] for i in range(0, len(keys), ADDRESS_BATCH_SIZE)]
+	return [parsed for parsedBatch in worker_pool().map(parse_batch, batches) for parsed in parsedBatch]
+
+def log_path():
+	return ADDRESS_CACHE_PATH + ADDRESS_LOG_SUFFIX
+
+def read_log(filePath):
+	''' Parse results appended to a log, in order (a record cut short, by a process killed while appending it, ends
+		the log). '''
+	entries = []
+	try:
+		with open(filePath, 'rb') as f:
+			while True:
+				try:
+					(version, batch) = pickle.load(f)
+				except EOFError:
+					break
+				except (pickle.UnpicklingError, AttributeError, ValueError) as e:
+					logging.warning('Could not read address cache log %s past %d results: %s', filePath, len(entries), e)
+					break
+				if version == ADDRESS_CACHE_VERSION: entries.extend(batch)
+	except OSError as e:
+		if not isinstance(e, FileNotFoundError): logging.warning('Could not read address cache log %s: %s', filePath, e)
+	return entries
+
+def read_cache(logPath):
+	''' Parse results of the cache file and of a log, from least to most recently added. '''
+	entries = collections.OrderedDict()
+	cached = load_versioned_pickle(ADDRESS_CACHE_PATH, ADDRESS_CACHE_VERSION)
+	if cached is not None: entries.update(cached)
+	for (k, parsed) in read_log(logPath):
+		entries[k] = parsed
+		entries.move_to_end(k)
+	return entries
+
+def load_cache():
+	CACHE_STATS['loaded'] = True
+	if not USE_ADDRESS_CACHE: return
+	atexit.register(save_cache)
+	CACHE.update(read_cache(log_path()))
+	while len(CACHE) > ADDRESS_CACHE_SIZE: CACHE.popitem(last = False)
+	logging.info('Loaded %d address parse results from %s', len(CACHE), ADDRESS_CACHE_PATH)
+
+def save_cache():
+	''' Appends the parse results of this process not saved yet to the log, then merges the log into the cache file if
+		it got too large. '''
+	if not USE_ADDRESS_CACHE: return
+	batch = [(k, CACHE[k]) for k in UNSAVED if k in CACHE]
+	del UNSAVED[:]
+	if len(batch) < 1: return
+	try:
+		os.makedirs(os.path.dirname(ADDRESS_CACHE_PATH), exist_ok = True)
+		fd = os.open(log_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+		try:
+			os.write(fd, pickle.dumps((ADDRESS_CACHE_VERSION, batch), protocol = pickle.HIGHEST_PROTOCOL))
+			logSize = os.fstat(fd).st_size
+		finally:
+			os.close(fd)
+	except OSError as e:
+		logging.warning('Could not append to address cache log %s: %s', log_path(), e)
+		return
+	if logSize > ADDRESS_LOG_MAX_SIZE: merge_log()
+
+def merge_log():
+	''' Merges the log into the cache file (keeping the ADDRESS_CACHE_SIZE most recent results). The log is moved away
+		first, so that processes appending meanwhile start a new one. '''
+	mergedPath = '{}.{}'.format(log_path(), os.getpid())
+	try:
+		os.replace(log_path(), mergedPath)
+	except OSError:
+		return # Being merged by another process
+	entries = read_cache(mergedPath)
+	while len(entries) > ADDRESS_CACHE_SIZE: entries.popitem(last = False)
+	try:
+		save_versioned_pickle(ADDRESS_CACHE_PATH, ADDRESS_CACHE_VERSION, entries)
+	except (OSError, pickle.PicklingError) as e:
+		logging.warning('Could not write address cache %s: %s', ADDRESS_CACHE_PATH, e)
+	os.remove(mergedPath)
+	logging.info('Merged address cache log into %s (%d parse results)', ADDRESS_CACHE_PATH, len(entries))
+
+def parse_addresses(values, persist = True):
+	''' Parses address strings with libpostal, returning a dict mapping each distinct string to its parse result (a list
+		of (value, label) pairs, as returned by postal.parser.parse_address).
+
+		If persist is True, new parse results get appended to the disk cache right away (otherwise they will be at the
+		next call with persist set or when the process exits). '''
+	if not CACHE_STATS['loaded']: load_cache()
+	keys = dict((v, address_key(v)) for v in set(values))
+	missing = list(set(k for k in keys.values() if k not in CACHE))
+	CACHE_STATS['hits'] += len(keys) - len(missing)
+	CACHE_STATS['misses'] += len(missing)
+	UNSAVED.extend(missing)
+	if len(missing) > 0:
+		logging.info('Parsing %d addresses with libpostal (%d found in cache)', len(missing), len(keys) - len(missing))
+		CACHE.update(zip(missing, parse_keys(missing)))
+	res = dict()
+	for (v, k) in keys.items():
+		CACHE.move_to_end(k)
+		res[v] = CACHE[k]
+	while len(CACHE) > ADDRESS_CACHE_SIZE: CACHE.popitem(last = False)
+	if persist: save_cache()
+	return res
+
+def parse_address(value):
+	''' Parses a single address string (see parse_addresses). '''
+	return parse_addresses([value], persist = False)[value]
+
+def clear_cache():
+	CACHE.clear()
+	del UNSAVED[:]
+	for filePath in (ADDRESS_CACHE_PATH, log_path()):
+		if os.path.exists(filePath): os.remove(filePath)
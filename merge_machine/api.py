@@ -531,9 +531,12 @@ def download(proj):
             - module_name: Module from which to fetch the file
             - file_name
         module_params:
-            - file_type: ['csv' or 'xls']
+            - file_type: ['csv', 'xls' or 'xlsx'] (Excel files are xlsx files
+                        with the original columns and the columns added by
+                        the project in separate sheets)
             - zip: False (returns a zipped version)
             - thresh: 1 (threshold on __CONFIDENCE for results of linking)
+            - modified_columns: False (include the __MODIFIED columns)
     '''
 
     data_params, module_params = _parse_request()
@@ -548,9 +551,6 @@ def download(proj):
     print('data_params', data_params)
     print('module_params', module_params)
     
-    if file_type != 'csv':
-        raise NotImplementedError('file_type can only be csv')
-        
     file_role = data_params.get('file_role')
     module_name = data_params.get('module_name')
     file_name = data_params.get('file_name')
@@ -590,12 +590,16 @@ def download(proj):
                message='No changes were made since upload. Download is not \
                        permitted. Please do not use this service for storage')
         
+    modified_columns = module_params.get('modified_columns', False)
     if file_type == 'csv':
         new_file_name = file_name.split('.csv')[0] + '_MMM.csv'
+        file_path = proj.path_to_csv(module_name, file_name, 
+                                     expand_modified=modified_columns)
     else:
-        new_file_name = proj.to_xls(module_name, file_name)
-    
-    file_path = proj.path_to(module_name, file_name)
+        # xls files are served as xlsx (xls sheets are limited to 65536 rows)
+        new_file_name = file_name.split('.csv')[0] + '_MMM.xlsx'
+        file_path = proj.path_to(module_name, 
+                                 proj.to_xls(module_name, file_name, modified_columns))
     
     # Zip this file and send the zipped file
     if zip_:
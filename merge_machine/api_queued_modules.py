@@ -206,10 +206,13 @@ def _concat_with_init(project_id, data_params, *argv):
     return run_info
 
 @timeit
-def _run_all_transforms(project_id, data_params, *argv):
+def _run_all_transforms(project_id, data_params, module_params=None):
     '''
     Run all transformations that were already (based on presence of 
     run_info.json files) with parameters in run_info.json files.
+    
+    Transformations are run in a single pass over the file (see 
+    Normalizer.run_all_transforms), and only the final output is written.
 
     ARGUMENTS (GET):
         project_id: ID for "normalize" project
@@ -219,13 +222,20 @@ def _run_all_transforms(project_id, data_params, *argv):
                 {
                     "file_name": file to use for transform (module_name is 'INIT')
                 }
+        - module_params: (optional)
+                {
+                    "write_intermediate": list of modules whose output should 
+                                        also be written (ex: ["replace_mvs"])
+                }
     '''
     proj = ESNormalizer(project_id=project_id)
 
     file_name = data_params['file_name']
+    if module_params is None:
+        module_params = {}
 
     proj.load_data('INIT', file_name)
-    all_run_infos = proj.run_all_transforms()
+    all_run_infos = proj.run_all_transforms(module_params.get('write_intermediate', []))
 
     # Write transformations and logs
     proj.write_data()
@@ -300,7 +310,7 @@ def _create_es_index(project_id, data_params, module_params):
                             for col in proj._get_header(module_name, file_name)}
         
         
-    file_path = proj.path_to(module_name, file_name)
+    file_path = proj.path_to_csv(module_name, file_name)
     proj.create_index(file_path, columns_to_index, force, proj.metadata.get('public', False))
     return
 
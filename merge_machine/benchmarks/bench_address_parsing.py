@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of address parsing throughput on a column of addresses (by default 100k rows), with libpostal called on
+every value and with the address parsing service (address_parsing.py) on a cold cache and on a warm cache.
+
+Requires libpostal and its Python bindings (postal). The service's cache is written to a temporary file.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+os.chdir(parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import logging
+logging.disable(logging.CRITICAL)
+import address_parsing
+
+STREETS = ['rue de la Paix', 'avenue des Champs-Elysées', 'boulevard Saint-Michel', 'place de la République',
+           'rue du Faubourg Saint-Antoine', 'quai de la Tournelle', 'allée des Tilleuls', 'chemin des Vignes']
+CITIES = [('75001', 'Paris'), ('69002', 'Lyon'), ('13001', 'Marseille'), ('31000', 'Toulouse'), ('33000', 'Bordeaux'),
+          ('59000', 'Lille'), ('67000', 'Strasbourg'), ('44000', 'Nantes')]
+
+def column(num_rows, distinct_ratio):
+    random.seed(0)
+    addresses = ['{} {}, {} {}'.format(random.randint(1, 200), random.choice(STREETS), *random.choice(CITIES))
+                 for _ in range(max(1, int(num_rows * distinct_ratio)))]
+    return [random.choice(addresses) for _ in range(num_rows)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark address parsing with and without the parsing service')
+    parser.add_argument('-n', '--num_rows', type=int, default=100000, help='number of rows in the column')
+    parser.add_argument('-d', '--distinct_ratio', type=float, default=0.5, help='ratio of distinct addresses')
+    parser.add_argument('-p', '--processes', type=int, default=address_parsing.ADDRESS_PARSING_PROCESSES,
+                        help='number of address parsing processes')
+    args = parser.parse_args()
+    address_parsing.ADDRESS_PARSING_PROCESSES = args.processes
+    values = column(args.num_rows, args.distinct_ratio)
+    parse_address = address_parsing.libpostal_parser()
+    parse_address(values[0])
+    start = time.perf_counter()
+    for v in values:
+        parse_address(v)
+    timings = [('libpostal on every value', time.perf_counter() - start)]
+    with tempfile.TemporaryDirectory() as cacheDir:
+        address_parsing.ADDRESS_CACHE_PATH = os.path.join(cacheDir, 'address_cache.pickle')
+        for label in ('service, cold cache', 'service, warm cache'):
+            start = time.perf_counter()
+            address_parsing.parse_addresses(values)
+            timings.append((label, time.perf_counter() - start))
+    print('{:<28}{:>16}'.format('', 'addresses/s'))
+    for (label, elapsed) in timings:
+        print('{:<28}{:>16.0f}'.format(label, len(values) / elapsed))
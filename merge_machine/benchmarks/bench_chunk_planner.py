@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of chunk sizes chosen from a memory budget (chunk_planner.py) vs. the former fixed chunks of 3000 rows: a
+narrow and a wide CSV file are read chunk by chunk with a copy of each chunk (as a transform would), measuring time and
+the largest memory taken by a chunk (as a DataFrame).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import pandas as pd
+from chunk_planner import PLANNING_ROWS, plan_chunksize, row_bytes
+
+FIXED_CHUNKSIZE = 3000
+
+def make_table(num_rows, num_cols, value_len):
+    random.seed(0)
+    return pd.DataFrame({'col_{}'.format(i): [str(random.randint(0, 10 ** value_len)).zfill(value_len)
+                                              for _ in range(num_rows)] for i in range(num_cols)})
+
+def run(file_path, chunksize):
+    peak = 0
+    start = time.perf_counter()
+    for part_tab in pd.read_csv(file_path, dtype=str, chunksize=chunksize):
+        part_tab = part_tab.copy()
+        peak = max(peak, part_tab.memory_usage(index=False, deep=True).sum())
+    elapsed = time.perf_counter() - start
+    return elapsed, peak / 2 ** 20
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark chunk sizes chosen from a memory budget')
+    parser.add_argument('-n', '--num_rows', type=int, default=100000, help='number of rows of the files')
+    parser.add_argument('-b', '--budget', type=int, default=256, help='memory budget (MB)')
+    args = parser.parse_args()
+    files = {'narrow': make_table(args.num_rows, 2, 8), 'wide': make_table(args.num_rows // 10, 300, 20)}
+    print('{:<10}{:>12}{:>12}{:>12}{:>14}'.format('file', 'chunking', 'chunksize', 'time (s)', 'chunk (MB)'))
+    with tempfile.TemporaryDirectory() as dir_path:
+        for name, tab in files.items():
+            file_path = os.path.join(dir_path, name + '.csv')
+            tab.to_csv(file_path, index=False)
+            head = pd.read_csv(file_path, dtype=str, nrows=PLANNING_ROWS)
+            planned = plan_chunksize(row_bytes(head), 'transform', budget=args.budget * 2 ** 20)
+            for chunking, chunksize in [('fixed', FIXED_CHUNKSIZE), ('planned', planned)]:
+                elapsed, peak = run(file_path, chunksize)
+                print('{:<10}{:>12}{:>12}{:>12.2f}{:>14.1f}'.format(name, chunking, chunksize, elapsed, peak))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the reading of uploaded xlsx files by chunks: the former pandas.read_excel of the entire sheet, sliced
+into chunks, vs. the streaming reader (excel_reader.ExcelReader). Each method runs in its own process, for which the
+peak resident memory is reported.
+
+The script also checks that both methods return the same table.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pandas as pd
+from excel_reader import ExcelReader
+
+CHUNKSIZE = 3000
+
+def make_file(file_path, num_rows, num_cols):
+    import openpyxl
+    random.seed(0)
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet()
+    sheet.append(['col_{}'.format(i) for i in range(num_cols)])
+    for i in range(num_rows):
+        sheet.append([random.choice(['Paris', 'Lyon', 'Marseille']) if j % 2 else random.randint(0, 10 ** 6)
+                      for j in range(num_cols)])
+    book.save(file_path)
+
+def read_entire_sheet(file_path):
+    with open(file_path, 'rb') as file:
+        tab = pd.read_excel(file, dtype=str)
+    for i in range(0, len(tab), CHUNKSIZE):
+        yield tab.iloc[i:i + CHUNKSIZE]
+
+def read_streaming(file_path):
+    with open(file_path, 'rb') as file:
+        reader = ExcelReader(file)
+        while True:
+            try:
+                yield reader.get_chunk(CHUNKSIZE)
+            except StopIteration:
+                break
+
+def run(method, file_path, queue):
+    start = time.perf_counter()
+    num_rows = 0
+    checksum = 0
+    for part_tab in method(file_path):
+        num_rows += len(part_tab)
+        checksum += int(pd.util.hash_pandas_object(part_tab, index=False).sum() % 2 ** 32)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, num_rows, checksum))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark streaming reads of xlsx files')
+    parser.add_argument('-n', '--num_rows', type=int, default=100000, help='number of rows of the sheet')
+    parser.add_argument('-c', '--num_cols', type=int, default=10, help='number of columns of the sheet')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as dir_path:
+        file_path = os.path.join(dir_path, 'bench.xlsx')
+        make_file(file_path, args.num_rows, args.num_cols)
+        print('{} rows x {} columns ({:.1f} MB)'.format(args.num_rows, args.num_cols, os.path.getsize(file_path) / 2 ** 20))
+        print('{:<20}{:>10}{:>16}{:>10}'.format('method', 'time (s)', 'peak RSS (MB)', 'rows'))
+        results = dict()
+        for name, method in [('read_excel', read_entire_sheet), ('ExcelReader', read_streaming)]:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run, args=(method, file_path, queue))
+            process.start()
+            results[name] = queue.get()
+            process.join()
+            print('{:<20}{:>10.2f}{:>16.0f}{:>10}'.format(name, *results[name][:3]))
+        print('same:', results['read_excel'][2:] == results['ExcelReader'][2:])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the writing of xlsx files for download: the former pandas.read_csv of the entire file written with
+DataFrame.to_excel, vs. the streaming writer (excel_writer.write_xlsx) fed by chunks of the file. Each method runs in
+its own process, for which the peak resident memory is reported.
+
+The table mimics the result of a linking: columns of the source, columns of the referential (with "__REF") and the
+__CONFIDENCE of matches. The former method is skipped with --streaming_only (it takes several minutes and GBs of
+memory on a million rows).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pandas as pd
+from excel_writer import write_xlsx
+
+CHUNKSIZE = 10000
+
+def make_chunks(num_rows):
+    random.seed(0)
+    cities = ['Paris', 'Lyon', 'Marseille', 'Toulouse', None]
+    for start in range(0, num_rows, CHUNKSIZE):
+        rows = range(start, min(start + CHUNKSIZE, num_rows))
+        yield pd.DataFrame({
+            'siret': ['{:014d}'.format(random.randint(0, 10 ** 14)) for _ in rows],
+            'nom': ['Entreprise {}'.format(i) for i in rows],
+            'ville': [random.choice(cities) for _ in rows],
+            'nom__REF': ['ENTREPRISE {}'.format(i) for i in rows],
+            'ville__REF': [random.choice(cities) for _ in rows],
+            '__ID_REF': [str(random.randint(0, 10 ** 6)) for _ in rows],
+            '__CONFIDENCE': [round(random.random() * 100, 2) for _ in rows]})
+
+def sheet_columns(columns):
+    return [('original_file', [x for x in columns if '__' not in x]),
+            ('normalization', [x for x in columns if '__' in x])]
+
+def write_former(file_path, new_file_path):
+    tab = pd.read_csv(file_path, dtype={'__CONFIDENCE': float}, keep_default_na=False, na_values=[''])
+    with pd.ExcelWriter(new_file_path, engine='openpyxl') as writer:
+        for sheet_name, columns in sheet_columns(tab.columns):
+            tab[columns].to_excel(writer, sheet_name=sheet_name, index=False)
+    return len(tab)
+
+def write_streaming(file_path, new_file_path):
+    tab_gen = pd.read_csv(file_path, dtype={'__CONFIDENCE': float}, keep_default_na=False, na_values=[''],
+                          chunksize=CHUNKSIZE)
+    columns = pd.read_csv(file_path, nrows=0).columns
+    return write_xlsx(new_file_path, tab_gen, sheet_columns(columns))
+
+def run(method, file_path, new_file_path, queue):
+    start = time.perf_counter()
+    num_rows = method(file_path, new_file_path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, num_rows,
+               os.path.getsize(new_file_path) / 2 ** 20))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark streaming writes of xlsx files')
+    parser.add_argument('-n', '--num_rows', type=int, default=1000000, help='number of rows of the linked result')
+    parser.add_argument('-s', '--streaming_only', action='store_true', help='skip the former method')
+    args = parser.parse_args()
+    methods = [('to_excel', write_former), ('write_xlsx', write_streaming)]
+    if args.streaming_only:
+        methods = methods[1:]
+    with tempfile.TemporaryDirectory() as dir_path:
+        file_path = os.path.join(dir_path, 'bench.csv')
+        for i, part_tab in enumerate(make_chunks(args.num_rows)):
+            part_tab.to_csv(file_path, mode='a', header=not i, index=False)
+        print('{} rows ({:.1f} MB as csv)'.format(args.num_rows, os.path.getsize(file_path) / 2 ** 20))
+        print('{:<20}{:>10}{:>16}{:>10}{:>12}'.format('method', 'time (s)', 'peak RSS (MB)', 'rows', 'size (MB)'))
+        for name, method in methods:
+            new_file_path = os.path.join(dir_path, '{}.xlsx'.format(name))
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run, args=(method, file_path, new_file_path, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print('{:<20}{:>10.2f}{:>16.0f}{:>10}{:>12.1f}'.format(name, *result))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of peak memory and time for type inference and in-place normalization on a single large column (by default
+1M rows of mostly distinct email addresses), as dominated by the storage of type inferences.
+
+The column is matched by an email matcher (registering a match on every value) and a URL matcher (bailing out early),
+then scored (Field.scored_types and Field.likeliest_types) and normalized in place. Peak memory is measured with
+tracemalloc, in a new Python process for each grouping mode.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+
+def child(num_rows, distinct):
+    sys.path.insert(0, parentdir)
+    os.chdir(parentdir)
+    # CONFIG resolves the resource directory relative to the running script
+    sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+    import logging
+    logging.disable(logging.CRITICAL)
+    import pandas as pd
+    import preprocess_fields_v3 as pf
+    random.seed(0)
+    users = ['{}.{}{}'.format(random.choice('abcdefgh'), random.choice('ijklmnop'), i) for i in range(num_rows)]
+    df = pd.DataFrame({'email': ['{}@{}.fr'.format(u, random.choice(['univ-paris', 'cnrs', 'inserm'])) for u in users]})
+    matchers = [pf.RegexMatcher(pf.F_EMAIL, pf.PAT_EMAIL), pf.RegexMatcher(pf.F_URL, pf.PAT_URL)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    fields = pf.parse_fields_from_Panda(df, distinct=distinct)
+    f = list(fields.fields.values())[0]
+    for vm in matchers:
+        vm.match_all_field_values(f)
+        vm.check_diversity(f)
+    matched = time.perf_counter()
+    lts = f.likeliest_types()
+    scored = time.perf_counter()
+    for (_, values) in fields.normalize_values_in_place({'email': pf.F_EMAIL}):
+        pass
+    normalized = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'types': lts, 'peak': peak, 'match': matched - start, 'score': scored - matched, 'normalize': normalized - scored}
+
+def run_child(num_rows, distinct):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(num_rows), str(int(distinct))],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark type inference memory on a single large column')
+    parser.add_argument('-n', '--num_rows', type=int, default=1000000, help='number of rows in the column')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(int(args.child[0]), bool(int(args.child[1])))))
+        sys.exit()
+    print('{:<20}{:>16}{:>12}{:>12}{:>16}'.format('cells', 'peak mem (MB)', 'match (s)', 'score (s)', 'normalize (s)'))
+    for distinct in (True, False):
+        res = run_child(args.num_rows, distinct)
+        print('{:<20}{:>16.0f}{:>12.2f}{:>12.2f}{:>16.2f}'.format('per distinct value' if distinct else 'per row',
+              res['peak'] / 1e6, res['match'], res['score'], res['normalize']))
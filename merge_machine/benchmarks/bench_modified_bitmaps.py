@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the storage of __MODIFIED columns (modified_bitmaps.py): as boolean columns of data files vs. as run-length
+encoded bitmaps next to data files, for both storage backends. Measures write and read throughput, disk usage, and the
+time to count modifications (storage.modified_counts, or reading and summing the columns of CSV files).
+
+The table mimics the output of a normalization: string columns, with a __MODIFIED column for each of them in which a
+small share of values (5% by default) is True.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pandas as pd
+import storage
+from modified_bitmaps import modified_path
+
+CHUNKSIZE = 3000
+
+def make_table(num_rows, num_cols, share):
+    random.seed(0)
+    data = dict()
+    for i in range(num_cols):
+        data['col_{}'.format(i)] = ['value {}'.format(random.randint(0, 1000)) for _ in range(num_rows)]
+        data['col_{}__MODIFIED'.format(i)] = [random.random() < share for _ in range(num_rows)]
+    return pd.DataFrame(data)
+
+def chunks(tab):
+    for i in range(0, len(tab), CHUNKSIZE):
+        yield tab.iloc[i:i + CHUNKSIZE]
+
+def dtype(columns):
+    return {col: bool if '__MODIFIED' in col else str for col in columns}
+
+def size(file_path):
+    paths = [file_path, modified_path(file_path)]
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path)) / 2 ** 20
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the storage of __MODIFIED columns')
+    parser.add_argument('-n', '--num_rows', type=int, default=300000, help='number of rows in the table')
+    parser.add_argument('-c', '--num_cols', type=int, default=10, help='number of string columns in the table')
+    parser.add_argument('-s', '--share', type=float, default=0.05, help='share of modified values')
+    args = parser.parse_args()
+    tab = make_table(args.num_rows, args.num_cols, args.share)
+    modified_columns = [col for col in tab.columns if '__MODIFIED' in col]
+    print('{} rows x {} columns, {:.0%} of values modified'.format(*tab.shape, args.share))
+    print('{:<10}{:<12}{:>14}{:>14}{:>12}{:>12}{:>8}'.format('backend', '__MODIFIED', 'write (rows/s)', 'read (rows/s)',
+                                                            'size (MB)', 'count (s)', 'same'))
+    with tempfile.TemporaryDirectory() as dir_path:
+        for name, backend in storage.STORAGE_BACKENDS.items():
+            for modified_bitmaps in [False, True]:
+                store = backend()
+                file_path = os.path.join(dir_path, '{}_{}{}'.format(name, modified_bitmaps, store.EXTENSION))
+                start = time.perf_counter()
+                store.write(file_path, chunks(tab), modified_bitmaps=modified_bitmaps)
+                t_write = time.perf_counter() - start
+                start = time.perf_counter()
+                res = pd.concat(list(store.read(file_path, dtype(tab.columns), chunksize=CHUNKSIZE)))
+                t_read = time.perf_counter() - start
+                start = time.perf_counter()
+                counts = storage.modified_counts(file_path)
+                if counts is None:
+                    counts = {col.split('__MODIFIED')[0]: int(part_tab[col].sum())
+                              for part_tab in [pd.concat(list(store.read(file_path, dtype(modified_columns),
+                                                                       columns=modified_columns, chunksize=CHUNKSIZE)))]
+                              for col in modified_columns}
+                t_count = time.perf_counter() - start
+                same = res.reset_index(drop=True).equals(tab) \
+                        and counts == {col.split('__MODIFIED')[0]: int(tab[col].sum()) for col in modified_columns}
+                print('{:<10}{:<12}{:>14.0f}{:>14.0f}{:>12.1f}{:>12.3f}{:>8}'.format(
+                        name, 'bitmaps' if modified_bitmaps else 'columns', len(tab) / t_write, len(tab) / t_read,
+                        size(file_path), t_count, str(same)))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of chunk-parallel transforms (AbstractDataProject.run_transform_module_parallel): replace_mvs and
+recode_types run chunk by chunk in the current process vs. on pools of worker processes.
+
+The script also checks that all runs return the same table and modification counts.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+os.chdir(parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import logging
+logging.disable(logging.CRITICAL)
+import pandas as pd
+from abstract_data_project import AbstractDataProject
+from MODULES import NORMALIZE_MODULES
+
+CHUNKSIZE = 3000
+
+COLUMN_TYPES = {'ville': 'Commune', 'date': 'Date', 'tel': 'Téléphone', 'email': 'Email'}
+
+class BenchProject(AbstractDataProject):
+    '''Project with only what transforms need in memory (no files)'''
+    MODULES = NORMALIZE_MODULES
+
+    def __init__(self, processes):
+        self.TRANSFORM_PROCESSES = processes
+        self.memos = dict()
+        self.mem_data_info = {'file_name': 'bench.csv'}
+        self.run_info_buffer = dict()
+
+    def run(self, module_name, tab, params):
+        self.run_info_buffer[(module_name, 'bench.csv')] = {'mod_count': defaultdict(int)}
+        tab_gen = (tab.iloc[i:i + CHUNKSIZE].copy() for i in range(0, len(tab), CHUNKSIZE))
+        if self.TRANSFORM_PROCESSES > 1:
+            parts = self.run_transform_module_parallel(module_name, tab_gen, params, self.TRANSFORM_PROCESSES)
+        else:
+            parts = (self.run_transform_module(module_name, part_tab, params) for part_tab in tab_gen)
+        res = pd.concat(list(parts))
+        return res, dict(self.run_info_buffer[(module_name, 'bench.csv')]['mod_count'])
+
+def make_table(num_rows):
+    random.seed(0)
+    cities = ['Paris', 'PARIS 15', 'Lyon', 'St Etienne', 'Saint-Denis', 'Marseille 13e', 'Villeneuve d\'Ascq', 'NR']
+    data = {'ville': [random.choice(cities) for _ in range(num_rows)],
+            'date': ['{}/{:02d}/{}'.format(random.randint(1, 28), random.randint(1, 12), random.randint(1950, 2017))
+                     for _ in range(num_rows)],
+            'tel': ['0{} {:02d} {:02d} {:02d} {:02d}'.format(*[random.randint(1, 99) for _ in range(5)])
+                    for _ in range(num_rows)],
+            'email': ['Contact.{}@Exemple.FR'.format(random.randint(0, num_rows)) for _ in range(num_rows)]}
+    return pd.DataFrame(data)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark chunk-parallel transforms')
+    parser.add_argument('-n', '--num_rows', type=int, default=60000, help='number of rows in the table')
+    parser.add_argument('-p', '--processes', type=int, nargs='+', default=[2, 4], help='numbers of worker processes')
+    args = parser.parse_args()
+    tab = make_table(args.num_rows)
+    mv = {'val': 'NR', 'score': 1, 'origin': ['usual']}
+    modules = [('replace_mvs', {'mvs_dict': {'all': [mv], 'columns': {}}, 'thresh': 0.6}),
+               ('recode_types', {'column_types': COLUMN_TYPES})]
+    print('{} rows x {} columns, {} CPUs'.format(*tab.shape, os.cpu_count()))
+    print('{:<16}{:>12}{:>12}{:>10}{:>8}'.format('module', 'processes', 'time (s)', 'speedup', 'same'))
+    for (module_name, params) in modules:
+        start = time.perf_counter()
+        ref = BenchProject(1).run(module_name, tab.copy(), params)
+        t_ref = time.perf_counter() - start
+        print('{:<16}{:>12}{:>12.2f}{:>10}{:>8}'.format(module_name, 1, t_ref, '', ''))
+        for processes in args.processes:
+            start = time.perf_counter()
+            res = BenchProject(processes).run(module_name, tab.copy(), params)
+            t_par = time.perf_counter() - start
+            same = res[0].equals(ref[0]) and res[1] == ref[1]
+            print('{:<16}{:>12}{:>12.2f}{:>10.1f}{:>8}'.format(module_name, processes, t_par, t_ref / t_par, str(same)))
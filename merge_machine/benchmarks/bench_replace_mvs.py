@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of replace_mvs on wide chunks (by default 150 columns): replacement of each missing value candidate in turn
+over the entire chunk (former replace_mvs) vs. one mask per column for all candidates (missing_values.replace_mvs).
+
+The script also checks that both return the same table and modifications.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import numpy as np
+import pandas as pd
+from missing_values import replace_mvs, DEFAULT_THRESH
+
+MVS = ['', 'NR', 'XXX', '-', 'none', '999999', 'N/A', '?']
+
+def replace_mvs_by_value(tab, params):
+    ''' Former replace_mvs (with column replacements assigned back, as inplace replacements on columns no longer
+    modify the table with copy-on-write) '''
+    mvs_dict = params['mvs_dict']
+    thresh = params.get('thresh', DEFAULT_THRESH)
+    modified = pd.DataFrame(False, index=tab.index, columns=tab.columns)
+    for mv in mvs_dict['all']:
+        if mv['score'] >= thresh:
+            modified = modified | (tab == mv['val'])
+            tab = tab.replace(mv['val'], np.nan)
+    for col, mv_values in mvs_dict['columns'].items():
+        for mv in mv_values:
+            if mv['score'] >= thresh:
+                if tab[col].notnull().any():
+                    modified[col] = modified[col] | (tab[col] == mv['val'])
+                tab[col] = tab[col].replace(mv['val'], np.nan)
+    return tab, modified
+
+def make_chunk(num_rows, num_cols):
+    random.seed(0)
+    columns = ['col_{}'.format(i) for i in range(num_cols)]
+    data = {col: [random.choice(MVS) if random.random() < 0.05 else str(random.randint(0, 10**6))
+                  for _ in range(num_rows)] for col in columns}
+    return pd.DataFrame(data)
+
+def make_params(columns):
+    random.seed(1)
+    mv = lambda val: {'val': val, 'score': 1, 'origin': ['usual']}
+    return {'mvs_dict': {'all': [mv(''), mv('NR')],
+                         'columns': {col: [mv(val) for val in random.sample(MVS[2:], 3)] for col in columns}},
+            'thresh': 0.6}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark replace_mvs on wide chunks')
+    parser.add_argument('-n', '--num_rows', type=int, default=10000, help='number of rows in the chunk')
+    parser.add_argument('-c', '--num_cols', type=int, default=150, help='number of columns in the chunk')
+    args = parser.parse_args()
+    tab = make_chunk(args.num_rows, args.num_cols)
+    params = make_params(tab.columns)
+    start = time.perf_counter()
+    tab_by_value, modified_by_value = replace_mvs_by_value(tab.copy(), params)
+    t_by_value = time.perf_counter() - start
+    start = time.perf_counter()
+    tab_masked, modified_masked = replace_mvs(tab.copy(), params)
+    t_masked = time.perf_counter() - start
+    same = tab_by_value.equals(tab_masked) and modified_by_value.equals(modified_masked)
+    print('{} rows x {} columns, {} values replaced'.format(args.num_rows, args.num_cols, modified_masked.values.sum()))
+    print('{:<24}{:>12}'.format('', 'time (s)'))
+    print('{:<24}{:>12.3f}'.format('by value', t_by_value))
+    print('{:<24}{:>12.3f}'.format('column masks', t_masked))
+    print('speedup: {:.1f}x, same results: {}'.format(t_by_value / t_masked, same))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the sample of rows built on upload (sampling.RowSample): cost of sampling each chunk while a CSV file is
+read, vs. the second pass over the file that sampling the entire file would take otherwise, and time to select a sample
+from the stored sample.
+
+The script also checks that the sample is drawn from the entire file (the maximum position sampled).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pandas as pd
+from sampling import RowSample
+
+CHUNKSIZE = 3000
+
+def make_table(num_rows, num_cols):
+    random.seed(0)
+    return pd.DataFrame({'col_{}'.format(i): ['value {}'.format(random.randint(0, 1000)) for _ in range(num_rows)]
+                         for i in range(num_cols)})
+
+def read(file_path):
+    return pd.read_csv(file_path, dtype=str, chunksize=CHUNKSIZE)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the sample of rows built on upload')
+    parser.add_argument('-n', '--num_rows', type=int, default=300000, help='number of rows in the file')
+    parser.add_argument('-c', '--num_cols', type=int, default=10, help='number of columns in the file')
+    parser.add_argument('-s', '--sample_size', type=int, default=50, help='number of rows to select from the sample')
+    args = parser.parse_args()
+    tab = make_table(args.num_rows, args.num_cols)
+    print('{} rows x {} columns'.format(*tab.shape))
+    with tempfile.TemporaryDirectory() as dir_path:
+        file_path = os.path.join(dir_path, 'bench.csv')
+        tab.to_csv(file_path, index=False)
+
+        start = time.perf_counter()
+        for part_tab in read(file_path):
+            pass
+        t_read = time.perf_counter() - start
+
+        sample = RowSample(file_path + RowSample.FILE_SUFFIX)
+        start = time.perf_counter()
+        for part_tab in read(file_path):
+            sample.update(part_tab)
+        sample.save()
+        t_sample = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = RowSample.load(file_path + RowSample.FILE_SUFFIX).subsample(args.sample_size)
+        t_load = time.perf_counter() - start
+
+    print('{:<36}{:>10}'.format('', 'time (s)'))
+    print('{:<36}{:>10.3f}'.format('read file', t_read))
+    print('{:<36}{:>10.3f}'.format('read file and sample (upload)', t_sample))
+    print('{:<36}{:>10.3f}'.format('overhead on upload', t_sample - t_read))
+    print('{:<36}{:>10.3f}'.format('select from stored sample', t_load))
+    print('{} rows sampled, last position sampled: {}'.format(len(sample.rows), rows.index.max()))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the detection of the encoding and separator of uploaded files: the former trial parses of the first 3000
+lines (3 encodings x 3 separators) vs. the detection from a sample of the first bytes (sniffer.py), on a wide file.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pandas as pd
+from sniffer import read_sample, sniff
+
+NUM_LINES = 3000
+
+def make_file(num_rows, num_cols):
+    random.seed(0)
+    lines = [';'.join('col_{}'.format(i) for i in range(num_cols))]
+    for _ in range(num_rows):
+        lines.append(';'.join('valeur {}, é'.format(random.randint(0, 1000)) for _ in range(num_cols)))
+    return '\n'.join(lines).encode('utf-8')
+
+def former_detection(file):
+    first_lines = b''.join([file.readline() for _ in range(NUM_LINES)])
+    for encoding in ['utf-8', 'ISO-8859-1', 'windows-1252']:
+        best_sep = None
+        best_sep_num_cols = 0
+        for sep in [';', ',', '\t']:
+            try:
+                columns = pd.read_csv(io.BytesIO(first_lines), sep=sep, encoding=encoding, dtype=str).columns
+                if len(columns) >= best_sep_num_cols:
+                    best_sep = sep
+                    best_sep_num_cols = len(columns)
+            except Exception:
+                pass
+        if best_sep is not None:
+            return encoding, best_sep
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark encoding and separator detection on upload')
+    parser.add_argument('-n', '--num_rows', type=int, default=5000, help='number of rows of the file')
+    parser.add_argument('-c', '--num_cols', type=int, default=200, help='number of columns of the file')
+    args = parser.parse_args()
+    data = make_file(args.num_rows, args.num_cols)
+    print('{} rows x {} columns ({:.1f} MB)'.format(args.num_rows, args.num_cols, len(data) / 2 ** 20))
+
+    start = time.perf_counter()
+    former = former_detection(io.BytesIO(data))
+    t_former = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sample, _ = read_sample(io.BytesIO(data))
+    sniffed = sniff(sample)
+    t_sniff = time.perf_counter() - start
+
+    print('{:<24}{:>10}{:>22}'.format('', 'time (s)', 'decision'))
+    print('{:<24}{:>10.3f}{:>22}'.format('trial parses', t_former, str(former)))
+    print('{:<24}{:>10.3f}{:>22}'.format('sniffer', t_sniff, str(sniffed)))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of value matcher startup time (importing preprocess_fields_v3, then creating all value matchers), as
+experienced by a fresh API or worker process, without the lexicon cache, with an empty cache and with a warm cache.
+
+Each measurement runs in a new Python process; the cache is stored in a temporary directory.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+
+def child(use_cache, cache_path):
+    sys.path.insert(0, parentdir)
+    os.chdir(parentdir)
+    # CONFIG resolves the resource directory relative to the running script
+    sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+    import lexicon_cache
+    lexicon_cache.USE_LEXICON_CACHE = use_cache
+    lexicon_cache.LEXICON_CACHE_PATH = cache_path
+    start = time.perf_counter()
+    import preprocess_fields_v3 as pf
+    imported = time.perf_counter()
+    pf.value_matchers()
+    built = time.perf_counter()
+    return {'import': imported - start, 'matchers': built - imported}
+
+def run_child(use_cache, cache_path):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(int(use_cache)), cache_path],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def report(name, timings):
+    best = min(timings, key=lambda t: t['import'] + t['matchers'])
+    print('{:<16}{:>12.2f}{:>14.2f}{:>12.2f}'.format(name, best['import'], best['matchers'], best['import'] + best['matchers']))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark value matcher startup time')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of processes per measurement (best one is kept)')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        timings = child(bool(int(args.child[0])), args.child[1])
+        print(json.dumps(timings))
+        sys.exit()
+    print('{:<16}{:>12}{:>14}{:>12}'.format('lexicon cache', 'import (s)', 'matchers (s)', 'total (s)'))
+    with tempfile.TemporaryDirectory() as cache_path:
+        report('disabled', [run_child(False, cache_path) for _ in range(args.repeat)])
+        cold = list()
+        for _ in range(args.repeat):
+            for entry in os.listdir(cache_path):
+                os.remove(os.path.join(cache_path, entry))
+            cold.append(run_child(True, cache_path))
+        report('cold', cold)
+        report('warm', [run_child(True, cache_path) for _ in range(args.repeat)])
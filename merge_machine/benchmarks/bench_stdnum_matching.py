@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of identifier validation throughput for each stdnum-based matcher (StdnumMatcher), with the batch validator
+checking the whole column at once and with stdnum alone on every value: both for validation alone (as in
+StdnumMatcher.validate_values) and for matching all values of a column (which includes registering each match).
+
+Each column holds valid identifiers (so that the matcher does not bail out), with some of them in spaced format.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+os.chdir(parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import logging
+logging.disable(logging.CRITICAL)
+import pandas as pd
+from stdnum import luhn
+import preprocess_fields_v3 as pf
+
+def random_digits(n):
+    return ''.join(random.choice('0123456789') for _ in range(n))
+
+def siren():
+    s = random_digits(8)
+    return s + luhn.calc_check_digit(s)
+
+def siret():
+    s = siren() + random_digits(4)
+    return s + luhn.calc_check_digit(s)
+
+def nif():
+    s = str(random.randint(0, 3)) + random_digits(9)
+    return s + '%03d' % (int(s) % 511)
+
+def nir():
+    s = random_digits(13)
+    return s + '%02d' % (97 - int(s) % 97)
+
+GENERATORS = {pf.F_SIREN: siren, pf.F_SIRET: siret, pf.F_NIF: nif, pf.F_NIR: nir}
+
+def column(t, num_rows):
+    random.seed(0)
+    values = [GENERATORS[t]() for _ in range(num_rows)]
+    return [' '.join((v[:3], v[3:6], v[6:])) if i % 10 == 0 and t != pf.F_NIF else v for (i, v) in enumerate(values)]
+
+def validate(vm, values, batch):
+    start = time.perf_counter()
+    if batch:
+        vm.validate_values(values)
+    else:
+        [vm.normalizer(v) if vm.validator(v) else None for v in values]
+    return time.perf_counter() - start
+
+def match(vm, values, batch):
+    fields = pf.parse_fields_from_Panda(pd.DataFrame({'id': values}), distinct=False)
+    f = list(fields.fields.values())[0]
+    batchValidator = vm.batchValidator
+    if not batch:
+        vm.batchValidator = None
+    start = time.perf_counter()
+    vm.match_all_field_values(f)
+    elapsed = time.perf_counter() - start
+    vm.batchValidator = batchValidator
+    return elapsed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark identifier validation with and without batch validators')
+    parser.add_argument('-n', '--num_rows', type=int, default=200000, help='number of rows in each column')
+    args = parser.parse_args()
+    matchers = [vm for vm in pf.generate_value_matchers(0) if isinstance(vm, pf.StdnumMatcher) and vm.t in GENERATORS]
+    print('{:<12}{:<12}{:>18}{:>18}{:>10}'.format('type', 'step', 'stdnum (rows/s)', 'batch (rows/s)', 'speedup'))
+    for vm in matchers:
+        values = column(vm.t, args.num_rows)
+        for (step, run) in (('validate', validate), ('match', match)):
+            slow, fast = run(vm, values, False), run(vm, values, True)
+            print('{:<12}{:<12}{:>18.0f}{:>18.0f}{:>9.1f}x'.format(vm.t, step, len(values) / slow, len(values) / fast,
+                  slow / fast))
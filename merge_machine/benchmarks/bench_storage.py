@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the storage backends for intermediate files (storage.py): write and read throughput (in chunks, as
+between normalization modules), read throughput for a few columns only, and disk usage, for CSV and Parquet.
+
+The table mimics a normalized referential: string columns of varying cardinality, with a boolean __MODIFIED column
+for each of them.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pandas as pd
+from storage import STORAGE_BACKENDS
+
+CHUNKSIZE = 3000
+
+def make_table(num_rows, num_cols):
+    random.seed(0)
+    data = dict()
+    for i in range(num_cols):
+        # From a handful of distinct values (types, cities...) to mostly distinct ones (names, identifiers)
+        values = ['value {} of column {}'.format(j, i) for j in range(10 ** (1 + i % 5))]
+        data['col_{}'.format(i)] = [random.choice(values) if random.random() > 0.05 else None for _ in range(num_rows)]
+        data['col_{}__MODIFIED'.format(i)] = [random.random() < 0.1 for _ in range(num_rows)]
+    return pd.DataFrame(data)
+
+def chunks(tab):
+    for i in range(0, len(tab), CHUNKSIZE):
+        yield tab.iloc[i:i + CHUNKSIZE]
+
+def dtype(columns):
+    return {col: bool if '__MODIFIED' in col else str for col in columns}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the storage backends for intermediate files')
+    parser.add_argument('-n', '--num_rows', type=int, default=300000, help='number of rows in the table')
+    parser.add_argument('-c', '--num_cols', type=int, default=10, help='number of string columns in the table')
+    args = parser.parse_args()
+    tab = make_table(args.num_rows, args.num_cols)
+    few_columns = ['col_0', 'col_0__MODIFIED']
+    print('{} rows x {} columns'.format(*tab.shape))
+    print('{:<10}{:>14}{:>14}{:>22}{:>12}'.format('backend', 'write (rows/s)', 'read (rows/s)',
+                                                   'read 2 cols (rows/s)', 'size (MB)'))
+    with tempfile.TemporaryDirectory() as dir_path:
+        for name, backend in STORAGE_BACKENDS.items():
+            storage = backend()
+            file_path = os.path.join(dir_path, 'table' + storage.EXTENSION)
+            start = time.perf_counter()
+            storage.write(file_path, chunks(tab))
+            t_write = time.perf_counter() - start
+            start = time.perf_counter()
+            for part_tab in storage.read(file_path, dtype(tab.columns), chunksize=CHUNKSIZE):
+                pass
+            t_read = time.perf_counter() - start
+            start = time.perf_counter()
+            for part_tab in storage.read(file_path, dtype(few_columns), columns=few_columns, chunksize=CHUNKSIZE):
+                pass
+            t_read_few = time.perf_counter() - start
+            print('{:<10}{:>14.0f}{:>14.0f}{:>22.0f}{:>12.1f}'.format(name, len(tab) / t_write, len(tab) / t_read,
+                                                                       len(tab) / t_read_few,
+                                                                       os.path.getsize(file_path) / 2 ** 20))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of token sequence lookup in TokenizedMatcher and VariantExpander: scan of all token windows (former match
+methods, joining the tokens of each window for a dict lookup) vs. walk down the token trie (TokenTrie).
+
+Labels are long organisation labels, made by concatenating several entries of the RNSR and HAL lexicons (as in
+affiliations listing a lab, its institutions and its address). The script also counts labels on which the matches
+found by both methods disagree (in content or order).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+os.chdir(parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import logging
+logging.disable(logging.CRITICAL)
+import preprocess_fields_v3 as pf
+
+def window_matches(tokenIdx, maxTokens, tokens, longestOnly):
+    ''' Token sequences of tokenIdx found by the former window scan, in scanning order (first one only if longestOnly). '''
+    res = list()
+    for k2 in range(maxTokens, 0, -1):
+        for k1 in range(0, len(tokens) + 1 - k2):
+            phrase = ' '.join(tokens[k1:k1 + k2])
+            if phrase in tokenIdx:
+                res.append((k1, k1 + k2, phrase))
+                if longestOnly: return res
+    return res
+
+def trie_matches(trie, tokens, longestOnly):
+    ''' Same as window_matches, through the token trie. '''
+    matches = list(trie.matches(tokens, longestOnly = longestOnly))
+    order = lambda m: (m[0] - m[1], m[0])
+    if longestOnly: return [min(matches, key = order)] if len(matches) > 0 else []
+    return sorted(matches, key = order)
+
+def sample_labels(num_labels, parts):
+    random.seed(0)
+    values = [v for file_name in ['org_rnsr.col', 'org_hal.syn', 'org_rnsr.syn'] for v in pf.file_to_list(file_name) if v]
+    return [', '.join(random.choice(values) for _ in range(random.randint(1, parts))) for _ in range(num_labels)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark token sequence lookup')
+    parser.add_argument('-n', '--num_labels', type=int, default=5000, help='number of labels to match')
+    parser.add_argument('-p', '--parts', type=int, default=4, help='max number of lexicon entries in each label')
+    args = parser.parse_args()
+    matchers = [('TokenizedMatcher org_rnsr.col', pf.TokenizedMatcher(pf.F_RD_STRUCT, pf.file_to_set('org_rnsr.col')), True),
+                ('VariantExpander org_hal.syn', pf.VariantExpander('org_hal.syn', pf.F_RD_STRUCT, True), False),
+                ('VariantExpander org_rnsr.syn', pf.VariantExpander('org_rnsr.syn', pf.F_RD_STRUCT, True), False)]
+    labels = [pf.normalize_and_validate_tokens(v) or [] for v in sample_labels(args.num_labels, args.parts)]
+    print('{} labels, {:.1f} tokens on average'.format(len(labels), sum(map(len, labels)) / len(labels)))
+    print('{:<32}{:>12}{:>12}{:>10}{:>8}'.format('matcher', 'window (s)', 'trie (s)', 'speedup', 'diffs'))
+    for (name, vm, longestOnly) in matchers:
+        start = time.perf_counter()
+        windowRes = [window_matches(vm.tokenIdx, vm.maxTokens, tokens, longestOnly) for tokens in labels]
+        t_window = time.perf_counter() - start
+        start = time.perf_counter()
+        trieRes = [trie_matches(vm.trie, tokens, longestOnly) for tokens in labels]
+        t_trie = time.perf_counter() - start
+        diffs = sum(1 for (a, b) in zip(windowRes, trieRes) if a != b)
+        print('{:<32}{:>12.3f}{:>12.3f}{:>10.1f}{:>8}'.format(name, t_window, t_trie, t_window / t_trie, diffs))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of vocabulary matching: flat regex alternation (former build_vocab_regex / PAT_FIRST_NAME) vs. 
+trie-structured alternation (trie_pattern).
+
+Values are drawn from the lexicons in the resource directory (institution labels, communes, person names). For 
+vocabularies without regex metacharacters, the script also counts values on which both patterns disagree.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+os.chdir(parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import preprocess_fields_v3 as pf
+
+VOCAB_FILES = ['educ_nat.vocab', 'etab_1er_2nd_degres.vocab', 'etab_enssup.vocab', 'etablissement.vocab',
+               'org_RD.vocab', 'org_enseignement.vocab', 'org_entreprise.vocab', 'org_rnsr.vocab',
+               'prenom', 'commune']
+VALUE_FILES = ['etab_enssup', 'etab_1er_2nd_degres', 'commune', 'academie', 'mention_licence_sise']
+
+def sample_values(num_values):
+    values = list()
+    for file_name in VALUE_FILES:
+        values.extend(v for v in pf.file_to_list(file_name) if v)
+    firsts, lasts = list(pf.PRENOM_LEXICON), list(pf.PATRONYME_LEXICON)
+    values.extend('{} {}'.format(random.choice(firsts), random.choice(lasts).capitalize()) for _ in range(len(values)))
+    return [random.choice(values) for _ in range(num_values)]
+
+def flat_vocab_regex(vocab):
+    return '({}).*$'.format('|'.join(vocab))
+
+def time_regex(r, values, partial):
+    start = time.perf_counter()
+    if partial:
+        res = [bool(r.findall(v)) for v in values]
+    else:
+        res = [r.match(v) is not None for v in values]
+    return time.perf_counter() - start, res
+
+def bench_vocab_matchers(values):
+    print('{:<28}{:>8}{:>8}{:>10}{:>10}{:>10}{:>8}'.format('vocabulary', 'size', 'partial', 'flat (s)', 'trie (s)', 'speedup', 'diffs'))
+    for file_name in VOCAB_FILES:
+        vocab = pf.file_to_set(file_name)
+        literal = all(re.escape(w) == w.replace(' ', '\\ ') for w in vocab)
+        for partial in [False, True]:
+            flat = re.compile(pf.pattern_with_word_boundary(flat_vocab_regex(vocab)), re.I)
+            trie = re.compile(pf.pattern_with_word_boundary(pf.build_vocab_regex(vocab, partial)), re.I)
+            t_flat, r_flat = time_regex(flat, values, partial)
+            t_trie, r_trie = time_regex(trie, values, partial)
+            diffs = sum(1 for (a, b) in zip(r_flat, r_trie) if a != b)
+            print('{:<28}{:>8}{:>8}{:>10.3f}{:>10.3f}{:>10.1f}{:>8}'.format(file_name, len(vocab), str(partial), t_flat, t_trie, 
+                t_flat / t_trie, diffs if literal else 'n/a'))
+
+def bench_person_names(values):
+    flat_first = '(%s)' % '|'.join(pf.PRENOM_LEXICON)
+    print('First name alternation: {} entries, {} vs. {} characters'.format(len(pf.PRENOM_LEXICON), len(flat_first), len(pf.PAT_FIRST_NAME)))
+    print('{:<28}{:>10}{:>10}{:>10}'.format('pattern', 'flat (s)', 'trie (s)', 'speedup'))
+    for (name, template) in [('first name', '%s'), ('first name + last name', '%s\s+(' + pf.PAT_LAST_NAME + ')'),
+                             ('last name + first name', '(' + pf.PAT_LAST_NAME + ')\s+%s')]:
+        flat = pf.regex_with_word_boundary(template % flat_first, re.IGNORECASE)
+        trie = pf.regex_with_word_boundary(template % pf.PAT_FIRST_NAME, re.IGNORECASE)
+        t_flat, _ = time_regex(flat, values, False)
+        t_trie, _ = time_regex(trie, values, False)
+        print('{:<28}{:>10.3f}{:>10.3f}{:>10.1f}'.format(name, t_flat, t_trie, t_flat / t_trie))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark vocabulary matching')
+    parser.add_argument('-n', '--num-values', type=int, default=20000, help='number of values to match')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    random.seed(args.seed)
+    values = sample_values(args.num_values)
+    bench_vocab_matchers(values)
+    bench_person_names(values)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Calibration of the costs per value of value matchers, by which they are ordered on each column (see MATCHER_COSTS in
+preprocess_fields_v3.py), written to the resource directory (resource/matcher_costs.json).
+
+All value matchers are run on every column of a calibration table with columns of all kinds (names, places,
+institutions, identifiers, dates, addresses, free text), without settling column types. The cost per value of a matcher
+class is the time that @timed collects for its match_all_field_values calls (timingInfo, by class), divided by the
+number of these calls (countInfo) times the number of values of a column: it includes the values skipped after bailing
+out, as on actual columns. Costs are the min over several runs.
+
+Matchers whose backend can not be reached (ex: FrenchAddressMatcher without a local BAN extract nor network access) are
+not measured, nor are matchers that are not generated at the default level (ex: GridMatcher): their cost in the current
+table is kept, unless --drop_unmeasured is given.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+currentdir = os.path.dirname(os.path.abspath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+os.chdir(parentdir)
+# CONFIG resolves the resource directory relative to the running script
+sys.argv[0] = os.path.join(parentdir, os.path.basename(sys.argv[0]))
+
+import logging
+logging.disable(logging.CRITICAL)
+import pandas as pd
+from stdnum import luhn
+import preprocess_fields_v3 as pf
+
+def random_digits(n):
+    return ''.join(random.choice('0123456789') for _ in range(n))
+
+def siren():
+    s = random_digits(8)
+    return s + luhn.calc_check_digit(s)
+
+def siret():
+    s = siren() + random_digits(4)
+    return s + luhn.calc_check_digit(s)
+
+def calibration_table(num_rows):
+    '''Table with columns of all kinds (values drawn from the lexicons of the resource directory)'''
+    def lexicon(file_name):
+        return [v for v in pf.file_to_list(file_name) if v.strip()]
+    firsts, lasts = sorted(pf.PRENOM_LEXICON), sorted(pf.PATRONYME_LEXICON)
+    communes, words = lexicon('commune'), lexicon('liste_mots_fr.col')
+    draw = lambda values: [random.choice(values) for _ in range(num_rows)]
+    zips = ['{:05d}'.format(random.randint(1000, 95999)) for _ in range(num_rows)]
+    return pd.DataFrame({
+        'prenom': draw(firsts),
+        'nom': [v.capitalize() for v in draw(lasts)],
+        'personne': ['{} {}'.format(f, l.capitalize()) for f, l in zip(draw(firsts), draw(lasts))],
+        'commune': draw(communes),
+        'departement': draw(lexicon('departement')),
+        'pays': draw(lexicon('country')),
+        'academie': draw(lexicon('academie')),
+        'etablissement': draw(lexicon('etab_enssup')),
+        'mention': draw(lexicon('mention_licence_sise')),
+        'email': ['{}.{}@{}.fr'.format(f, l, random.choice(words)).lower() for f, l in zip(draw(firsts), draw(lasts))],
+        'url': ['https://www.{}.fr/{}'.format(a, b) for a, b in zip(draw(words), draw(words))],
+        'telephone': ['0{} {} {} {} {}'.format(random.randint(1, 9), *(random_digits(2) for _ in range(4)))
+                      for _ in range(num_rows)],
+        'date': ['{:02d}/{:02d}/{}'.format(random.randint(1, 28), random.randint(1, 12), random.randint(1950, 2017))
+                 for _ in range(num_rows)],
+        'annee': [str(random.randint(1950, 2017)) for _ in range(num_rows)],
+        'siren': [siren() for _ in range(num_rows)],
+        'siret': [siret() for _ in range(num_rows)],
+        'code_postal': zips,
+        'adresse': ['{} rue {} {} {}'.format(random.randint(1, 150), l.capitalize(), z, c)
+                    for l, z, c in zip(draw(lasts), zips, draw(communes))],
+        'montant': ['{:.2f}'.format(random.random() * 10000) for _ in range(num_rows)],
+        'texte': [' '.join(random.choice(words) for _ in range(random.randint(3, 12))) for _ in range(num_rows)],
+    })
+
+def unreachable(vm):
+    '''Whether the backend of a matcher (if any) can not be reached'''
+    backend = getattr(vm, 'backend', None)
+    if backend is None:
+        return False
+    try:
+        backend.search('1 rue de la Paix 75002 Paris')
+        return False
+    except ConnectionError:
+        return True
+
+def measure(tab, vms):
+    '''Cost per value (in microseconds) of each matcher class, over all columns of tab'''
+    pf.timingInfo.clear()
+    pf.countInfo.clear()
+    fields = pf.parse_fields_from_Panda(tab)
+    for f in fields.fields.values():
+        for vm in vms:
+            vm.match_all_field_values(f)
+    costs = dict()
+    for vm in vms:
+        key = vm.__class__.__name__ + '.match_all_field_values'
+        if pf.countInfo[key] > 0:
+            costs[vm.__class__.__name__] = pf.timingInfo[key] / (pf.countInfo[key] * len(tab))
+    return costs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the costs per value of value matchers')
+    parser.add_argument('-n', '--num_rows', type=int, default=2000, help='number of rows of the calibration table')
+    parser.add_argument('-r', '--runs', type=int, default=3, help='number of runs (costs are the min over runs)')
+    parser.add_argument('-o', '--output', default=os.path.join(pf.RESOURCE_PATH, pf.MATCHER_COSTS_FILE),
+                        help='file to which the costs are written')
+    parser.add_argument('--drop_unmeasured', action='store_true',
+                        help='leave out matchers that could not be measured rather than keeping their current cost')
+    args = parser.parse_args()
+    random.seed(0)
+    tab = calibration_table(args.num_rows)
+
+    vms = [vm for vm in pf.value_matchers() if not isinstance(vm, (pf.SubtypeMatcher, pf.CompositeMatcher))]
+    unmeasured = set(vm.__class__.__name__ for vm in vms if unreachable(vm))
+    vms = [vm for vm in vms if vm.__class__.__name__ not in unmeasured]
+    runs = [measure(tab, vms) for _ in range(args.runs)]
+    costs = dict((name, round(min(run[name] for run in runs), 2)) for name in runs[0])
+    if not args.drop_unmeasured:
+        current = pf.file_to_matcher_costs(args.output)
+        unmeasured = set(current) - set(costs)
+        costs.update((name, current[name]) for name in unmeasured)
+
+    print('{:<28}{:>16}'.format('matcher', 'us per value'))
+    for name, cost in sorted(costs.items(), key = lambda item: item[1]):
+        print('{:<28}{:>16}{}'.format(name, cost, ' (not measured)' if name in unmeasured else ''))
+    with open(args.output, 'w') as f:
+        json.dump(dict(sorted(costs.items())), f, indent = 1)
+        f.write('\n')
+    print('Wrote {}'.format(args.output))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpoints for long running jobs (transforms, linking, indexing), so that a
+job that was interrupted (timeout, out of memory, worker restart) resumes
+from the last chunk it completed instead of from the first row.
+
+While data is written to a file, each chunk is written as a numbered segment
+in a directory next to the file (FILE__segments/part-00000.csv ...) and a
+progress manifest (FILE__progress.json) lists the segments written, along
+with information to restore (modification counts at that point). Segments
+are assembled into the file once all data is written, and the file is then
+moved in place, so that a file at its final path is always complete.
+
+A checkpoint is only resumed by a job with the same signature (source file
+and transforms with their parameters). It is discarded otherwise.
+"""
+
+import json
+import logging
+import os
+import shutil
+
+from storage import atomic_write, move, remove
+
+PROGRESS_SUFFIX = '__progress.json'
+SEGMENTS_SUFFIX = '__segments'
+
+
+def _normalize(signature):
+    '''Signature as read back from the manifest'''
+    return json.loads(json.dumps(signature, default=str))
+
+
+class Checkpoint():
+    '''Progress of a job writing to (or consuming rows for) file_path'''
+    def __init__(self, file_path, signature):
+        self.file_path = file_path
+        self.manifest_path = file_path + PROGRESS_SUFFIX
+        self.segments_dir = file_path + SEGMENTS_SUFFIX
+        self.signature = _normalize(signature)
+        self.progress = self._load()
+
+    def _new_progress(self):
+        return {'signature': self.signature, 'rows': 0, 'segments': []}
+
+    def _load(self):
+        '''Progress of the last run of the job (discarded if it is the
+        progress of another job or if segments are missing)'''
+        try:
+            with open(self.manifest_path) as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            progress = None
+        if (progress is not None) and (progress['signature'] == self.signature) \
+                and all(os.path.isfile(self._segment_path(segment['file_name'])) \
+                        for segment in progress['segments']):
+            return progress
+        if progress is not None:
+            logging.warning('Discarding checkpoint of another job: {0}'.format(self.manifest_path))
+        self._remove_files()
+        return self._new_progress()
+
+    def _save(self):
+        '''Writes the manifest (atomically, so that it always describes
+        segments that were entirely written)'''
+        with atomic_write(self.manifest_path) as f:
+            json.dump(self.progress, f)
+
+    def _segment_path(self, segment_file_name):
+        return os.path.join(self.segments_dir, segment_file_name)
+
+    def _remove_files(self):
+        shutil.rmtree(self.segments_dir, ignore_errors=True)
+        if os.path.isfile(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    @property
+    def rows(self):
+        '''Number of rows completed'''
+        return self.progress['rows']
+
+    @property
+    def info(self):
+        '''Information saved with the last segment'''
+        if not self.progress['segments']:
+            return None
+        return self.progress['segments'][-1]['info']
+
+    def discard(self):
+        '''Starts over from the first row'''
+        self._remove_files()
+        self.progress = self._new_progress()
+
+    def truncate(self, rows):
+        '''Drops the last segments so that the checkpoint holds at most rows
+        rows, and returns the number of rows it holds'''
+        segments = self.progress['segments']
+        if self.rows > rows:
+            while segments and (self.rows > rows):
+                segment = segments.pop()
+                remove(self._segment_path(segment['file_name']))
+                self.progress['rows'] -= segment['nrows']
+            self._save()
+        return self.rows
+
+    def write_through(self, storage, tab_gen, start_row, get_info=None):
+        '''
+        Generates the DataFrames of tab_gen, writing each one as a segment
+        (with the storage backend) as they go. The first DataFrame is the
+        one at row start_row of the data, and rows that the checkpoint
+        already holds are not written again.
+
+        INPUT:
+            - get_info: function returning the information (serializable as
+                    json) to save with each segment
+        '''
+        os.makedirs(self.segments_dir, exist_ok=True)
+        row = start_row
+        for part_tab in tab_gen:
+            to_write = part_tab.iloc[max(self.rows - row, 0):]
+            row += len(part_tab)
+            if len(to_write):
+                segment_file_name = 'part-{0:05d}{1}'.format(len(self.progress['segments']),
+                                                            storage.EXTENSION)
+                segment_path = self._segment_path(segment_file_name)
+                storage.write(segment_path + '.tmp', [to_write])
+                move(segment_path + '.tmp', segment_path)
+                self.progress['segments'].append({'file_name': segment_file_name,
+                                                  'nrows': len(to_write),
+                                                  'info': get_info() if get_info else None})
+                self.progress['rows'] += len(to_write)
+                self._save()
+            yield part_tab
+
+    def finalize(self, storage):
+        '''Assembles the segments into the file (moved in place once
+        complete), removes the checkpoint and returns the number of rows'''
+        nrows = self.rows
+        if self.progress['segments']:
+            segment_paths = [self._segment_path(segment['file_name']) \
+                             for segment in self.progress['segments']]
+            storage.concat(segment_paths, self.file_path + '.tmp')
+            move(self.file_path + '.tmp', self.file_path)
+        self.discard()
+        return nrows
+
+    def track(self, tab_gen):
+        '''Generates the DataFrames of tab_gen (for consumers that do not
+        write to a file) and counts the rows of each one as completed once
+        the next one is requested'''
+        for part_tab in tab_gen:
+            yield part_tab
+            self.progress['rows'] += len(part_tab)
+            self._save()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Choice of chunk sizes (number of rows per DataFrame) from a memory budget.
+
+Data is processed as generators of DataFrames. Rather than a fixed number of
+rows (too many for wide files, which can exhaust the memory of workers, too
+few for narrow files, which pay the overhead of each chunk), the number of
+rows of chunks is chosen so that the chunks a job holds at once fit in the
+memory budget of workers (CONFIG.WORKER_MEMORY_BUDGET), given the memory
+taken by a row, estimated from the first rows of the data.
+
+Each use of chunks holds a different number of copies of a chunk in memory
+(MEMORY_FACTORS), and has its own bounds (MAX_CHUNKSIZES).
+"""
+
+import resource
+import sys
+
+from CONFIG import WORKER_MEMORY_BUDGET
+
+# Number of rows read to estimate the memory taken by a row
+PLANNING_ROWS = 200
+
+# Memory assumed per value (in bytes) if there are no rows to estimate from
+DEFAULT_VALUE_BYTES = 64
+
+# Copies of a chunk in memory at once (at their size as DataFrames), by use:
+#   - transform: the chunk read, the chunk transformed, the __MODIFIED flags
+#                and the concatenation with the original data
+#   - es_insert: the chunk and the documents of the bulk request
+#   - es_export: the hits returned by Elasticsearch and the chunk built from them
+MEMORY_FACTORS = {'transform': 6, 'es_insert': 4, 'es_export': 5}
+
+MIN_CHUNKSIZE = 100
+# Chunk sizes above which the overhead of chunks is negligible (es_export is
+# bounded by the max number of hits per search of Elasticsearch)
+MAX_CHUNKSIZES = {'transform': 20000, 'es_insert': 40000, 'es_export': 10000}
+
+
+def row_bytes(tab):
+    '''Memory taken by a row of a DataFrame (averaged over its rows)'''
+    if not len(tab):
+        return max(len(tab.columns), 1) * DEFAULT_VALUE_BYTES
+    return tab.memory_usage(index=False, deep=True).sum() / len(tab)
+
+
+def plan_chunksize(bytes_per_row, use='transform', copies=1, budget=None):
+    '''
+    Number of rows of chunks for the use
+
+    INPUT:
+        - bytes_per_row: memory taken by a row (see row_bytes)
+        - use: key of MEMORY_FACTORS
+        - copies: number of chunks held at once (ex: chunks in flight
+                for parallel transforms)
+        - budget: memory budget in bytes (WORKER_MEMORY_BUDGET if None)
+    '''
+    if budget is None:
+        budget = WORKER_MEMORY_BUDGET
+    chunksize = int(budget / (max(bytes_per_row, 1) * MEMORY_FACTORS[use] * max(copies, 1)))
+    return max(MIN_CHUNKSIZE, min(chunksize, MAX_CHUNKSIZES[use]))
+
+
+def peak_rss():
+    '''
+    Peak resident memory (in bytes) so far of the current process and of
+    its child processes (max over children that ended: workers of parallel
+    transforms)
+    '''
+    # ru_maxrss is in kilobytes (in bytes on macOS)
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit}
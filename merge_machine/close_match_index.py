@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import hashlib, logging, os
+from array import array
+
+from storage import load_versioned_pickle, save_versioned_pickle
+
+# Close-match lookup structure (symmetric deletion index, in the manner of SymSpell) retrieving all indexed words
+# within a Levenshtein distance of at most 2 from a query string.
+
+# Only the first characters of each word are used to generate deletion keys: this bounds the number of keys per word
+# without any loss of recall, since candidates are then checked against their full edit distance
+PREFIX_LENGTH = 9
+MAX_DIST = 2
+# Version of the layout of index files (see save_versioned_pickle in storage.py)
+INDEX_VERSION = 2
+
+def deletion_keys(w, maxDist = MAX_DIST, prefixLength = PREFIX_LENGTH):
+	''' Returns the set of strings obtained by deleting up to maxDist characters from the prefix of w. '''
+	keys = set([w[:prefixLength]])
+	frontier = keys
+	for _ in range(maxDist):
+		frontier = set([k[:i] + k[i + 1:] for k in frontier for i in range(len(k))])
+		keys |= frontier
+	return keys
+
+def bounded_edit_dist(s, t, maxDist = MAX_DIST):
+	''' Levenshtein distance between s and t if it is no greater than maxDist, or maxDist + 1 otherwise. Only the band
+		of the DP matrix around its diagonal is computed, and computation stops as soon as a row exceeds maxDist. '''
+	if abs(len(s) - len(t)) > maxDist: return maxDist + 1
+	if len(s) > len(t): s, t = t, s
+	big = maxDist + 1
+	prev = [j if j <= maxDist else big for j in range(len(t) + 1)]
+	for i in range(1, len(s) + 1):
+		lo, hi = max(1, i - maxDist), min(len(t), i + maxDist)
+		cur = [big] * (len(t) + 1)
+		cur[0] = i if i <= maxDist else big
+		cs = s[i - 1]
+		rowMin = cur[0] if lo == 1 else big
+		for j in range(lo, hi + 1):
+			d = prev[j - 1] + (0 if cs == t[j - 1] else 1)
+			if prev[j] + 1 < d: d = prev[j] + 1
+			if cur[j - 1] + 1 < d: d = cur[j - 1] + 1
+			cur[j] = d if d < big else big
+			if cur[j] < rowMin: rowMin = cur[j]
+		if rowMin > maxDist: return big
+		prev = cur
+	return prev[len(t)]
+
+class CloseMatchIndex(object):
+	''' Deletion index with integer word ids as postings. Lookups return the same shape as ApproximateLookup.search,
+		namely a mapping from each distance (0 to 2) to the list of matching words. '''
+	def __init__(self, words = None, prefixLength = PREFIX_LENGTH, maxDist = MAX_DIST):
+		self.prefixLength = prefixLength
+		self.maxDist = maxDist
+		# Indexed words, by id
+		self.words = list()
+		self.ids = dict()
+		# Map from deletion key to array of word ids
+		self.postings = dict()
+		if words is not None:
+			for w in words: self.add(w)
+	def __len__(self): return len(self.words)
+	def add(self, w):
+		if w in self.ids: return
+		wid = len(self.words)
+		self.ids[w] = wid
+		self.words.append(w)
+		for key in deletion_keys(w, self.maxDist, self.prefixLength):
+			p = self.postings.get(key)
+			if p is None: self.postings[key] = array('I', [wid])
+			else: p.append(wid)
+	def candidates(self, query):
+		cands = set()
+		for key in deletion_keys(query, self.maxDist, self.prefixLength):
+			p = self.postings.get(key)
+			if p is not None: cands.update(p)
+		return cands
+	def search(self, query):
+		res = { d: [] for d in range(self.maxDist + 1) }
+		for wid in sorted(self.candidates(query)):
+			word = self.words[wid]
+			dist = bounded_edit_dist(word, query, self.maxDist)
+			if dist <= self.maxDist: res[dist].append(word)
+		return res
+	def save(self, filePath):
+		''' Writes this index to disk (atomically). '''
+		save_versioned_pickle(filePath, INDEX_VERSION, (self.prefixLength, self.maxDist, self.words, self.postings))
+	@staticmethod
+	def load(filePath):
+		''' Reads an index written by save, returns None if the file is missing or was written by another version. '''
+		entry = load_versioned_pickle(filePath, INDEX_VERSION)
+		if entry is None: return None
+		(prefixLength, maxDist, words, postings) = entry
+		index = CloseMatchIndex(prefixLength = prefixLength, maxDist = maxDist)
+		index.words = words
+		index.ids = { w: i for (i, w) in enumerate(words) }
+		index.postings = postings
+		return index
+
+def words_digest(words):
+	''' Content-based key for a set of words (independent of their ordering). '''
+	h = hashlib.sha1('{}|{}|{}'.format(INDEX_VERSION, PREFIX_LENGTH, MAX_DIST).encode('utf-8'))
+	for w in sorted(set(words)):
+		h.update(w.encode('utf-8', 'surrogatepass'))
+		h.update(b'\0')
+	return h.hexdigest()
+
+# Indexes already built or loaded by this process, by words digest
+INDEXES = dict()
+
+def cached_close_match_index(words, cacheDir = None):
+	''' Returns a CloseMatchIndex for the given words, reading it from (or writing it to) the cache directory if any.
+		Indexes are read-only once built, hence shared by all callers within a process. '''
+	words = list(words)
+	digest = words_digest(words)
+	if digest in INDEXES: return INDEXES[digest]
+	filePath = None if cacheDir is None else os.path.join(cacheDir, 'close_match_{}.pickle'.format(digest))
+	index = None if filePath is None else CloseMatchIndex.load(filePath)
+	if index is None:
+		index = CloseMatchIndex(words)
+		if filePath is not None:
+			try:
+				index.save(filePath)
+			except OSError as e:
+				logging.warning('Could not write close-match index to %s: %s', filePath, e)
+	INDEXES[digest] = index
+	return index
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming reader of uploaded Excel files (first sheet of xlsx or xls files).
+
+Rows are read one at a time and DataFrames of the requested number of rows
+are built as they are requested (as with pandas.read_csv with iterator=True),
+so that memory does not grow with the size of the sheet:
+    - xlsx: openpyxl in read-only mode parses the XML of the sheet as rows
+            are iterated over. The shared-string table (the text of string
+            cells, stored once for the workbook) is loaded when the workbook
+            is opened.
+    - xls: the legacy format (at most 65536 rows) is read with xlrd, which
+           loads the sheet at once.
+
+Values are the same as with pandas.read_excel(file, dtype=str): cells are
+converted the same way, and rows are parsed with the parser of pandas. As
+columns must be known from the first DataFrame, rows are padded to the width
+of the sheet as known before reading it (pandas pads rows to the widest row
+of the sheet): the number of columns of xls sheets, or the dimension that
+xlsx files declare, and at least the width of the header and of the first
+rows. Columns without a header are named as by pandas ("Unnamed: 2", ...).
+Rows wider than that (in xlsx files with a wrong or no dimension) raise a
+ValueError.
+"""
+
+import datetime
+import math
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+# First bytes of xlsx files (zip archives)
+XLSX_MAGIC = b'PK\x03\x04'
+
+
+def _convert_xlsx_cell(cell):
+    '''Value of an openpyxl cell (as converted by pandas)'''
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None:
+        return ''
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def _xlsx_rows(file):
+    '''Number of columns that an xlsx file declares for its first sheet (0 if
+    it declares none), and generator of the rows (lists of values) of the sheet'''
+    import openpyxl
+    book = openpyxl.load_workbook(file, read_only=True, data_only=True, keep_links=False)
+    sheet = book.worksheets[0]
+    width = sheet.max_column or 0
+    # Dimensions declared in files can be wrong: rows are read as they are
+    sheet.reset_dimensions()
+
+    def _rows():
+        try:
+            for row in sheet.rows:
+                yield [_convert_xlsx_cell(cell) for cell in row]
+        finally:
+            book.close()
+    return width, _rows()
+
+
+def _convert_xls_cell(value, typ, datemode):
+    '''Value of an xlrd cell (as converted by pandas)'''
+    import xlrd
+    if typ == xlrd.XL_CELL_DATE:
+        try:
+            value = xlrd.xldate.xldate_as_datetime(value, datemode)
+        except OverflowError:
+            return value
+        # Dates on the epoch (of the 1900 or 1904 date system) are times only
+        year = value.timetuple()[0:3]
+        if ((not datemode) and (year == (1899, 12, 31))) or (datemode and (year == (1904, 1, 1))):
+            value = datetime.time(value.hour, value.minute, value.second, value.microsecond)
+    elif typ == xlrd.XL_CELL_ERROR:
+        value = np.nan
+    elif typ == xlrd.XL_CELL_BOOLEAN:
+        value = bool(value)
+    elif (typ == xlrd.XL_CELL_NUMBER) and math.isfinite(value):
+        if int(value) == value:
+            value = int(value)
+    return value
+
+
+def _xls_rows(file):
+    '''Number of columns of the first sheet of an xls file, and generator of
+    its rows (lists of values)'''
+    import xlrd
+    book = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+    sheet = book.sheet_by_index(0)
+
+    def _rows():
+        try:
+            for i in range(sheet.nrows):
+                yield [_convert_xls_cell(value, typ, book.datemode) \
+                       for value, typ in zip(sheet.row_values(i), sheet.row_types(i))]
+        finally:
+            book.release_resources()
+    return sheet.ncols, _rows()
+
+
+class ExcelReader():
+    '''Reads the first sheet of an Excel file (binary file object) by chunks'''
+    def __init__(self, file):
+        if not file.seekable():
+            # Both formats need random access to the file
+            copy = tempfile.TemporaryFile()
+            shutil.copyfileobj(file, copy)
+            copy.seek(0)
+            file = copy
+        start = file.tell()
+        magic = file.read(len(XLSX_MAGIC))
+        file.seek(start)
+        self._sheet_width, self._rows = _xlsx_rows(file) if magic == XLSX_MAGIC else _xls_rows(file)
+
+        self.columns = None
+        self.width = None
+        self._num_empty_rows = 0 # Empty rows read but not returned yet
+        self._num_rows = 0 # Rows returned
+
+    def _next_rows(self, nrows):
+        '''The next nrows rows that are not empty (along with empty rows
+        before them), without trailing empty values'''
+        rows = []
+        for row in self._rows:
+            while row and (row[-1] == ''):
+                row.pop()
+            if not row:
+                # Empty rows at the end of the sheet are ignored
+                self._num_empty_rows += 1
+                continue
+            rows.extend([] for _ in range(self._num_empty_rows))
+            self._num_empty_rows = 0
+            rows.append(row)
+            if len(rows) >= nrows:
+                break
+        return rows
+
+    def _fit(self, row, line):
+        '''Row padded to the width of the sheet (line is the number of the
+        row in the sheet, for errors)'''
+        if len(row) > self.width:
+            # As pandas.read_csv does on rows with too many fields
+            raise ValueError('Error tokenizing data. Expected {0} fields in row {1} of the' \
+                             ' Excel sheet, saw {2}'.format(self.width, line, len(row)))
+        return row + [''] * (self.width - len(row))
+
+    def get_chunk(self, nrows):
+        '''DataFrame of the next nrows rows (raises StopIteration at the end
+        of the sheet, except for the first DataFrame)'''
+        header = self.columns is None
+        rows = self._next_rows(nrows + header)
+        if header:
+            self.width = max([len(row) for row in rows] + [self._sheet_width])
+        elif not rows:
+            raise StopIteration
+        first_line = self._num_rows + (not header) + 1
+        rows = [self._fit(row, first_line + i) for i, row in enumerate(rows)]
+
+        if header:
+            tab = TextParser(rows, header=0, dtype=str, skip_blank_lines=False).read() \
+                    if rows else pd.DataFrame()
+            self.columns = list(tab.columns)
+        else:
+            tab = TextParser(rows, header=None, names=self.columns, dtype=str,
+                             skip_blank_lines=False).read()
+        tab.index = pd.RangeIndex(self._num_rows, self._num_rows + len(tab))
+        self._num_rows += len(tab)
+        return tab
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming writer of xlsx files (for download).
+
+Rows are written by chunks with openpyxl in write-only mode: each row is
+serialized to the XML of its sheet (in a temporary file) as it is appended,
+and strings are written inline rather than in a shared-string table, so that
+memory does not grow with the number of rows written.
+
+Each sheet holds a subset of the columns of the DataFrames written. A sheet
+that reaches the row limit of Excel is continued in a new sheet (with the
+same header) named after it: "original_file", "original_file_2", ...
+"""
+
+import logging
+
+# Max number of rows of a sheet in Excel (including the header)
+EXCEL_MAX_ROWS = 1048576
+
+# Max number of characters of sheet names in Excel
+SHEET_NAME_MAX_LENGTH = 31
+
+
+def _clean(part_tab):
+    '''DataFrame with values as written to cells: None for missing values,
+    and strings without the control characters that xlsx files can not hold'''
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    part_tab = part_tab.astype(object)
+    for col in part_tab.columns:
+        is_str = part_tab[col].map(type) == str
+        if is_str.any():
+            part_tab.loc[is_str, col] = part_tab.loc[is_str, col] \
+                            .str.replace(ILLEGAL_CHARACTERS_RE.pattern, '', regex=True)
+    return part_tab.where(part_tab.notnull(), None)
+
+
+class XlsxWriter():
+    '''
+    Writer of xlsx files to which DataFrames can be written one at a time,
+    and which must be closed (for the file to be written).
+
+    INPUT:
+        - file_path: path of the xlsx file
+        - sheet_columns: list of (sheet name, columns of the sheet)
+        - max_rows: max number of rows of a sheet (including the header)
+    '''
+    def __init__(self, file_path, sheet_columns, max_rows=EXCEL_MAX_ROWS):
+        import openpyxl
+        self.file_path = file_path
+        self.book = openpyxl.Workbook(write_only=True)
+        self.max_rows = max_rows
+        # Sheets of the workbook in which each sheet is written (its parts)
+        self.sheets = [{'name': name, 'columns': list(columns), 'parts': []} \
+                       for name, columns in sheet_columns]
+        for sheet in self.sheets:
+            self._new_sheet(sheet)
+        self.nrows = 0
+
+    def _new_sheet(self, sheet):
+        '''Continues a sheet in a new sheet of the workbook'''
+        name = sheet['name'][:SHEET_NAME_MAX_LENGTH]
+        if sheet['parts']:
+            suffix = '_{0}'.format(len(sheet['parts']) + 1)
+            name = name[:SHEET_NAME_MAX_LENGTH - len(suffix)] + suffix
+            logging.info('Sheet {0} is full, continuing in sheet {1}'.format(sheet['name'], name))
+        part = self.book.create_sheet(name)
+        part.append(sheet['columns'])
+        sheet['parts'].append(part)
+        sheet['num_rows'] = 1
+
+    def write(self, part_tab):
+        for sheet in self.sheets:
+            values = _clean(part_tab[sheet['columns']])
+            for row in values.itertuples(index=False, name=None):
+                if sheet['num_rows'] >= self.max_rows:
+                    self._new_sheet(sheet)
+                sheet['parts'][-1].append(row)
+                sheet['num_rows'] += 1
+        self.nrows += len(part_tab)
+
+    def close(self):
+        # Continuations of a sheet follow it (rather than the sheets created
+        # before them)
+        for i, part in enumerate(part for sheet in self.sheets for part in sheet['parts']):
+            self.book.move_sheet(part.title, i - self.book.index(part))
+        self.book.save(self.file_path)
+
+
+def write_xlsx(file_path, tab_gen, sheet_columns, max_rows=EXCEL_MAX_ROWS):
+    '''Writes all DataFrames generated by tab_gen to an xlsx file (see
+    XlsxWriter) and returns the number of rows written'''
+    writer = XlsxWriter(file_path, sheet_columns, max_rows)
+    for i, part_tab in enumerate(tab_gen):
+        logging.debug('At part {0}'.format(i))
+        writer.write(part_tab)
+    writer.close()
+    return writer.nrows
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import csv, http.client, json, logging, math, os, re, threading, unidecode, urllib.parse
+import numpy as np
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from CONFIG import RESOURCE_PATH
+from lexicon_cache import cached_lexicon
+
+# Geocoding backends for French addresses, returning BAN-like features for address queries: each feature is a dict of
+# properties including 'type' (housenumber, street or municipality), 'label' and, depending on the type,
+# 'housenumber', 'street', 'postcode' and 'city' (same shape as the properties of api-adresse.data.gouv.fr results).
+
+# BAN extract (CSV file as distributed on adresse.data.gouv.fr, e.g. adresses-75.csv), relative to the resource
+# directory, from which the local backend builds its index
+BAN_EXTRACT_FILE = 'ban_adresses.csv'
+# Host of the BAN search API used by the HTTP backend
+BAN_API_HOST = 'api-adresse.data.gouv.fr'
+# Number of concurrent requests for batched lookups through the HTTP backend
+BAN_API_THREADS = 8
+# Timeout (in seconds) of requests to the BAN search API
+BAN_API_TIMEOUT = 10
+# HTTP statuses with which the BAN search API turns down requests (rate limiting, maintenance) rather than queries
+BAN_API_UNAVAILABLE_STATUSES = (429, 502, 503, 504)
+# Max number of features returned for a query (as the limit parameter of the BAN search API)
+SEARCH_LIMIT = 5
+
+class GeocodingBackend(ABC):
+	''' Interface of geocoding backends. '''
+	def search(self, query):
+		''' Returns the list of features matching an address query (None if the backend returned no result set, or an
+			invalid one). Raises ConnectionError if the backend can not be queried. '''
+		return self.search_all([query])[query]
+	@abstractmethod
+	def search_all(self, queries):
+		''' Returns a dict mapping each of the given address queries to its list of features (see search). '''
+
+class BanHttpBackend(GeocodingBackend):
+	''' Geocoding through the BAN search API, with one persistent connection per thread and batched lookups spread over
+		concurrent requests. '''
+	def __init__(self, host = BAN_API_HOST, threads = BAN_API_THREADS, timeout = BAN_API_TIMEOUT):
+		self.host = host
+		self.threads = threads
+		self.timeout = timeout
+		self.local = threading.local()
+		# Threads (keeping their connections alive across batches) and the process they were started in
+		self.executor = None
+		self.pid = None
+	def connection(self):
+		if getattr(self.local, 'connection', None) is None:
+			self.local.connection = http.client.HTTPConnection(self.host, timeout = self.timeout)
+		return self.local.connection
+	def fetch(self, query):
+		path = '/search/?q={}&limit={}'.format(urllib.parse.quote_plus(query), SEARCH_LIMIT)
+		for retry in (False, True):
+			try:
+				conn = self.connection()
+				conn.request('GET', path)
+				response = conn.getresponse()
+				body = response.read()
+				break
+			except (http.client.HTTPException, OSError) as e:
+				# The server may have closed the kept-alive connection: reconnect once
+				if self.local.connection is not None: self.local.connection.close()
+				self.local.connection = None
+				if retry: raise ConnectionError('Could not query {}: {}'.format(self.host, e)) from e
+		if response.status in BAN_API_UNAVAILABLE_STATUSES:
+			raise ConnectionError('{} is unavailable (HTTP status {})'.format(self.host, response.status))
+		if response.status != 200:
+			raise ValueError('{} returned HTTP status {} for "{}"'.format(self.host, response.status, query))
+		data = json.loads(body.decode('utf-8'))
+		if not data or 'features' not in data: return None
+		logging.debug('Returned %d results from %s for %s', len(data['features']), self.host, query)
+		return [point['properties'] for point in data['features'] if 'properties' in point]
+	def try_fetch(self, query):
+		''' Same as fetch, but an invalid response only leaves its query ungeocoded (None) rather than failing the batch.
+			Connection errors are raised, so that matchers count them as fatal and bail out. '''
+		try:
+			return self.fetch(query)
+		except ValueError as e:
+			logging.warning('Could not geocode "%s" through %s: %s', query, self.host, e)
+			return None
+	def search(self, query):
+		return self.try_fetch(query)
+	def search_all(self, queries):
+		queries = list(set(queries))
+		if len(queries) < 2 or self.threads < 2: return dict((q, self.try_fetch(q)) for q in queries)
+		if self.pid != os.getpid():
+			# Threads do not survive forking
+			self.executor = ThreadPoolExecutor(max_workers = self.threads)
+			self.pid = os.getpid()
+		return dict(zip(queries, self.executor.map(self.try_fetch, queries)))
+
+def address_tokens(s):
+	return re.findall('[a-z0-9]+', unidecode.unidecode(s).lower())
+
+# Length of the token prefixes used to look up tokens by prefix (e.g. abbreviated or truncated words)
+TOKEN_PREFIX_LENGTH = 3
+# Max number of features retrieved from the postings of a single token: features are only retrieved from the postings
+# of query tokens which are selective enough, the other query tokens only contribute to the scores of those features
+MAX_CANDIDATES = 5000
+
+class BanIndex(object):
+	''' In-memory index of the features (municipalities, streets and house numbers) of a BAN extract, with token postings
+		(sorted arrays of feature ids by token) and prefix postings (tokens by prefix). '''
+	def __init__(self, features):
+		# Features as (type, housenumber, street, postcode, city) tuples, by id
+		self.features = list(features)
+		postings = dict()
+		self.tokenCounts = np.zeros(len(self.features), dtype = np.uint8)
+		for (i, feature) in enumerate(self.features):
+			tokens = set(address_tokens(self.label(feature)))
+			self.tokenCounts[i] = min(len(tokens), 255)
+			for token in tokens:
+				if token not in postings: postings[token] = array('I')
+				postings[token].append(i)
+		self.postings = dict((token, np.frombuffer(ids, dtype = np.uint32)) for (token, ids) in postings.items())
+		self.prefixes = dict()
+		for token in self.postings:
+			self.prefixes.setdefault(token[:TOKEN_PREFIX_LENGTH], list()).append(token)
+		logging.info('Indexed %d BAN features (%d tokens)', len(self.features), len(self.postings))
+	@staticmethod
+	def from_csv(filePath):
+		''' Builds the index from a BAN CSV extract (semicolon-separated, with numero, rep, nom_voie, code_postal and
+			nom_commune columns). '''
+		municipalities, streets, housenumbers = set(), set(), list()
+		with open(filePath, encoding = 'utf-8') as f:
+			for row in csv.DictReader(f, delimiter = ';'):
+				street, postcode, city = row['nom_voie'], row['code_postal'], row['nom_commune']
+				municipalities.add(('municipality', '', '', postcode, city))
+				if not street: continue
+				streets.add(('street', '', street, postcode, city))
+				if row['numero'] and row['numero'] != '99999':
+					housenumbers.append(('housenumber', row['numero'] + row.get('rep', ''), street, postcode, city))
+		# Coarse-grained features come first, so that they are the ones retrieved from the truncated postings of frequent tokens
+		return BanIndex(sorted(municipalities) + sorted(streets) + housenumbers)
+	@staticmethod
+	def label(feature):
+		(kind, housenumber, street, postcode, city) = feature
+		return ' '.join(s for s in (housenumber, street, postcode, city) if s)
+	def properties(self, feature, score):
+		(kind, housenumber, street, postcode, city) = feature
+		props = {'type': kind, 'label': self.label(feature), 'postcode': postcode, 'city': city, 'score': score}
+		if housenumber: props['housenumber'] = housenumber
+		if street: props['street'] = street
+		props['name'] = ' '.join(s for s in (housenumber, street) if s) if street else city
+		return props
+	def token_postings(self, token):
+		''' Sorted ids of the features containing a query token, or else a token it is a prefix of. '''
+		if token in self.postings: return self.postings[token]
+		if len(token) < TOKEN_PREFIX_LENGTH: return np.zeros(0, dtype = np.uint32)
+		matches = [self.postings[t] for t in self.prefixes.get(token[:TOKEN_PREFIX_LENGTH], []) if t.startswith(token)]
+		if len(matches) < 1: return np.zeros(0, dtype = np.uint32)
+		return matches[0] if len(matches) == 1 else np.unique(np.concatenate(matches))
+	def search(self, query, limit = SEARCH_LIMIT):
+		tokens = list(set(address_tokens(query)))
+		if len(tokens) < 1: return []
+		postings = [self.token_postings(token) for token in tokens]
+		# Query tokens missing from the index get the highest weight, so that they lower the scores of all features
+		weights = np.array([math.log(1 + len(self.features) / max(len(ids), 1)) for ids in postings])
+		order = np.argsort(-weights, kind = 'stable')
+		# Retrieve candidates from the most selective tokens
+		candidates = np.zeros(0, dtype = np.uint32)
+		for k in order:
+			if len(postings[k]) < 1: continue
+			if len(candidates) > 0 and len(candidates) + len(postings[k]) > MAX_CANDIDATES: break
+			candidates = np.union1d(candidates, postings[k][:MAX_CANDIDATES])
+		if len(candidates) < 1: return []
+		matched = np.array([np.isin(candidates, ids, assume_unique = True) for ids in postings])
+		# Penalize feature tokens missing from the query, so that the coarsest matching feature ranks first
+		scores = weights.dot(matched) / weights.sum() - 0.01 * (self.tokenCounts[candidates] - matched.sum(axis = 0))
+		best = np.argsort(-scores, kind = 'stable')[:limit]
+		return [self.properties(self.features[candidates[i]], round(float(scores[i]), 4)) for i in best if scores[i] > 0]
+
+@cached_lexicon(0, dependencies = ('BanIndex',))
+def ban_index(fileName):
+	''' Builds the index of a BAN extract (given by file name relative to the resource directory). '''
+	return BanIndex.from_csv(os.path.join(RESOURCE_PATH, fileName))
+
+class BanIndexBackend(GeocodingBackend):
+	''' Offline geocoding against the index of a local BAN extract. '''
+	def __init__(self, fileName = BAN_EXTRACT_FILE):
+		self.index = ban_index(fileName)
+	def search(self, query):
+		return self.index.search(query)
+	def search_all(self, queries):
+		return dict((q, self.index.search(q)) for q in set(queries))
+
+GEOCODING_BACKENDS = {'ban_index': BanIndexBackend, 'ban_http': BanHttpBackend}
+# Name of the backend used by default (None to use the local BAN index if the extract is present, the BAN search API
+# otherwise)
+GEOCODING_BACKEND = None
+
+def default_backend():
+	name = GEOCODING_BACKEND
+	if name is None:
+		name = 'ban_index' if os.path.exists(os.path.join(RESOURCE_PATH, BAN_EXTRACT_FILE)) else 'ban_http'
+	logging.info('Using geocoding backend %s', name)
+	return GEOCODING_BACKENDS[name]()
@@ -3,7 +3,7 @@ import unicodedata, unidecode
 from collections import defaultdict, Counter
 
 from fuzzywuzzy import fuzz
-from postal.parser import parse_address
+import address_parsing
 import enchant
 
 DICTS = [ enchant.Dict("en_US") ]
@@ -51,7 +51,7 @@ def enrich_item_with_variants(item):
 		item['acros'].add(acro)
 
 	# Addresses (French or foreign)
-	addr = parse_address(label)
+	addr = address_parsing.parse_address(label)
 	features = dict((f, v) for (v, f) in addr)
 	if len(REQUIRED_ADDR_FEATURES | features.keys()) > 0:
 		item['address_as_label'] = label
@@ -496,8 +496,10 @@ def init_gridding():
 					GRID_DATA['countries'][justCase(country_fr)] = country_en
 					GRID_DATA['countries'][justCase(country_en)] = country_en
 		with open('resource/grid.csv') as refFile:
-			ref_reader =  csv.DictReader(refFile, delimiter = ',', quotechar = '"')
-			for refRow in ref_reader:
+			ref_rows = list(csv.DictReader(refFile, delimiter = ',', quotechar = '"'))
+			# Parse all reference labels as addresses at once, so that enrich_item_with_variants finds them cached
+			address_parsing.parse_addresses(refRow['Name'] for refRow in ref_rows)
+			for refRow in ref_rows:
 				label = refRow['Name']
 				tokens = validateTokens(label)
 				grid = refRow['ID']
@@ -564,6 +566,7 @@ def init_gridding():
 def grid_label_set(labels):
 	src_items_by_label = dict()
 	token_count = Counter()
+	address_parsing.parse_addresses(labels)
 	for doc_id, label in enumerate(labels):
 		tokens = validateTokens(label)
 		cities = set([justCase(t) for t in tokens]) | GRID_DATA['cities']
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse, functools, hashlib, inspect, logging, os, pickle, shutil, time
+
+from CONFIG import RESOURCE_PATH, DYNAMIC_RESOURCE_PATH
+from storage import atomic_write
+
+# Persistent cache for lexical structures (normalized lexicon maps, variant maps) which are otherwise rebuilt from the
+# resource files whenever value matchers get created, i.e. in every API or worker process.
+
+# Each entry is a pickle file, keyed on the contents of the resource files and other arguments it was built from, as
+# well as on the source code of the building function (and of the helpers it is declared to depend on). Entries are
+# written atomically and never modified afterwards, so that any number of processes can share the cache directory.
+LEXICON_CACHE_PATH = os.path.join(DYNAMIC_RESOURCE_PATH, 'lexicon')
+# If set to False, lexical structures will be built from scratch (and not stored)
+USE_LEXICON_CACHE = True
+# Version of the layout of cache entries, which is part of their keys rather than of their files (see versioned pickle
+# files in storage.py), also to be bumped when the code building them changes outside of the functions whose source is
+# hashed
+LEXICON_CACHE_VERSION = 2
+# Max total size of the cache (in bytes): when exceeded, the entries least recently used are removed (entries are
+# touched whenever they are loaded)
+LEXICON_CACHE_MAX_SIZE = 256 * 2 ** 20
+
+# Digests of files already hashed by this process, by path (along with the modification time and size at that point)
+FILE_DIGESTS = dict()
+
+def file_digest(filePath):
+	''' SHA-1 digest of a file's contents (memoized as long as the file's modification time and size do not change). '''
+	st = os.stat(filePath)
+	stamp = (st.st_mtime_ns, st.st_size)
+	if filePath in FILE_DIGESTS and FILE_DIGESTS[filePath][0] == stamp: return FILE_DIGESTS[filePath][1]
+	h = hashlib.sha1()
+	with open(filePath, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''): h.update(block)
+	FILE_DIGESTS[filePath] = (stamp, h.hexdigest())
+	return FILE_DIGESTS[filePath][1]
+
+def update_digest(h, obj):
+	''' Feeds a canonical serialization of obj (built from strings, numbers, None and collections thereof) into h,
+		such that equal sets or dicts yield the same digest regardless of their iteration order. '''
+	if isinstance(obj, (set, frozenset)):
+		h.update(b'S%d:' % len(obj))
+		h.update('\0'.join(sorted(map(repr, obj))).encode('utf-8', 'surrogatepass'))
+	elif isinstance(obj, dict):
+		h.update(b'D%d:' % len(obj))
+		for k in sorted(obj.keys(), key = repr):
+			update_digest(h, k)
+			update_digest(h, obj[k])
+	elif isinstance(obj, (list, tuple)) or type(obj).__name__ in ('dict_keys', 'dict_values'):
+		h.update(b'L:')
+		for v in obj: update_digest(h, v)
+		h.update(b'$')
+	else:
+		h.update(repr(obj).encode('utf-8', 'surrogatepass') + b'\0')
+
+def code_digest(funcs):
+	''' SHA-1 digest of the source code of functions or classes (of their bytecode if the source is not available). '''
+	h = hashlib.sha1()
+	for func in funcs:
+		try:
+			h.update(inspect.getsource(func).encode('utf-8'))
+		except (OSError, TypeError):
+			h.update(func.__code__.co_code)
+	return h.hexdigest()
+
+def entry_key(func, codeDigest, args, kwargs, fileArgs):
+	''' Cache key for the result of func(*args, **kwargs), where arguments listed in fileArgs (by position) are names of
+		resource files that get hashed by contents. '''
+	h = hashlib.sha1('{}|{}.{}|{}'.format(LEXICON_CACHE_VERSION, func.__module__, func.__name__, codeDigest).encode('utf-8'))
+	for (i, a) in enumerate(args):
+		if i in fileArgs: h.update(file_digest(os.path.join(RESOURCE_PATH, a)).encode('utf-8'))
+		else: update_digest(h, a)
+	update_digest(h, kwargs)
+	return h.hexdigest()
+
+def load_entry(filePath):
+	''' Reads a cache entry, returns None if it is missing or unreadable. '''
+	try:
+		with open(filePath, 'rb') as f:
+			value = pickle.load(f)
+		os.utime(filePath)
+		return value
+	except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError) as e:
+		if not isinstance(e, FileNotFoundError): logging.warning('Could not load lexicon cache entry %s: %s', filePath, e)
+		return None
+
+def save_entry(filePath, value):
+	try:
+		os.makedirs(os.path.dirname(filePath), exist_ok = True)
+		with atomic_write(filePath, 'wb') as f:
+			pickle.dump(value, f, protocol = pickle.HIGHEST_PROTOCOL)
+	except (OSError, pickle.PicklingError) as e:
+		logging.warning('Could not write lexicon cache entry %s: %s', filePath, e)
+
+def prune_cache(keep = None, maxSize = None):
+	''' Removes the entries least recently used until the cache fits in maxSize bytes (LEXICON_CACHE_MAX_SIZE if None),
+		except for the entry at path keep. '''
+	if maxSize is None: maxSize = LEXICON_CACHE_MAX_SIZE
+	entries = []
+	try:
+		with os.scandir(LEXICON_CACHE_PATH) as it:
+			for e in it:
+				try:
+					st = e.stat()
+				except OSError:
+					continue # Removed by another process meanwhile
+				entries.append((st.st_mtime, st.st_size, e.path))
+	except OSError:
+		return
+	size = sum(e[1] for e in entries)
+	for (mtime, entrySize, filePath) in sorted(entries):
+		if size <= maxSize: break
+		if filePath == keep: continue
+		try:
+			os.remove(filePath)
+			logging.info('Removed lexicon cache entry %s', filePath)
+		except OSError:
+			pass
+		size -= entrySize
+
+def cached_lexicon(*fileArgs, dependencies = ()):
+	''' Decorator persisting the results of a function building a lexical structure in the lexicon cache.
+
+		Parameters:
+		fileArgs positions of the arguments holding resource file names (relative to the resource directory)
+		dependencies names of the functions or classes of the same module (other than the decorated function) doing the
+			actual building, whose source is part of the cache key (any other change to the building code requires
+			bumping LEXICON_CACHE_VERSION) '''
+	def decorator(func):
+		codeDigests = []
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not USE_LEXICON_CACHE: return func(*args, **kwargs)
+			# Dependencies are looked up on first use, since they may be defined after the decorated function
+			if not codeDigests: codeDigests.append(code_digest([func] + [func.__globals__[d] for d in dependencies]))
+			filePath = os.path.join(LEXICON_CACHE_PATH, '{}_{}.pickle'.format(func.__name__,
+				entry_key(func, codeDigests[0], args, kwargs, fileArgs)))
+			# Each process gets its own copy of the structure, since callers are free to modify it
+			value = load_entry(filePath)
+			if value is None:
+				value = func(*args, **kwargs)
+				save_entry(filePath, value)
+				prune_cache(keep = filePath)
+			return value
+		return wrapper
+	return decorator
+
+def clear_cache():
+	shutil.rmtree(LEXICON_CACHE_PATH, ignore_errors = True)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Builds the lexicon cache used by value matchers (see preprocess_fields_v3.py).')
+	parser.add_argument('--clear', action = 'store_true', help = 'remove existing cache entries first')
+	args = parser.parse_args()
+	if args.clear: clear_cache()
+	t0 = time.time()
+	import preprocess_fields_v3
+	t1 = time.time()
+	preprocess_fields_v3.value_matchers()
+	t2 = time.time()
+	entries = os.listdir(LEXICON_CACHE_PATH) if os.path.isdir(LEXICON_CACHE_PATH) else []
+	print('Imported preprocess_fields_v3 in {:.2f} s, built value matchers in {:.2f} s'.format(t1 - t0, t2 - t1))
+	print('{} cache entries ({:.1f} MB) in {}'.format(len(entries),
+		sum(os.path.getsize(os.path.join(LEXICON_CACHE_PATH, e)) for e in entries) / 1e6, LEXICON_CACHE_PATH))
@@ -13,18 +13,27 @@ Examples of missing data that can be found:
     - 'NO_ADDR'
     - '999999'
     - 'NONE'
-    - '-' 
-    
-TODO:
-    - For probable missing values, check entire file
+    - '-'
+
+Most frequent values are looked at over the entire file when the summaries
+built on upload (TopValuesSummaries) are available, and over the table
+passed for inference otherwise.
 """
 
+import json
+import logging
 import string
 import numpy as np
 import pandas as pd
 
+from storage import atomic_write
+
 DEFAULT_THRESH = 0.6
 
+# Max number of values tracked per column by top value summaries (should be
+# well above num_top_values so that the top values are exact in practice)
+TOP_VALUES_CAPACITY = 100
+
 def mv_from_letter_repetition(top_values, score=0.7):
     """Checks for unusual repetition of characters as in XX or 999999"""
     # Compute number of unique characters for each value
@@ -152,6 +161,106 @@ def compute_all_top_values(tab, num_top_values):
     return all_top_values
 
 
+class TopValuesSummary():
+    """
+    Approximate counts of the most frequent values of a column, updated chunk
+    by chunk in bounded memory (Space-Saving): at most `capacity` values are
+    tracked, and a value that starts being tracked is given the largest count
+    of the values evicted so far (`floor`) on top of its own count. Counts are
+    thus exact as long as nothing was evicted, and otherwise overestimate
+    true counts by at most `floor`.
+    """
+    def __init__(self, capacity=TOP_VALUES_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64) # By value, in order of first appearance
+        self.floor = 0
+        self.total = 0 # Number of non-null values seen
+
+    def update(self, column):
+        '''Adds the values of a pandas Series to the summary'''
+        counts = column.value_counts()
+        self.total += int(counts.sum())
+        new = counts.index.difference(self.counts.index, sort=False)
+        self.counts = pd.concat([self.counts.add(counts, fill_value=0).loc[self.counts.index],
+                                 counts[new] + self.floor]).astype(np.int64)
+        if len(self.counts) > self.capacity:
+            order = self.counts.sort_values(ascending=False, kind='stable').index
+            self.floor = max(self.floor, int(self.counts[order[self.capacity:]].max()))
+            self.counts = self.counts[self.counts.index.isin(order[:self.capacity])]
+
+    def top_values(self, num_top_values):
+        '''Most frequent values with their frequencies (as in value_counts(True))'''
+        top_values = self.counts.sort_values(ascending=False, kind='stable').head(num_top_values)
+        return top_values / max(self.total, 1)
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'floor': self.floor, 'total': self.total,
+                'values': list(self.counts.index), 'counts': [int(x) for x in self.counts]}
+
+    @classmethod
+    def from_dict(cls, summary_dict):
+        summary = cls(summary_dict['capacity'])
+        summary.floor = summary_dict['floor']
+        summary.total = summary_dict['total']
+        summary.counts = pd.Series(summary_dict['counts'], index=summary_dict['values'], dtype=np.int64)
+        return summary
+
+
+class TopValuesSummaries():
+    """
+    Top value summaries (TopValuesSummary) for all columns of a file, built
+    while the file is read on upload and stored with the project, next to the
+    uploaded file.
+    """
+    FILE_SUFFIX = '__top_values.json'
+
+    def __init__(self, file_path=None, capacity=TOP_VALUES_CAPACITY):
+        self.file_path = file_path
+        self.capacity = capacity
+        self.summaries = dict()
+
+    def update(self, tab):
+        '''Adds the values of a chunk of the file (pandas DataFrame) and returns it'''
+        for col in tab.columns:
+            if col not in self.summaries:
+                self.summaries[col] = TopValuesSummary(self.capacity)
+            self.summaries[col].update(tab[col])
+        return tab
+
+    def covers(self, columns):
+        '''Whether there is a summary for all of the given columns'''
+        return all(col in self.summaries for col in columns)
+
+    def compute_all_top_values(self, columns, num_top_values):
+        '''Same as compute_all_top_values, over the entire file'''
+        return {col: self.summaries[col].top_values(num_top_values) for col in columns}
+
+    @classmethod
+    def load(cls, file_path):
+        '''Reads the summaries stored at file_path (None if missing or unreadable)'''
+        try:
+            with open(file_path) as f:
+                summaries_dict = json.load(f)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning('Could not load top value summaries {0}: {1}'.format(file_path, e))
+            return None
+        summaries = cls(file_path)
+        summaries.summaries = {col: TopValuesSummary.from_dict(summary_dict)
+                               for col, summary_dict in summaries_dict.items()}
+        return summaries
+
+    def save(self):
+        '''Writes the summaries (atomically)'''
+        if self.file_path is None:
+            return
+        try:
+            with atomic_write(self.file_path) as w:
+                json.dump({col: summary.to_dict() for col, summary in self.summaries.items()}, w)
+        except OSError as e:
+            logging.warning('Could not write top value summaries {0}: {1}'.format(self.file_path, e))
+
+
 
 def correct_score(list_of_possible_mvs, probable_mvs):
     """
@@ -187,11 +296,14 @@ def correct_score(list_of_possible_mvs, probable_mvs):
     return new_list_of_possible_mvs
 
 
-def infer_mvs(tab, params=None):
+def infer_mvs(tab, params=None, summaries=None):
     """
     API MODULE
-    
+
     Run mv inference processes for each column and for the entire table
+
+    If summaries (TopValuesSummaries of the entire file) are given, the most
+    frequent values are taken from them rather than from tab.
     """
     PROBABLE_MVS = ['nan', 'none', 'na', 'n/a', '\\n', ' ', 'non renseigne', \
                     'nr', 'no value', 'null', 'missing value']
@@ -206,8 +318,11 @@ def infer_mvs(tab, params=None):
     num_top_values = params.get('num_top_values', 10)
     
     # Compute most frequent values per column
-    all_top_values = compute_all_top_values(tab, num_top_values)
-    
+    if summaries is not None:
+        all_top_values = summaries.compute_all_top_values(tab.columns, num_top_values)
+    else:
+        all_top_values = compute_all_top_values(tab, num_top_values)
+
     col_mvs = dict()
     # Look at each column and infer mv
     for col, top_values in all_top_values.items():
@@ -265,29 +380,25 @@ def replace_mvs(tab, params):
     # Replace
     assert sorted(list(mvs_dict.keys())) == ['all', 'columns']
 
-    # Run information
-    modified = pd.DataFrame(False, index=tab.index, columns=tab.columns)
-
-    for mv in mvs_dict['all']:
-        val, score = mv['val'], mv['score']
-        #        run_info['replace_num']['all'][val] = 0
-        if score >= thresh:
-            # Metrics
-            modified = modified | (tab == val)
-            
-            # Do transformation
-            tab.replace(val, np.nan, inplace=True)
-    
+    # Gather values to replace by column (values in 'all' apply to every column).
+    # Columns that are not loaded (ex: not selected) are skipped
+    all_vals = [mv['val'] for mv in mvs_dict['all'] if mv['score'] >= thresh]
+    col_vals = {col: list(all_vals) for col in tab.columns}
     for col, mv_values in mvs_dict['columns'].items():
-        for mv in mv_values:
-            val, score = mv['val'], mv['score']
-            if score >= thresh:
-                # Metrics
-                if tab[col].notnull().any():
-                    modified[col] = modified[col] | (tab[col] == val)
-                # Do transformation
-                tab[col].replace(val, np.nan, inplace=True)
-    
+        if col in col_vals:
+            col_vals[col].extend(mv['val'] for mv in mv_values if mv['score'] >= thresh)
+
+    # Run information: one mask per column, which is also used to replace
+    modified = np.zeros(tab.shape, dtype=bool)
+    for i, (col, vals) in enumerate(col_vals.items()):
+        if vals:
+            modified[:, i] = (tab[col].isin(vals) & tab[col].notnull()).values
+    modified = pd.DataFrame(modified, index=tab.index, columns=tab.columns)
+
+    # Do transformation
+    for col in modified.columns[modified.values.any(axis=0)]:
+        tab[col] = tab[col].mask(modified[col])
+
     return tab, modified
 
 
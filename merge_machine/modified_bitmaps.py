@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compressed storage of the __MODIFIED columns of data files.
+
+Transform modules flag the values they modify in boolean <col>__MODIFIED
+columns, in which few values are usually True. Rather than being written in
+data files (which doubles their width), these columns are stored as run-length
+encoded bitmaps in a file next to the data file (FILE__modified.npz): for each
+column, the sorted bounds of the runs of modified rows ([start_0, end_0,
+start_1, end_1, ...], with ends excluded).
+
+Storage backends (storage.py) expand bitmaps back to columns when data is read,
+and modification counts are computed from the runs without reading data.
+"""
+
+import os
+
+import numpy as np
+
+MODIFIED_SUFFIX = '__modified.npz'
+
+
+def modified_path(file_path):
+    '''Path of the bitmaps of a data file'''
+    return file_path + MODIFIED_SUFFIX
+
+
+def is_modified_column(col):
+    return '__MODIFIED' in col
+
+
+def _bounds(values):
+    '''Bounds of the runs of True in an array of booleans'''
+    diff = np.diff(np.concatenate(([0], values.astype(np.int8), [0])))
+    return np.flatnonzero(diff)
+
+
+class ModifiedBitmaps():
+    '''Bitmaps of the __MODIFIED columns of a data file'''
+    def __init__(self, columns=None, nrows=0, bounds=None):
+        # All columns of the data file (in order)
+        self.columns = list(columns) if columns is not None else None
+        self.nrows = nrows
+        # Bounds of runs by column (as a list of arrays, joined when needed)
+        self._bounds = {col: [b] for col, b in (bounds or {}).items()}
+
+    @property
+    def modified_columns(self):
+        return [col for col in self.columns if col in self._bounds]
+
+    def append(self, part_tab):
+        '''Adds the rows of part_tab and returns it without __MODIFIED columns'''
+        if self.columns is None:
+            self.columns = list(part_tab.columns)
+        for col in filter(is_modified_column, part_tab.columns):
+            values = part_tab[col].to_numpy(dtype=bool, na_value=False)
+            self._bounds.setdefault(col, []).append(_bounds(values) + self.nrows)
+        self.nrows += len(part_tab)
+        return part_tab[[col for col in part_tab.columns if not is_modified_column(col)]]
+
+    def bounds(self, col):
+        '''Bounds of the runs of modified rows in a column'''
+        parts = self._bounds[col]
+        if len(parts) != 1:
+            bounds = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            # Merge runs that end where the next one starts (across chunks)
+            joined = np.flatnonzero(bounds[1:-1:2] == bounds[2::2])
+            bounds = np.delete(bounds, np.concatenate((2 * joined + 1, 2 * joined + 2)))
+            self._bounds[col] = [bounds]
+        return self._bounds[col][0]
+
+    def expand(self, col, start, stop):
+        '''Values of a __MODIFIED column for rows start to stop (excluded)'''
+        bounds = self.bounds(col)
+        i = np.searchsorted(bounds, start, side='right')
+        j = np.searchsorted(bounds, stop, side='left')
+        diff = np.zeros(stop - start + 1, dtype=np.int8)
+        if i % 2:
+            # start is within a run
+            diff[0] = 1
+        # Bounds are strictly increasing: starts at even positions, ends at odd ones
+        is_start = (np.arange(i, j) % 2) == 0
+        diff[bounds[i:j][is_start] - start] += 1
+        diff[bounds[i:j][~is_start] - start] -= 1
+        return np.cumsum(diff[:-1]) > 0
+
+    def counts(self):
+        '''Number of modified values by column (without the __MODIFIED suffix)'''
+        return {col.split('__MODIFIED')[0]: int((self.bounds(col)[1::2] - self.bounds(col)[0::2]).sum()) \
+                for col in self.modified_columns}
+
+    @classmethod
+    def concat(cls, all_bitmaps):
+        '''Bitmaps of the files of all_bitmaps put end to end'''
+        bitmaps = cls(all_bitmaps[0].columns)
+        for other in all_bitmaps:
+            for col in other.modified_columns:
+                bitmaps._bounds.setdefault(col, []).append(other.bounds(col) + bitmaps.nrows)
+            bitmaps.nrows += other.nrows
+        return bitmaps
+
+    def save(self, file_path):
+        arrays = {'runs_{0}'.format(i): self.bounds(col) \
+                  for i, col in enumerate(self.modified_columns)}
+        with open(file_path, 'wb') as f:
+            np.savez_compressed(f, columns=np.array(self.columns, dtype=str),
+                                modified_columns=np.array(self.modified_columns, dtype=str),
+                                nrows=self.nrows, **arrays)
+
+    @classmethod
+    def load(cls, file_path):
+        '''Bitmaps saved in file_path (None if there is no such file)'''
+        if not os.path.isfile(file_path):
+            return None
+        with np.load(file_path) as f:
+            bounds = {str(col): f['runs_{0}'.format(i)] \
+                      for i, col in enumerate(f['modified_columns'])}
+            return cls([str(col) for col in f['columns']], int(f['nrows']), bounds)
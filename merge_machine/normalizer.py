@@ -6,7 +6,6 @@ Created on Fri Apr 21 19:39:45 2017
 @author: leo
 
 """
-import io
 import itertools
 import logging
 import os
@@ -17,11 +16,27 @@ import pandas as pd
 from werkzeug.utils import secure_filename
 
 from abstract_data_project import ESAbstractDataProject, MINI_PREFIX
+from chunk_planner import PLANNING_ROWS
 from CONFIG import NORMALIZE_DATA_PATH
+from excel_reader import ExcelReader
+from missing_values import TopValuesSummaries
+from sampling import RowSample
+from sniffer import read_sample, sniff
 
 from MODULES import NORMALIZE_MODULES, NORMALIZE_MODULE_ORDER, NORMALIZE_MODULE_ORDER_log # TODO: think about these...
 
 
+def _iter_chunks(tab_part, reader, chunksize):
+    '''Generates tab_part, then DataFrames of chunksize rows from reader 
+    (with get_chunk, as pandas.read_csv with iterator=True)'''
+    yield tab_part
+    while True:
+        try:
+            yield reader.get_chunk(chunksize)
+        except StopIteration:
+            break
+
+
 class Normalizer(ESAbstractDataProject):
     """
     Abstract class to deal with data, data transformation, and metadata.
@@ -41,6 +56,7 @@ class Normalizer(ESAbstractDataProject):
     MODULES = NORMALIZE_MODULES
     MODULE_ORDER = NORMALIZE_MODULE_ORDER
     MODULE_ORDER_log = NORMALIZE_MODULE_ORDER_log
+    INTERMEDIATE_MODULES = ['replace_mvs', 'recode_types']
     CHARS_TO_REPLACE = ['\(', '\)', '\\', '\"', '/', "\'"] # Format for regex
     
 #==============================================================================
@@ -133,7 +149,7 @@ class Normalizer(ESAbstractDataProject):
     def path_to_last_written(self, module_name=None, file_name=None, before_module=None):
         (module_name, file_name) = self.get_last_written(module_name,
                                                         file_name, before_module)
-        path = self.path_to(module_name, file_name)
+        path = self.path_to_csv(module_name, file_name)
         return path
         
     def safe_filename(self, file_name, ext='.csv'):
@@ -156,86 +172,49 @@ class Normalizer(ESAbstractDataProject):
 
     def read_csv(self, file):
         '''
-        Read CSV and perform inference on streaming file
+        Read CSV and perform inference on streaming file. The encoding and 
+        separator are detected from the first bytes of the file (see 
+        sniffer.py), which is then parsed once.
         
         /!\ Use only on upload. Otherwise, look into _static_load_data in parent
         class        
         '''
-        ENCODINGS = ['utf-8', 'ISO-8859-1', 'windows-1252']
-        
-        first_lines = b''.join([file.readline() for _ in range(self.CHUNKSIZE)])
-        could_read = False    
-        #for sep_arg in [None, ',']: # Fix for pandas that can't find separators for single columns
-        for encoding in ENCODINGS:
-            best_sep = None
-            best_sep_num_cols = 0    
-            for sep in [';', ',', '\t']:
-                try:
-                    first_lines_io = io.BytesIO(first_lines)
-                    tab_part = pd.read_csv(first_lines_io, 
-                                           sep=sep, 
-                                           encoding=encoding, 
-                                           dtype=str)
-                    columns = tab_part.columns
-                    print(len(columns))
-                    
-                    if len(columns) >= best_sep_num_cols:
-                        best_sep = sep
-                        best_columns = columns
-                        best_sep_num_cols = len(columns)
-                    could_read = True
-                    
-                except Exception as e:
-                    logging.info(e)
-                    
-            # If one or more separators were valid with this encoding
-            if could_read:    
-                break
-       
-        else:
-            raise Exception('Separator and/or Encoding not detected. Try uploading' \
-                          + ' a csv with "," as separator with utf-8 encoding')                
-
-        if sep != best_sep:
-            first_lines_io = io.BytesIO(first_lines)
-            tab_part = pd.read_csv(first_lines_io, 
-                                   sep=best_sep, 
-                                   encoding=encoding, 
-                                   dtype=str)   
-        try:
-            
-         
-            tab_next = pd.read_csv(file, 
-                                 sep=best_sep, 
-                                 encoding=encoding,
-                                 dtype=str,
-                                 header=None,
-                                 chunksize=self.CHUNKSIZE)
-            tab = itertools.chain([tab_part], tab_next)
-        except:
-            tab = itertools.chain([tab_part])  
+        sample, file = read_sample(file)
+        encoding, sep = sniff(sample)
         
+        reader = pd.read_csv(file, 
+                             sep=sep, 
+                             encoding=encoding,
+                             dtype=str,
+                             iterator=True)
         
+        # Size the chunks that follow from the first rows
+        tab_part = reader.get_chunk(PLANNING_ROWS)
+        columns = tab_part.columns
+        chunksize = self._chunksize_for(tab_part)
+        self.mem_data_info['chunksize'] = chunksize
         
-        tab = (self._clean_header(self.assign_columns(tab_part, best_columns)) for tab_part in tab)
+        tab = _iter_chunks(tab_part, reader, chunksize)
         
-        print(tab, best_sep, encoding, self._clean_column_names(best_columns))
-        return tab, best_sep, encoding, self._clean_column_names(best_columns)
-    
+        tab = (self._clean_header(tab_part) for tab_part in tab)
+        
+        logging.info('Detected separator {0} and encoding {1}'.format(repr(sep), encoding))
+        return tab, sep, encoding, self._clean_column_names(columns)
+
     def read_excel(self, file):
-        # TODO: add iterator and return columns
-        excel_tab = pd.read_excel(file, dtype=str)
-        columns = excel_tab.columns
-        
-        def make_gen(excel_tab, chunksize):
-            cursor = 0
-            chunk = excel_tab.iloc[:chunksize]
-            while chunk.shape[0]:
-                yield chunk
-                cursor += chunksize
-                chunk = excel_tab.iloc[cursor:cursor+chunksize]
-        tab = make_gen(excel_tab, self.CHUNKSIZE) 
-    
+        '''
+        Read the first sheet of an Excel file (xlsx or xls) on streaming file
+        (see excel_reader.py)
+        '''
+        reader = ExcelReader(file)
+        
+        # Size the chunks that follow from the first rows
+        tab_part = reader.get_chunk(PLANNING_ROWS)
+        columns = tab_part.columns
+        chunksize = self._chunksize_for(tab_part)
+        self.mem_data_info['chunksize'] = chunksize
+        
+        tab = _iter_chunks(tab_part, reader, chunksize)
         tab = (self._clean_header(tab_part) for tab_part in tab)
     
         return tab, None, None, self._clean_column_names(columns)
@@ -287,6 +266,16 @@ class Normalizer(ESAbstractDataProject):
             self.mem_data, sep, encoding, columns = self.read_excel(file)
             file_type = 'excel'
         
+        # Summarize the most frequent values of the entire file as it is read,
+        # for missing value inference (written after the data)
+        summaries = TopValuesSummaries(self.path_to('INIT', file_name + TopValuesSummaries.FILE_SUFFIX))
+        self.mem_data = (summaries.update(part_tab) for part_tab in self.mem_data)
+        
+        # Sample rows of the entire file as it is read, for samplers and MINI
+        # files (written after the data)
+        sample = RowSample(self.path_to('INIT', file_name + RowSample.FILE_SUFFIX))
+        self.mem_data = (sample.update(part_tab) for part_tab in self.mem_data)
+        
         
         if any('__' in col for col in columns):
             raise ValueError('Column names cannot contain "__". Please rename ' \
@@ -335,6 +324,8 @@ class Normalizer(ESAbstractDataProject):
         
         # write data and log
         config_dict['nrows'] = self.write_data()
+        summaries.save()
+        sample.save()
         
         self.metadata['files'][file_name]['nrows'] = config_dict['nrows']
 
@@ -396,10 +387,13 @@ class Normalizer(ESAbstractDataProject):
         self._write_metadata()
         
     
-    def concat_with_init(self):
+    def concat_with_init(self, og_tab=None):
         '''
         Concatenates original table to data in memory (changes column names as well)
         
+        og_tab: generator of the chunks of the original table, lining up with 
+                the chunks in memory (read from INIT if None)
+        
         TODO: merge with transform
         '''
         
@@ -414,9 +408,11 @@ class Normalizer(ESAbstractDataProject):
         log = self._init_active_log('concat_with_init', 'transform')
     
         og_file_name = self.mem_data_info['file_name']
-        og_file_path = self.path_to('INIT', og_file_name)
-
-        og_tab = self._static_load_data(og_file_path, None, None)
+        if og_tab is None:
+            og_file_path = self.path_to('INIT', og_file_name)
+            # Chunks of the same size as those in memory, to line up
+            og_tab = self._skip_resumed_rows(self._static_load_data(og_file_path, None, None,
+                                                self.mem_data_info.get('chunksize')))
         
         def _rename_column(col):
             if '__' in col:
@@ -426,7 +422,7 @@ class Normalizer(ESAbstractDataProject):
     
         def _my_concat(og_data, data):
             data.columns = [_rename_column(col) for col in data.columns]
-            data = pd.concat([og_data, data], 1)
+            data = pd.concat([og_data, data], axis=1)
         
             # This should be same as selected columns: TODO: replace here
             base_modified_columns = set(x.split('__', 1)[0] for x in data.columns)
@@ -445,6 +441,8 @@ class Normalizer(ESAbstractDataProject):
         self.mem_data = (_my_concat(og_data, data) for og_data, data in zip(og_tab, self.mem_data))
         
         self.mem_data_info['module_name'] = 'concat_with_init'
+        if 'transforms' in self.mem_data_info:
+            self.mem_data_info['transforms'].append(['concat_with_init', None])
         
         run_info = {} # TODO: check specifications for run_info
 
@@ -468,51 +466,72 @@ class Normalizer(ESAbstractDataProject):
         else:
             return super().transform(module_name, params)
             
-    def run_all_transforms(self):
+    def run_all_transforms(self, write_intermediate=()):
         '''Runs all modules on data in memory. And config from module names
+        
+        Modules are fused: data in memory (from INIT) is only read when it is
+        written, and each chunk then goes through all modules and is 
+        concatenated with the original file in a single pass. The original 
+        file is read once, for both the selected columns and the concatenation.
+        Only the output of the last module is written, as well as that of the
+        modules in write_intermediate (during the same pass).
+        
+        Returns the run_info of each module (mod_count is complete once data 
+        was written)
+        
         # TODO: move to abstract_data_project ?
-        # TODO: check skipped
         '''
         self._check_mem_data()
         
-        print(self.metadata['log'][self.mem_data_info['file_name']]['recode_types']['skipped'])
-        
+        file_name = self.mem_data_info['file_name']
         print('mem_data_info:\n', self.mem_data_info)
         
         all_run_infos = {}
         # Only run all if there is a MINI version of the file
         if self.metadata['has_mini']:
-            for module_name in self.MODULE_ORDER:
-                if self.MODULES['transform'][module_name].get('use_in_full_run', False):
+            module_names = [module_name for module_name in self.MODULE_ORDER \
+                            if self.MODULES['transform'][module_name].get('use_in_full_run', False)]
+            
+            # Module will be skipped if it has no __run_info.json
+            # OR IF it has "skipped" set to true in the log
+            to_run = [module_name for module_name in module_names \
+                      if not self.metadata['log'][file_name][module_name]['skipped']]
+            
+            # Read the original file once for both transforms and concat_with_init 
+            # (which is skipped if no other module is run). Chunks are consumed 
+            # in lockstep, so that tee only holds one chunk at a time.
+            og_tab = None
+            if ('concat_with_init' in to_run) and (len(to_run) >= 2) \
+                    and (self.mem_data_info['module_name'] == 'INIT'):
+                og_tab, tab = itertools.tee(self._skip_resumed_rows(
+                                self._static_load_data(self._data_path('INIT', file_name),
+                                                       chunksize=self.mem_data_info.get('chunksize'))))
+                selected = self.metadata['column_tracker']['selected']
+                self.mem_data = (part_tab[selected] for part_tab in tab)
+            
+            for module_name in module_names:
+                if module_name not in to_run:
+                    run_info = {'skipped': True}
+                    logging.warning('WARNING: MODULE {0} WAS NOT RUN'.format(module_name))
+                elif module_name == 'concat_with_init':
+                    print('run_all at', module_name)
+                    _, run_info = self.concat_with_init(og_tab)
+                else:
+                    # Load parameters from config files
+                    run_info_name = MINI_PREFIX + file_name + '__run_info.json'
+                    params = self.read_config_data(module_name, run_info_name)['params']
                     
-                    # Module will be skipped if it has no __run_info.json
-                    # OR IF it has "skipped" set to true in the log
-                    if self.metadata['log'][self.mem_data_info['file_name']][module_name]['skipped']:
-                        run_info = {'skipped': True}
-                        logging.warning('WARNING: MODULE {0} WAS NOT RUN'.format(module_name))
-                    else:
-#                        try:                        
-                        run_info_name = MINI_PREFIX + self.mem_data_info['file_name'] + '__run_info.json'
-                        
-                        # TODO: deal with this
-                        if module_name != 'concat_with_init':
-                            params = self.read_config_data(module_name, run_info_name)['params']
-                        else:
-                            params = None
-                        
-                        print('params:\n', params)
-                        
-                        # Load parameters from config files
-                        print('run_all at', module_name)
-                        _, run_info = self.transform(module_name, params)
-                        print('run_all finished', module_name)
-#                        except: 
-#                            run_info = {'skipped': True}
-#                            logging.warning('WARNING: MODULE {0} WAS NOT RUN'.format(module_name))
-                    all_run_infos[module_name] = run_info
+                    print('run_all at', module_name)
+                    log, run_info = self.transform(module_name, params)
+                    
+                    if module_name in write_intermediate:
+                        self.mem_data = self._write_through(module_name, file_name, self.mem_data)
+                        log['written'] = True
+                all_run_infos[module_name] = run_info
         else:
             logging.warning('run_all_transforms was called on a project without' \
                             ' a mini version. Nothing was done...')
+        return all_run_infos
 
 
 class ESNormalizer(Normalizer):
@@ -2,8 +2,8 @@
 # coding=utf-8
 
 # Standard modules
-import csv, itertools, re, logging, optparse, time, sys, math, os, unidecode
-from functools import partial, reduce, lru_cache
+import csv, itertools, json, re, logging, optparse, time, sys, math, os, unidecode, multiprocessing, hashlib, pickle
+from functools import partial, reduce
 from collections import defaultdict, Counter, Iterable
 from operator import itemgetter, add
 from fuzzywuzzy import fuzz
@@ -13,11 +13,15 @@ import numpy as np
 
 # Parsing/normalization packages
 import custom_name_parsing
-import urllib.request, urllib.parse, json # For BAN address API on data.gouv.fr
+import address_parsing, geocoding
+import urllib.error
 from dateparser import DateDataParser
 import phonenumbers
 
-from CONFIG import RESOURCE_PATH
+from CONFIG import RESOURCE_PATH, DYNAMIC_RESOURCE_PATH
+from close_match_index import cached_close_match_index
+from lexicon_cache import cached_lexicon, file_digest
+from storage import load_versioned_pickle, save_versioned_pickle
 
 lastTime = 0
 timingInfo = Counter()
@@ -30,6 +34,10 @@ MAX_ERROR_RATE = 20
 MAX_FATAL_COUNT = 5
 # If set to True, all errors will be treated as fatal
 FAIL_FAST_MODE = True
+# Outcome of running a matcher on a single value
+MATCH_STATUS_OK = 0
+MATCH_STATUS_ERROR = 1
+MATCH_STATUS_FATAL = 2
 
 def snapshot_timing(end):
 	global lastTime
@@ -74,56 +82,6 @@ def chngrams(string="", n=3, top=None, threshold=0, exclude=[], **kwargs):
 		count = dict(heapq.nsmallest(top, count.items(), key=lambda kv: (-kv[1], kv[0])))
 	return kwargs.get("dict", dict)(count)
 
-class ApproximateLookup:
-	def __init__(self, maxHits = 10):
-		self.words = set()
-		self.index = {}
-		self.maxHits = maxHits
-	def add(self, item):
-		self.words.add(item)
-	def remove(self, item):
-		self.words.discard(item)
-	def indexkeys(self, w):
-		L = len(w)
-		res = set([w])
-		for i in range(L):
-			for j in range(i,L):
-				res.add(w[:i]+w[i+1:j]+w[j+1:])
-		return res
-	def makeindex(self):
-		self.index.clear()
-		for w in self.words:
-			for key in self.indexkeys(w):
-				if key in self.index: self.index[key].add(w)
-				else: self.index[key] = set([w])
-	def search(self, query):
-		res = {0:[], 1:[], 2:[]}
-		candidate = set()
-		for key in self.indexkeys(query):
-			if key in self.index: candidate.update(self.index[key])
-		for word in candidate:
-			dist = edit_dist(word, query)
-			if dist < 3 and len(res) < self.maxHits: res[dist].append(word)
-		return res
-
-# Fast Levenshtein distance implementation
-
-def edit_dist(s,t):
-	matrix = {}
-	for i in range(len(s)+1):
-		matrix[(i, 0)] = i
-	for j in range(len(t)+1):
-		matrix[(0, j)] = j
-
-	for j in range(1,len(t)+1):
-		for i in range(1,len(s)+1):
-			if s[i-1] == t[j-1]:
-				matrix[(i, j)] = matrix[(i-1, j-1)]
-			else:
-				matrix[(i, j)] = min([matrix[(i-1, j)] +1, matrix[(i, j-1)]+1, matrix[(i-1, j-1)] +1])
-
-	return matrix[(i,j)]
-
 # Misc utilities
 
 def flatten_list(l): return '' if l is None else l if isinstance(l, str) else '; '.join([flatten_list(v) for v in uniq(l)])
@@ -241,6 +199,7 @@ def add_to_lexicon_map(lexical_map, s, tokenize, stopWords):
 def cased_multi_map(mm):
 	return dict([(case_phrase(k), set([case_phrase(v) for v in vs])) for k, vs in mm.items()])
 
+@cached_lexicon(dependencies = ('cased_multi_map', 'add_to_lexicon_map'))
 def validated_lexical_map(lexicon, tokenize = False, stopWords = None, synMap = None):
 	''' Returns a dictionary from normalized string to list of original strings. '''
 	syn_map0 = None if synMap is None else cased_multi_map(synMap)
@@ -279,6 +238,7 @@ def file_to_list(fileName, path = RESOURCE_PATH):
 # - to automatically handle multiple languages by checking suffixes ("_en", "_fr") without having to enumerate them by hand
 def file_to_set(fileName): return set(file_to_list(fileName))
 
+@cached_lexicon(0, dependencies = ('file_row_iter', 'normalize_or_not'))
 def file_to_variant_map(fileName, sep = '|', includeSelf = False, tokenize = False):
 	''' The input format is pipe-separated, column 1 is the main variant, column 2 an alternative variant.
 
@@ -506,12 +466,18 @@ class TypeMatcher(object):
 		outputFieldPrefix = None if self.t == t else self.t 
 		c.register_partial_match(t, outputFieldPrefix, ms, hit, span)
 		self.update_diversity(hit)
+	def prepare_field(self, f):
+		''' Called before matching the values of field f, so that column-level work can be done once (no-op by default). '''
+		pass
 	@timed
 	def match_all_field_values(self, f):
+		''' Runs this matcher on all values of field f (until bailing out). '''
+		self.prepare_field(f)
+		if f.is_distinct(): return self.match_distinct_field_values(f)
 		error_values = Counter()
 		fatal_values = Counter()
 		values_seen = 0
-		for vc in f.cells:
+		for (j, vc) in enumerate(f.cells):
 			error_count = sum(error_values.values())
 			fatal_count = sum(fatal_values.values())
 			if values_seen >= 100 and (error_count + fatal_count) * 100 > values_seen * MAX_ERROR_RATE:
@@ -528,44 +494,97 @@ class TypeMatcher(object):
 			elif v in error_values:
 				error_values[v] += 1
 				continue
-			try :
-				self.match(vc)
-			# Handling non-fatal errors
-			except ValueError as ve:
-				logging.warning('{}: value error for "{}": {}'.format(self, vc.value, ve))
-				if FAIL_FAST_MODE: 
-					fatal_values[v] += 1
-				else: 
-					error_values[v] += 1
-			except OverflowError as oe:
-				logging.error('{} : overflow error (e.g. while parsing date) for "{}": {}'.format(self, vc.value, oe))
-				if FAIL_FAST_MODE: 
-					fatal_values[v] += 1
-				else: 
-					error_values[v] += 1
-			# Handling fatal errors
-			except RuntimeError as rte:
-				logging.warning('{}: runtime error for "{}": {}'.format(self, vc.value, rte))
-				fatal_values[v] += 1
-			except TypeError as te:
-				logging.warning('{}: type or parsing error for "{}": {}'.format(self, vc.value, te))
-				fatal_values[v] += 1
-			except UnicodeDecodeError as ude:
-				logging.error('{} : unicode error while parsing input value "{}": {}'.format(self, vc.value, ude))
-				fatal_values[v] += 1
-			except urllib.error.URLError as ue:
-				logging.warning('{}: request rejected for "{}": {}'.format(self, vc.value, ue))
-				fatal_values[v] += 1
-			except ConnectionError as cne:
-				logging.warning('{}: connection error: {}'.format(self, cne))
-				fatal_values[v] += 1
-			except Exception as une:
-				logging.warning('{}: unknown exception: {}'.format(self, une))
+			f.visited[j] = True
+			status = self.match_value(vc)
+			if status == MATCH_STATUS_FATAL:
 				fatal_values[v] += 1
+			elif status == MATCH_STATUS_ERROR:
+				error_values[v] += 1
+	def match_distinct_field_values(self, f):
+		''' Same as match_all_field_values for a field whose cells are grouped by distinct value: match() is called
+			once per distinct value, while error and fatal counts are replayed row by row so that bailing out happens
+			at the exact same row as when iterating over one cell per row. Rows which would not have been matched in
+			that case (repeated failing values, rows past the bail-out point) are split off into a copy of their cell
+			as it was before this matcher ran. '''
+		status = np.zeros(len(f.cells), dtype = np.int8)
+		snapshots = dict()
+		error_count, fatal_count = 0, 0
+		start = 0
+		order = np.argsort(f.firstRows, kind = 'stable')
+		for j in itertools.chain(order, [None]):
+			r = f.row_count() if j is None else f.firstRows[j]
+			if error_count + fatal_count > 0:
+				k = self.bail_out_row(status[f.cellIdx[start:r + 1]], start, error_count, fatal_count)
+				if k is not None:
+					for (i, snapshot) in snapshots.items():
+						f.split_cell(i, k, snapshot)
+					return
+			if j is None: return
+			vc = f.cells[j]
+			snapshot = vc.snapshot() if f.weights[j] > 1 else None
+			f.visited[j] = True
+			status[j] = self.match_value(vc)
+			if snapshot is not None and vc.snapshot() != snapshot:
+				if status[j] == MATCH_STATUS_OK:
+					snapshots[j] = snapshot
+				else:
+					f.split_cell(j, r + 1, snapshot)
+					status = np.append(status, status[j])
+			seg = status[f.cellIdx[start:r + 1]]
+			error_count += np.count_nonzero(seg == MATCH_STATUS_ERROR)
+			fatal_count += np.count_nonzero(seg == MATCH_STATUS_FATAL)
+			start = r + 1
+	def bail_out_row(self, seg, start, error_count, fatal_count):
+		''' Given the match status of consecutive rows starting at row index start, as well as error and fatal counts
+			for all rows before it, returns the index of the row at which matching would be abandoned (or None). '''
+		errors = error_count + np.cumsum(seg == MATCH_STATUS_ERROR) - (seg == MATCH_STATUS_ERROR)
+		fatals = fatal_count + np.cumsum(seg == MATCH_STATUS_FATAL) - (seg == MATCH_STATUS_FATAL)
+		seen = np.arange(start, start + len(seg))
+		tooManyErrors = (seen >= 100) & ((errors + fatals) * 100 > seen * MAX_ERROR_RATE)
+		tooManyFatals = fatals > MAX_FATAL_COUNT
+		bail = np.flatnonzero(tooManyErrors | tooManyFatals)
+		if len(bail) < 1: return None
+		k = bail[0]
+		if tooManyErrors[k]:
+			logging.warning('{}: bailing out after {} total matching errors'.format(self, errors[k] + fatals[k]))
+		else:
+			logging.warning('{}: bailing out after {} fatal matching errors'.format(self, fatals[k]))
+		return start + k
+	def match_value(self, vc):
+		''' Runs this matcher on a single cell and returns a MATCH_STATUS_* code depending on the error raised (if any). '''
+		try :
+			self.match(vc)
+		# Handling non-fatal errors
+		except ValueError as ve:
+			logging.warning('{}: value error for "{}": {}'.format(self, vc.value, ve))
+			return MATCH_STATUS_FATAL if FAIL_FAST_MODE else MATCH_STATUS_ERROR
+		except OverflowError as oe:
+			logging.error('{} : overflow error (e.g. while parsing date) for "{}": {}'.format(self, vc.value, oe))
+			return MATCH_STATUS_FATAL if FAIL_FAST_MODE else MATCH_STATUS_ERROR
+		# Handling fatal errors
+		except RuntimeError as rte:
+			logging.warning('{}: runtime error for "{}": {}'.format(self, vc.value, rte))
+			return MATCH_STATUS_FATAL
+		except TypeError as te:
+			logging.warning('{}: type or parsing error for "{}": {}'.format(self, vc.value, te))
+			return MATCH_STATUS_FATAL
+		except UnicodeDecodeError as ude:
+			logging.error('{} : unicode error while parsing input value "{}": {}'.format(self, vc.value, ude))
+			return MATCH_STATUS_FATAL
+		except urllib.error.URLError as ue:
+			logging.warning('{}: request rejected for "{}": {}'.format(self, vc.value, ue))
+			return MATCH_STATUS_FATAL
+		except ConnectionError as cne:
+			logging.warning('{}: connection error: {}'.format(self, cne))
+			return MATCH_STATUS_FATAL
+		except Exception as une:
+			logging.warning('{}: unknown exception: {}'.format(self, une))
+			return MATCH_STATUS_FATAL
+		return MATCH_STATUS_OK
 
 	def update_diversity(self, hit):
 		self.diversion |= set(hit if isinstance(hit, list) else [hit])
-	def check_diversity(self, cells):
+	def check_diversity(self, f):
 		div = len(self.diversion)
 		if div <= 0: return
 		self.diversion.clear()
@@ -573,7 +592,7 @@ class TypeMatcher(object):
 			logging.info('Not enough diversity matches of type {} produced by {} ({})'.format(self.t, self, div))
 		else:
 			logging.info('Positing value type {} by {}'.format(self.t, self))
-			for c in cells: c.posit_type(self.t)
+			f.posit_type(self.t)
 
 class GridMatcher(TypeMatcher):
 	@timed
@@ -586,27 +605,100 @@ class GridMatcher(TypeMatcher):
 			item = src_items_by_label[vc.value]
 			if 'grid' in item:
 				self.register_full_match(vc, self.t, 100, item['label'])
+		f.visited[:] = True
 
 MATCH_MODE_EXACT = 0
 MATCH_MODE_CLOSE = 1
 
+# Batch validators for numeric identifiers, replicating the stdnum checks on whole Series of values at once
+
+def digit_matrix(digits, n):
+	''' Returns the digits of a Series of n-digit strings as a (len(digits), n) integer array. '''
+	return np.frombuffer(''.join(digits).encode('ascii'), dtype = np.uint8).reshape(-1, n).astype(np.int64) - 48
+
+def digit_numbers(m):
+	''' Returns the numbers made of each row of digits in the integer array m. '''
+	return m.dot(10 ** np.arange(m.shape[1] - 1, -1, -1, dtype = np.int64))
+
+def luhn_checksums(m):
+	''' Returns the Luhn checksum of each row of digits in the integer array m (0 for valid numbers). '''
+	d = m[:, ::-1].copy()
+	d[:, 1::2] *= 2
+	d[:, 1::2] -= 9 * (d[:, 1::2] > 9)
+	return d.sum(axis = 1) % 10
+
+def siren_checks(m): return luhn_checksums(m) == 0
+
+def siret_checks(m):
+	# La Poste establishments (except the head office) use a sum of digits multiple of 5 instead of the Luhn checksum
+	laPoste = (digit_numbers(m[:, :9]) == 356000000) & (digit_numbers(m[:, 9:]) != 48)
+	checks = np.where(laPoste, m.sum(axis = 1) % 5, luhn_checksums(m))
+	return (checks == 0) & siren_checks(m[:, :9])
+
+def nif_checks(m): return (m[:, 0] <= 3) & (digit_numbers(m[:, :10]) % 511 == digit_numbers(m[:, 10:]))
+
+def nir_checks(m): return 97 - digit_numbers(m[:, :13]) % 97 == digit_numbers(m[:, 13:])
+
+def batch_digit_validator(separators, n, checks, values):
+	''' Validates a Series of identifiers made of n digits (once the separator characters are removed) with the checks
+		function, which is given the matrix of their digits.
+
+		Returns a mask of the values supported by this batch validator (i.e. made only of digits and separators once
+		stripped of surrounding whitespace), a mask of the valid values and the Series of compacted values. '''
+	s = values.str.strip()
+	supported = s.str.match('[0-9{}]*$'.format(re.escape(separators))).values.astype(bool)
+	digits = s.str.replace('[{}]'.format(re.escape(separators)), '', regex = True)
+	ok = supported & (digits.str.len() == n).values
+	valid = np.zeros(len(values), dtype = bool)
+	valid[ok] = checks(digit_matrix(digits[ok], n))
+	return (supported, valid, digits)
+
 # stdnum-based matcher-normalizer class
 
 class StdnumMatcher(TypeMatcher):
+	''' Validates and normalizes identifiers with the stdnum validator and normalizer functions, after a column-level
+		pass validating all values supported by the batch validator (if any) at once. '''
 	@timed
-	def __init__(self, t, validator, normalizer):
+	def __init__(self, t, validator, normalizer, batchValidator = None):
 		super(StdnumMatcher, self).__init__(t)
 		self.t = t
 		self.validator = validator
 		self.normalizer = normalizer
+		self.batchValidator = batchValidator
+		# Mapping from value to its normalized form (None if invalid) for values validated by the column-level pass
+		self.validated = dict()
+	def batch_validate(self, values):
+		''' Validates a Series of values with the batch validator, returning a Series of their normalized forms (None
+			for invalid values) restricted to the values supported by the batch validator. '''
+		if self.batchValidator is None or len(values) < 1: return pd.Series([], dtype = object)
+		(supported, valid, compacted) = self.batchValidator(values)
+		return compacted.where(valid, None)[supported]
+	def validate_values(self, values):
+		''' Validates a Series of values, returning a Series of their normalized forms (None for invalid values). Values
+			not supported by the batch validator are validated one at a time by stdnum. '''
+		values = pd.Series(values, dtype = object)
+		res = pd.Series([None] * len(values), index = values.index, dtype = object)
+		validated = self.batch_validate(values)
+		res[validated.index] = validated
+		for k in values.index.difference(validated.index):
+			if self.validator(values[k]): res[k] = self.normalizer(values[k])
+		return res
+	def prepare_field(self, f):
+		self.validated = dict()
+		if self.batchValidator is None: return
+		values = pd.Series(list(set(c.value for c in f.cells)), dtype = object)
+		validated = self.batch_validate(values)
+		self.validated = dict(zip(values[validated.index], validated))
 	@timed
 	def match(self, c):
 		nv = c.value
-		if self.validator(nv):
-			nv0 = self.normalizer(nv)
-			self.register_full_match(c, self.t, 100, nv0)
+		if nv in self.validated:
+			nv0 = self.validated[nv]
 		else:
+			nv0 = self.normalizer(nv) if self.validator(nv) else None
+		if nv0 is None:
 			raise TypeError('{} stdnum matcher did not validate "{}"'.format(self, c))
+		self.register_full_match(c, self.t, 100, nv0)
 
 # Regex-based matcher-normalizer class
 
@@ -663,8 +755,27 @@ class RegexMatcher(TypeMatcher):
 						raise RuntimeError('No group {} matched in regex {} for input "{}"'.format(self.g, self.p, c))
 		raise ValueError('{} unmatched "{}"'.format(self, c.value))
 
+def trie_pattern(vocab):
+	''' Builds a regex pattern matching any of the (literal) vocabulary entries, structured as a trie with non-capturing 
+		groups so that the regex engine walks down common prefixes once instead of backtracking through each alternative
+		(longer entries are tried first). '''
+	root = dict()
+	for w in vocab:
+		if w is None or len(w) < 1: continue
+		n = root
+		for ch in w: n = n.setdefault(ch, dict())
+		n[''] = None
+	def node_pattern(n):
+		alts = [re.escape(ch) + node_pattern(n[ch]) for ch in sorted(k for k in n.keys() if k != '')]
+		if len(alts) < 1: return ''
+		p = alts[0] if len(alts) == 1 else '(?:{})'.format('|'.join(alts))
+		if '' not in n: return p
+		atomic = len(alts) > 1 or len(p) == 1 or (len(p) == 2 and p[0] == '\\')
+		return p + '?' if atomic else '(?:{})?'.format(p)
+	return node_pattern(root)
+
 def build_vocab_regex(vocab, partial):
-	j = '|'.join(vocab)
+	j = trie_pattern(vocab)
 	return '({}).*$'.format(j if partial else j)
 
 class VocabMatcher(RegexMatcher):
@@ -701,6 +812,40 @@ def tokenization_based_score(matchedSrcTokens, srcTokens, matchedRefPhrase, refP
 def stop_words_as_normalized_list(stopWords): 
 	return [] if stopWords is None else list([case_phrase(s, False) for s in stopWords])
 
+class TokenTrie(object):
+	''' Trie over phrases as sequences of space-separated tokens, with tokens mapped to integer ids and the children of
+		each node stored in a dict from token id to node id, so that all the indexed phrases occurring in a list of tokens
+		are found by walking down the trie from each start position (instead of looking up every window of tokens). '''
+	def __init__(self, phrases):
+		self.tokenIds = dict()
+		self.children = [dict()]
+		# Indexed phrase by id of the node where it ends
+		self.phrases = dict()
+		for phrase in phrases:
+			n = 0
+			for token in phrase.split(' '):
+				tokenId = self.tokenIds.setdefault(token, len(self.tokenIds))
+				child = self.children[n].get(tokenId)
+				if child is None:
+					child = len(self.children)
+					self.children.append(dict())
+					self.children[n][tokenId] = child
+				n = child
+			self.phrases[n] = phrase
+	def matches(self, tokens, longestOnly = False):
+		''' Yields (k1, k2, phrase) for each indexed phrase equal to tokens[k1:k2], by increasing k1 then k2 (only the
+			longest one for each k1 if longestOnly is True). '''
+		ids = [self.tokenIds.get(t) for t in tokens]
+		for k1 in range(len(ids)):
+			n, longest = 0, None
+			for k in range(k1, len(ids)):
+				n = self.children[n].get(ids[k])
+				if n is None: break
+				if n not in self.phrases: continue
+				if longestOnly: longest = (k1, k + 1, self.phrases[n])
+				else: yield (k1, k + 1, self.phrases[n])
+			if longest is not None: yield longest
+
 DTC = 6 # Dangerous Token Count (becomes prohibitive to tokenize many source strings above this!)
 class TokenizedMatcher(TypeMatcher):
 	@timed
@@ -723,6 +868,7 @@ class TokenizedMatcher(TypeMatcher):
 			if matchedRefPhrase not in self.tokenIdx or len(self.tokenIdx[matchedRefPhrase]) < len(np):
 				self.tokenIdx[matchedRefPhrase] = np
 		self.maxTokens = currentMax
+		self.trie = TokenTrie(self.tokenIdx.keys())
 		logging.info('SET UP %d-token matcher (%s-defined length) for <%s> with lexicon of size %d, total variants %d',
 			self.maxTokens, 'user' if maxTokens > 0 else 'data', self.t, len(self.phrasesMap), len(self.tokenIdx))
 	def diversity(self):
@@ -731,35 +877,35 @@ class TokenizedMatcher(TypeMatcher):
 	def match(self, c):
 		tokens = normalize_and_validate_tokens(c.value, tokenValidator = lambda t: is_valid_token(t) and t not in self.stopWords)
 		if tokens is not None:
-			for k2 in range(self.maxTokens, 0, -1):
-				for k1 in range(0, len(tokens) + 1 - k2):
-					matchSrcTokens = tokens[k1:k1 + k2]
-					matchRefPhrase = ' '.join(matchSrcTokens)
-					if matchRefPhrase in self.tokenIdx:
-						nm = self.tokenIdx[matchRefPhrase]
-						score = self.scorer(matchSrcTokens, tokens, matchRefPhrase, nm)
-						if nm not in self.phrasesMap:
-							raise RuntimeError('Normalized phrase {} not found in phrases map'.format(nm))
-						hit = self.phrasesMap[nm]
-						v = case_phrase(c.value)
-						# The next line joins on '' and not on ' ' because non-pure space chars might have been transformed
-						# during tokenization (hyphens, punctuation, etc.)
-						subStr = ''.join(matchSrcTokens)
-						span = check_non_consecutive_subsequence(v, subStr)
-						if span is None:
-							logging.warning('%s could not find tokens "%s" in original "%s"', self, matchRefPhrase, v)
-							span = (0, len(c.value))
-						self.register_partial_match(c, self.t, score, hit, span)
-						return
+			# Longest matching token sequence (the leftmost one among those of the same length)
+			matches = list(self.trie.matches(tokens, longestOnly = True))
+			if len(matches) > 0:
+				(k1, k2, matchRefPhrase) = min(matches, key = lambda m: (m[0] - m[1], m[0]))
+				matchSrcTokens = tokens[k1:k2]
+				nm = self.tokenIdx[matchRefPhrase]
+				score = self.scorer(matchSrcTokens, tokens, matchRefPhrase, nm)
+				if nm not in self.phrasesMap:
+					raise RuntimeError('Normalized phrase {} not found in phrases map'.format(nm))
+				hit = self.phrasesMap[nm]
+				v = case_phrase(c.value)
+				# The next line joins on '' and not on ' ' because non-pure space chars might have been transformed
+				# during tokenization (hyphens, punctuation, etc.)
+				subStr = ''.join(matchSrcTokens)
+				span = check_non_consecutive_subsequence(v, subStr)
+				if span is None:
+					logging.warning('%s could not find tokens "%s" in original "%s"', self, matchRefPhrase, v)
+					span = (0, len(c.value))
+				self.register_partial_match(c, self.t, score, hit, span)
+				return
 		raise ValueError('{} found no matching token sequence in "{}"'.format(self, c))
 
 # Label-based matcher-normalizer class and its underlying FSS structure
 
+# Directory where close-match indexes get serialized (so that they are not rebuilt by each process)
+CLOSE_MATCH_CACHE_PATH = os.path.join(DYNAMIC_RESOURCE_PATH, 'close_match')
+
 def build_fast_sim_struct(terms):
-	fss = ApproximateLookup()
-	for term in terms: fss.add(term)
-	fss.makeindex()
-	return fss
+	return cached_close_match_index(terms, cacheDir = CLOSE_MATCH_CACHE_PATH)
 
 def fast_sim_score(r, l = 1024):
 	''' Return a pair (list of matched substrings, score) '''
@@ -931,19 +1077,100 @@ def parse_fields_from_CSV(fileName, delimiter):
 	return Fields({ Cell(h, h): Field([Cell(a[i][k] if len(a[i]) > k else '', h) for i in range(1, len(a))]) for (k, h) in enumerate(a[0]) },
 		len(a) - 1)
 
-def parse_fields_from_Panda(df):
-	''' Takes a DataFrame as input, returns an instance of the Fields class. '''
-	return Fields({ Cell(h, h): Field([Cell(v, h) for v in c]) for (h, c) in df.items() },
-		df.shape[0])
+# If set to True, cells of a DataFrame column will be grouped by distinct value (so that each matcher only runs once per
+# value, with scores weighted by value frequency), otherwise one cell will be created for each row
+GROUP_BY_DISTINCT_VALUE = True
+
+def parse_fields_from_Panda(df, distinct = GROUP_BY_DISTINCT_VALUE, rows = None):
+	''' Takes a DataFrame as input, returns an instance of the Fields class.
+
+		Parameters:
+		rows optional mapping from column name to a boolean mask of the rows to include in that column's field (all rows
+			being included for other columns) '''
+	rows = dict() if rows is None else rows
+	cols = { h: (c[rows[h]] if h in rows else c) for (h, c) in df.items() }
+	if distinct:
+		return Fields({ Cell(h, h): Field.from_distinct_values(c, h) for (h, c) in cols.items() }, df.shape[0], rows)
+	return Fields({ Cell(h, h): Field([Cell(v, h) for v in c]) for (h, c) in cols.items() },
+		df.shape[0], rows)
+
+# Number of worker processes among which columns get dispatched for value matching (1 to match all columns in-process)
+MATCHING_PROCESSES = 1
+
+# Fields instance whose columns are matched by worker processes (inherited by them at fork time, together with the value
+# matchers, so that neither needs to be pickled)
+FORKED_FIELDS = None
+
+def match_field_in_worker(args):
+	''' Runs value matchers on a single column of FORKED_FIELDS and returns the resulting field along with the matchers
+		skipped on it and the timing info collected meanwhile (so that the parent process can merge all of them). '''
+	(i, trustedType, settledTypes) = args
+	(hc, f) = list(FORKED_FIELDS.fields.items())[i]
+	timing0, count0 = Counter(timingInfo), Counter(countInfo)
+	skipped = FORKED_FIELDS.match_field_values(hc, f, trustedType, settledTypes)
+	return (i, f, skipped, timingInfo - timing0, countInfo - count0)
+
+def matching_processes(params):
+	''' Number of worker processes to use for value matching given the API call parameters. '''
+	processes = MATCHING_PROCESSES if params is None else params.get('processes', MATCHING_PROCESSES)
+	if processes > 1 and multiprocessing.current_process().daemon:
+		logging.warning('Cannot spawn matching processes from a daemonic process: matching columns in-process')
+		return 1
+	return processes
+
+# Value matchers are run on each column by increasing cost per value (in microseconds, by matcher class), as measured by
+# benchmarks/calibrate_matcher_costs.py from the time collected by @timed (timingInfo and countInfo) on a calibration
+# table, and stored in the following resource file. The order only depends on this file (and on the order in which
+# matchers are declared, for matchers of equal cost), so that the matchers skipped on settled columns are the same from
+# one job to the next.
+MATCHER_COSTS_FILE = 'matcher_costs.json'
+# Cost of matchers missing from the file
+DEFAULT_MATCHER_COST = 100
+
+def file_to_matcher_costs(filePath = os.path.join(RESOURCE_PATH, MATCHER_COSTS_FILE)):
+	''' Costs per value of value matchers by class name (empty if the file is missing). '''
+	try:
+		with open(filePath) as f: return json.load(f)
+	except FileNotFoundError:
+		logging.warning('Matcher costs not found in %s: matchers are run in declaration order', filePath)
+		return dict()
+
+MATCHER_COSTS = file_to_matcher_costs()
+
+# If set to True, a column gets settled as soon as a matcher for a type with a strict format (as opposed to a lexicon or
+# a heuristic parser) reaches a high enough column-wide score, after which all remaining matchers get skipped
+SETTLE_COLUMN_TYPES = True
+SETTLING_TYPES = set([F_EMAIL, F_URL, F_NIR, F_NIF, F_TVA, F_SIREN, F_SIRET, F_NNS, F_UAI])
+# Min column-wide score (in percent, as computed for type inference) for a settling type to settle its column
+SETTLEMENT_SCORE = 90
+# Min number of non-empty values in a column for it to be settled
+SETTLEMENT_MIN_SAMPLE = 50
+
+def matcher_cost(vm):
+	''' Estimated cost per value of a value matcher (in microseconds). '''
+	return MATCHER_COSTS.get(vm.__class__.__name__, DEFAULT_MATCHER_COST)
+
+def matcher_order(vms):
+	''' Value matchers sorted by increasing cost (sorting is stable, so that matchers of equal cost keep their order). '''
+	return sorted(vms, key = matcher_cost)
+
+def settling_types(params):
+	''' Set of types allowed to settle a column given the API call parameters. '''
+	settle = SETTLE_COLUMN_TYPES if params is None else params.get('settle_types', SETTLE_COLUMN_TYPES)
+	return SETTLING_TYPES if settle else set()
 
 class Fields(object):
-	def __init__(self, fields, entries):
+	def __init__(self, fields, entries, rows = None):
 		self.fields = fields # Mapping from header Cell object to value Field object
 		self.entries = entries
+		# Mapping from field name to the boolean mask of the rows included in that field (if not all of them)
+		self.rows = dict() if rows is None else rows
 		self.modifiedByColumn = { }
 		self.outputFieldsByColumn = { }
+		# Mapping from field name to the list of value matchers skipped on it once its type got settled
+		self.skippedMatchers = { }
 	@timed
-	def match_headers_and_values(self):
+	def match_headers_and_values(self, processes = 1, settled_types = SETTLING_TYPES):
 		logging.info('RUNNING all header matchers')
 		for hm in header_matchers():
 			for hc in self.fields.keys():
@@ -953,14 +1180,58 @@ class Fields(object):
 				except:
 					pass # Ignore errors on header matching since no need to bail out (few values to check)
 		logging.info('RUNNING all value matchers')
-		for vm in value_matchers():
-			if isinstance(vm, SubtypeMatcher): continue
-			if isinstance(vm, CompositeMatcher): continue
-			for (hc, f) in self.fields.items():
-				logging.debug('RUNNING %s on %s values', vm, hc.value)
+		self.skippedMatchers.clear()
+		if processes > 1 and len(self.fields) > 1:
+			self.match_fields_in_workers(processes, settled_types = settled_types)
+			return
+		for (hc, f) in self.fields.items():
+			skipped = self.match_field_values(hc, f, settled_types = settled_types)
+			if len(skipped) > 0: self.skippedMatchers[hc.value] = skipped
+	def match_field_values(self, hc, f, trustedType = None, settled_types = SETTLING_TYPES):
+		''' Runs all value matchers on a single column (or only those of the trusted type if specified). Matchers do not
+			keep any state across columns (and the types they match are scored independently from one another), so they
+			can be run column by column and in any order. They are run by increasing cost, and as soon as one of them
+			settles the column type, remaining matchers are skipped: the list of their names is returned. '''
+		vms = [vm for vm in value_matchers() if not isinstance(vm, (SubtypeMatcher, CompositeMatcher))]
+		if trustedType is not None:
+			for vm in vms:
+				if vm.t != trustedType: continue
+				logging.debug('TRUSTING %s on %s values', vm, hc.value)
 				vm.match_all_field_values(f)
-				vm.check_diversity(f.cells)
-	def match_by_types(self, trusted_types):
+			return []
+		vms = matcher_order(vms)
+		for (k, vm) in enumerate(vms):
+			logging.debug('RUNNING %s on %s values', vm, hc.value)
+			vm.match_all_field_values(f)
+			vm.check_diversity(f)
+			if vm.t in settled_types and not getattr(vm, 'neg', False) and f.settles_type(vm.t):
+				skipped = [str(vm) for vm in vms[k + 1:]]
+				logging.info('Settled type %s for %s values, skipping %d matchers', vm.t, hc.value, len(skipped))
+				return skipped
+		return []
+	def match_fields_in_workers(self, processes, trusted_types = None, settled_types = SETTLING_TYPES):
+		''' Dispatches columns to a pool of forked worker processes, then merges their matching results back. '''
+		global FORKED_FIELDS
+		value_matchers() # Build matchers before forking so that workers inherit them
+		tasks = [(i, None if trusted_types is None else trusted_types[hc.value], settled_types) for (i, hc) in enumerate(self.fields.keys())
+			if trusted_types is None or hc.value in trusted_types]
+		if len(tasks) < 1: return
+		headers = list(self.fields.keys())
+		FORKED_FIELDS = self
+		try:
+			with multiprocessing.get_context('fork').Pool(min(processes, len(tasks))) as pool:
+				for (i, f, skipped, timing, count) in pool.imap_unordered(match_field_in_worker, tasks):
+					self.fields[headers[i]] = f
+					if len(skipped) > 0: self.skippedMatchers[headers[i].value] = skipped
+					timingInfo.update(timing)
+					countInfo.update(count)
+		finally:
+			FORKED_FIELDS = None
+		logging.info('Matched %d columns in %d worker processes', len(tasks), min(processes, len(tasks)))
+	def match_by_types(self, trusted_types, processes = 1):
+		if processes > 1 and len(self.fields) > 1:
+			self.match_fields_in_workers(processes, trusted_types)
+			return
 		for vm in value_matchers():
 			if isinstance(vm, SubtypeMatcher): continue
 			if isinstance(vm, CompositeMatcher): continue
@@ -1046,10 +1317,10 @@ class Fields(object):
 	# The following two methods do the same thing as the previous one, but with redundant operations
 	# (splitting them is required in order to provide separate API calls prior to deduping)
 	@timed
-	def infer_types(self):
+	def infer_types(self, processes = 1, settled_types = SETTLING_TYPES):
 		''' Returns a dictionary mapping input field name to likeliest type.
 			Fields for which no type has been inferred will be missing from the output dictionary.'''
-		self.match_headers_and_values()
+		self.match_headers_and_values(processes, settled_types)
 		types = dict()
 		f2t = defaultdict(list)
 		t2f = defaultdict(list)
@@ -1091,6 +1362,7 @@ class Fields(object):
 			ofs = uniq(list(f.normalized_fields(h, lvt)))
 			logging.info('Output fields for %s: %s', fieldName, ofs)
 			nvs = list(f.normalized_values(h, lvt))
+			oldValues = [c.value for c in f.row_cells()]
 			for of in ofs:
 				b = [None] * self.entries
 				for i, nc in enumerate(nvs):
@@ -1108,16 +1380,17 @@ class Fields(object):
 								b[i] = [b[i]] + nc[of]
 							else: 
 								b[i] = [b[i], nc[of]]
-					oldValue = f.cells[i].value
+					oldValue = oldValues[i]
 					newValues = list([s for s in (nc[of] if isinstance(nc[of], list) else [nc[of]])])
 					isNewValue = len(newValues) > 0 and oldValue not in newValues
 					if isNewValue: 
 						self.modifiedByColumn[fieldName][i] += 1
 				yield (of, b)
 			self.outputFieldsByColumn[fieldName] = ofs
-	def normalize_values_in_place(self, types):
+	def normalize_values_in_place(self, types, memo = None):
 		''' Generates (original field name, modified field values) pairs for each output field and each cell that is 
-		 actually modified (even just changing a single character's case). '''
+		 actually modified (even just changing a single character's case). The new value of each distinct value that
+		 went through matching is recorded in memo, if specified. '''
 		for (h, f) in self.fields.items():
 			fieldName = h.value
 			if fieldName not in types:
@@ -1125,36 +1398,82 @@ class Fields(object):
 				continue
 			logging.info('Normalizing values for {}'.format(fieldName))
 			lvt = types[fieldName]
-			assert self.entries == len(f.cells)
-			newCol = [''] * self.entries
+			assert f.row_count() == (self.entries if fieldName not in self.rows else np.count_nonzero(self.rows[fieldName]))
+			newValues = [c.value for c in f.cells]
 			mod_count = 0
-			for i, c in enumerate(f.cells):
-				nvs = list(c.normalized_values_in_place(lvt))
-				newCol[i] = ', '.join(nvs)
-				if c.value != newCol[i]: 
-					logging.debug('Field {} recoded: {} --> {}'.format(fieldName, c.value, newCol[i]))
-					mod_count += 1
-			logging.debug('Field {} recoded: {} / {} total'.format(fieldName, mod_count, len(f.cells)))
-			yield (fieldName, newCol)
-
-@lru_cache(maxsize = 1048576, typed = False)
-def cached_normalized_values(c, t): return c.normalized_values(t)
+			for (i, res) in f.store.normalized_hits(lvt).items():
+				c = f.cells[i]
+				newValues[i] = ', '.join(normalized_values_in_place(res, c.value))
+				if c.value != newValues[i]: 
+					logging.debug('Field {} recoded: {} --> {}'.format(fieldName, c.value, newValues[i]))
+					mod_count += f.weight(i)
+			logging.debug('Field {} recoded: {} / {} total'.format(fieldName, mod_count, f.row_count()))
+			if memo is not None: memo.record(lvt, f, newValues)
+			yield (fieldName, newValues if not f.is_distinct() else [newValues[j] for j in f.cellIdx])
 
 class Field(object):
-	def __init__(self, cells):
-		# List of Cell objects
+	def __init__(self, cells, weights = None, cellIdx = None):
+		# List of Cell objects (one per distinct value if cellIdx is set, otherwise one per row)
 		self.cells = cells
+		# Number of rows holding each cell's value
+		self.weights = weights
+		# Index of the cell holding each row's value
+		self.cellIdx = cellIdx
+		# Index of the first row holding each cell's value
+		self.firstRows = None if cellIdx is None else np.unique(cellIdx, return_index = True)[1]
+		# Type inferences of all cells (cell i of this field being cell i of the store)
+		self.store = TypeInferenceStore(len(cells))
+		# Whether each cell has been run through at least one matcher (cells split off by a matcher are not, since they
+		# stand for later occurrences of a value)
+		self.visited = np.zeros(len(cells), dtype = bool)
+		for (i, c) in enumerate(cells): c.attach(self.store, i)
+	@staticmethod
+	def from_distinct_values(values, fieldName):
+		''' Builds a field with one cell per distinct value, in order of first appearance. '''
+		cellIdxByValue = dict()
+		cellIdx = np.empty(len(values), dtype = np.int64)
+		for (i, v) in enumerate(values):
+			if CONVERT_NAN_TO_EMPTY and v is np.nan: v = ''
+			j = cellIdxByValue.get(v)
+			if j is None:
+				j = len(cellIdxByValue)
+				cellIdxByValue[v] = j
+			cellIdx[i] = j
+		cells = [Cell(v, fieldName) for v in cellIdxByValue.keys()]
+		return Field(cells, np.bincount(cellIdx, minlength = len(cells)), cellIdx)
+	def is_distinct(self):
+		return self.cellIdx is not None
+	def row_count(self):
+		return len(self.cellIdx) if self.is_distinct() else len(self.cells)
+	def weight(self, i):
+		return 1 if self.weights is None else int(self.weights[i])
+	def split_cell(self, j, fromRow, snapshot):
+		''' Moves the rows holding cell j's value starting at fromRow to a new cell restored from the given snapshot. '''
+		rows = np.flatnonzero(self.cellIdx == j)
+		rows = rows[rows >= fromRow]
+		if len(rows) < 1: return
+		self.cellIdx[rows] = len(self.cells)
+		self.cells.append(self.cells[j].restored(snapshot))
+		self.weights[j] -= len(rows)
+		self.weights = np.append(self.weights, len(rows))
+		self.firstRows = np.append(self.firstRows, rows[0])
+		self.visited = np.append(self.visited, False)
+	def row_cells(self):
+		''' Generates the cell holding each row's value, in row order. '''
+		if not self.is_distinct(): return iter(self.cells)
+		return (self.cells[j] for j in self.cellIdx)
+	def non_empty_count(self):
+		return sum(self.weight(i) for (i, c) in enumerate(self.cells) if c.value_to_match())
+	def posit_type(self, t):
+		self.store.posit(t)
+	def type_score(self, t):
+		''' Column-wide score for a single type, as computed by scored_types. '''
+		return self.scored_types().get(t, 0)
+	def settles_type(self, t):
+		''' Whether type t has been matched on enough values of this field for no other type to be worth trying. '''
+		return self.non_empty_count() >= SETTLEMENT_MIN_SAMPLE and self.type_score(t) >= SETTLEMENT_SCORE
 	def scored_types(self):
-		candidateTypes = reduce(set.union, [set(c.tis.keys()) for c in self.cells])
-		# Map from type to a list of individual scores
-		typeScores = { t: [0] * len(self.cells) for t in candidateTypes }
-		for (i, c) in enumerate(self.cells):
-			nets = c.non_excluded_types()
-			for (t, tis) in c.tis.items():
-				if t not in nets: continue
-				s = max(ti.ms for ti in tis)
-				if s > 0: typeScores[t][i] = s
-		return { t: non_zero_ratio_score(scores) for (t, scores) in typeScores.items() }
+		return self.store.scored_types(self.weights)
 	def likeliest_types(self):
 		matchingTypes = self.scored_types()
 		return sorted(matchingTypes.keys(), key = lambda t: matchingTypes[t], reverse = True) if len(matchingTypes) > 0 else []
@@ -1165,17 +1484,22 @@ class Field(object):
 				if lt not in PARENT_CHILD_RELS or len(PARENT_CHILD_RELS[lt] & set(lts[i + 1:])) < 1: return lt
 		return None
 	def normalized_fields(self, h, t):
-		# return reduce(set.union, [set(cached_normalized_values(c, t).keys()) for c in self.cells], set([h.value]))
-		return reduce(set.union, [set(c.normalized_values(t).keys()) for c in self.cells], set([h.value]))
+		return reduce(set.union, [set(normalized_field_values(res).keys()) for res in self.store.normalized_hits(t).values()],
+			set([h.value]))
 	def normalized_values(self, h, t):
 		''' Casts this field with header h into type t and returns its values as a list of augmented
 			(field name, field value) dictionaries (not including the original field with its header). '''
-		for c in self.cells:
+		ress = self.store.normalized_hits(t)
+		ncs = list()
+		for (i, c) in enumerate(self.cells):
 			# Normalized/augmented fields
-			nc = c.normalized_values(t)
+			nc = normalized_field_values(ress[i]) if i in ress else dict()
 			# Original field value
 			nc[h.value] = c.value
-			yield nc
+			if not self.is_distinct(): yield nc
+			else: ncs.append(nc)
+		if self.is_distinct():
+			for j in self.cellIdx: yield dict(ncs[j])
 
 PARTIAL_MATCH = 0
 FULL_MATCH = 1
@@ -1189,6 +1513,217 @@ class TypeInference(object):
 	def __repr__(self): return 'TI<{}>: {} <-- {}'.format(self.t, self.ms, self.hit)
 	def __str__(self): return '<{}>'.format(self.t)
 
+# Match mode of the entries which record a negated type rather than a match, in a TypeInferenceStore
+NEGATED_TYPE = -1
+
+class Interner(object):
+	''' Assigns consecutive integer ids to distinct values (lists being interned by content). '''
+	def __init__(self):
+		self.values = list()
+		self.ids = dict()
+	def __len__(self): return len(self.values)
+	def __getitem__(self, k): return self.values[k]
+	def key(self, v): return (list, tuple(v)) if isinstance(v, list) else (type(v), v)
+	def id(self, v):
+		''' Returns the id of v, or None if it has not been interned. '''
+		return self.ids.get(self.key(v))
+	def intern(self, v):
+		k = self.key(v)
+		i = self.ids.get(k)
+		if i is None:
+			i = len(self.values)
+			self.ids[k] = i
+			self.values.append(v)
+		return i
+
+class TypeInferenceStore(object):
+	''' Columnar storage for the type inferences of a set of cells (typically all cells of a field), in lieu of a list of
+		TypeInference objects per cell and type: each inference is an entry across parallel arrays holding its cell id,
+		type id, output field id, match mode, match score, hit id and span, with types, output field names and hits
+		interned. Entries of a given cell are chained in registration order, so that per-cell lookups do not need to
+		scan the whole store, while column-wide computations run over entire arrays.
+
+		Negated types are recorded as entries with the NEGATED_TYPE match mode. Posited types are recorded at the
+		store level, since diversity is checked over all cells of a field at once. '''
+	def __init__(self, cellCount = 0, capacity = 16):
+		self.size = 0
+		self.cell = np.empty(capacity, dtype = np.int32)
+		self.type = np.empty(capacity, dtype = np.int32)
+		self.field = np.empty(capacity, dtype = np.int32)
+		self.mode = np.empty(capacity, dtype = np.int8)
+		self.score = np.empty(capacity, dtype = np.float64)
+		self.hit = np.empty(capacity, dtype = np.int32)
+		self.start = np.empty(capacity, dtype = np.int32)
+		self.end = np.empty(capacity, dtype = np.int32)
+		self.next = np.empty(capacity, dtype = np.int32) # Next entry of the same cell (or -1)
+		self.first = np.full(cellCount, -1, dtype = np.int32) # First entry of each cell (or -1)
+		self.last = np.full(cellCount, -1, dtype = np.int32) # Last entry of each cell (or -1)
+		self.count = np.zeros(cellCount, dtype = np.int32) # Number of entries of each cell
+		self.types = Interner()
+		self.fields = Interner()
+		self.hits = Interner()
+		self.posited = set()
+	def cell_count(self): return len(self.first)
+	def add_cell(self):
+		''' Adds a cell without any entry and returns its id. '''
+		self.first = np.append(self.first, -1)
+		self.last = np.append(self.last, -1)
+		self.count = np.append(self.count, 0)
+		return len(self.first) - 1
+	def grow(self):
+		capacity = 2 * len(self.cell)
+		for name in ['cell', 'type', 'field', 'mode', 'score', 'hit', 'start', 'end', 'next']:
+			a = getattr(self, name)
+			b = np.empty(capacity, dtype = a.dtype)
+			b[:self.size] = a[:self.size]
+			setattr(self, name, b)
+	def add(self, i, t, fieldName, mm, ms, hit, i1, i2):
+		''' Appends an entry for cell i and returns its index. '''
+		if self.size >= len(self.cell): self.grow()
+		k = self.size
+		self.cell[k] = i
+		self.type[k] = self.types.intern(t)
+		self.field[k] = -1 if fieldName is None else self.fields.intern(fieldName)
+		self.mode[k] = mm
+		self.score[k] = ms
+		self.hit[k] = -1 if hit is None else self.hits.intern(hit)
+		self.start[k] = i1
+		self.end[k] = i2
+		self.next[k] = -1
+		if self.first[i] < 0: self.first[i] = k
+		else: self.next[self.last[i]] = k
+		self.last[i] = k
+		self.count[i] += 1
+		self.size += 1
+		return k
+	def cell_entries(self, i, count = None):
+		''' Indices of the entries of cell i (or of its first count entries), in registration order. '''
+		ks = list()
+		k = int(self.first[i])
+		while k >= 0 and (count is None or len(ks) < count):
+			ks.append(k)
+			k = int(self.next[k])
+		return ks
+	def copy_cell(self, i, count = None):
+		''' Adds a cell holding a copy of the entries of cell i (or of its first count entries) and returns its id. '''
+		j = self.add_cell()
+		for k in self.cell_entries(i, count):
+			h = self.hit[k]
+			self.add(j, self.types[self.type[k]], None if self.field[k] < 0 else self.fields[self.field[k]], self.mode[k],
+				self.score[k], None if h < 0 else self.hits[h], self.start[k], self.end[k])
+		return j
+	def inference(self, k):
+		h = self.hit[k]
+		return TypeInference(self.fields[self.field[k]], int(self.mode[k]), float(self.score[k]),
+			None if h < 0 else self.hits[h], int(self.start[k]), int(self.end[k]))
+	def cell_inferences(self, i, t = None):
+		''' Materializes the TypeInference objects of cell i (for type t only if specified). '''
+		tid = None if t is None else self.types.id(t)
+		return list([self.inference(k) for k in self.cell_entries(i)
+			if self.mode[k] != NEGATED_TYPE and (t is None or self.type[k] == tid)])
+	def cell_types(self, i):
+		''' Returns the types matched and the types negated in cell i, as two sets. '''
+		matched, negated = set(), set()
+		for k in self.cell_entries(i):
+			(negated if self.mode[k] == NEGATED_TYPE else matched).add(self.types[self.type[k]])
+		return matched, negated
+	def cell_scores(self, i):
+		''' Max match score for each type matched in cell i (in order of first match). '''
+		scores = dict()
+		for k in self.cell_entries(i):
+			if self.mode[k] == NEGATED_TYPE: continue
+			t = self.types[self.type[k]]
+			scores[t] = max(scores.get(t, 0), float(self.score[k]))
+		return scores
+	def negate(self, i, t):
+		if t in self.cell_types(i)[1]: return
+		self.add(i, t, None, NEGATED_TYPE, 0, None, -1, -1)
+	def posit(self, t):
+		self.posited.add(t)
+	def best_scores(self, entries):
+		''' Max match score for each (cell, type) pair matched among the given entries: returns arrays of cell ids, type
+			ids and scores, along with a boolean array indicating whether each pair's type has been negated in that cell. '''
+		T = max(len(self.types), 1)
+		keys = self.cell[entries].astype(np.int64) * T + self.type[entries]
+		matched = self.mode[entries] != NEGATED_TYPE
+		pairs, inv = np.unique(keys[matched], return_inverse = True)
+		scores = np.full(len(pairs), -np.inf)
+		np.maximum.at(scores, inv, self.score[entries][matched])
+		return (pairs // T, pairs % T, scores, np.isin(pairs, keys[~matched]))
+	def all_entries(self): return np.arange(self.size)
+	def scored_types(self, weights = None):
+		''' Column-wide score for each matched type (in order of first match), computed as non_zero_ratio_score does
+			from the max score of each type in each cell, given the number of rows holding each cell's value. '''
+		if self.cell_count() < 1: return dict()
+		cells, types, scores, negated = self.best_scores(self.all_entries())
+		posited = np.array([self.types.id(t) for t in self.posited if self.types.id(t) is not None], dtype = np.int64)
+		valid = ~negated & np.isin(types, posited) & (scores > 0)
+		w = np.ones(len(cells)) if weights is None else weights[cells].astype(np.float64)
+		counts = np.bincount(types[valid], weights = w[valid], minlength = len(self.types))
+		total = self.cell_count() if weights is None else int(weights.sum())
+		return { self.types[k]: non_zero_ratio(counts[k], total) for k in np.unique(types) }
+	def normalization_types(self, t, entries):
+		''' Returns the ids of the cells among the given entries, along with the id of the type each of them should be
+			normalized into when cast into type t (or -1): t itself unless one of its component types has a higher score,
+			or else one of its subtypes. '''
+		cells, types, scores, negated = self.best_scores(entries)
+		ucs = np.unique(self.cell[entries])
+		def type_scores(st):
+			''' Max score of type st in each cell (-inf where it is unmatched or negated). '''
+			s = np.full(len(ucs), -np.inf)
+			k = self.types.id(st)
+			if k is None: return s
+			m = (types == k) & ~negated
+			s[np.searchsorted(ucs, cells[m])] = scores[m]
+			return s
+		whole = type_scores(t)
+		found = whole > -np.inf
+		nts = np.full(len(ucs), -1, dtype = np.int64)
+		nts[found] = self.types.id(t) if found.any() else -1
+		decided = ~found
+		for ct in COMPOSITION_RELS[t] if t in COMPOSITION_RELS else []:
+			better = ~decided & (type_scores(ct) > whole)
+			if better.any(): nts[better] = self.types.id(ct)
+			decided |= better
+		decided = found.copy()
+		for ct in SUBTYPING_RELS[t] if t in SUBTYPING_RELS else []:
+			present = ~decided & (type_scores(ct) > -np.inf)
+			if present.any(): nts[present] = self.types.id(ct)
+			decided |= present
+		return ucs, nts
+	def normalized_hits(self, t, entries = None):
+		''' Hits of the type each cell should be normalized into when cast into type t, among the given entries (or all of
+			them): returns a mapping from cell id to a mapping from output field name to the set of hit strings. '''
+		entries = self.all_entries() if entries is None else np.asarray(entries, dtype = np.int64)
+		if len(entries) < 1: return dict()
+		ucs, nts = self.normalization_types(t, entries)
+		entryNts = nts[np.searchsorted(ucs, self.cell[entries])]
+		selected = entries[(self.type[entries] == entryNts) & (self.mode[entries] != NEGATED_TYPE)]
+		res = { int(i): defaultdict(set) for i in ucs[nts >= 0] }
+		for (i, f, h) in zip(self.cell[selected].tolist(), self.field[selected].tolist(), self.hit[selected].tolist()):
+			hit = None if h < 0 else self.hits[h]
+			if isinstance(hit, list): res[i][self.fields[f]] |= set(hit)
+			else: res[i][self.fields[f]].add(str(hit))
+		return res
+
+def normalized_field_values(res):
+	''' Given the hits of a cell by output field name, returns its normalized values by (possibly suffixed) field name. '''
+	nvs = dict()
+	for (k, v) in res.items():
+		ucvs = unique_cell_values(v)
+		for i, ucv in enumerate(filter(lambda ucv: ucv is not None and len(ucv) > 0, ucvs)):
+			if i == 0: nvs[k] = ucv
+			else: nvs['{}.{}'.format(k, i + 1)] = ucv
+	return nvs
+
+def normalized_values_in_place(res, value):
+	''' Given the hits of a cell by output field name, returns the list of values replacing its original value. '''
+	s = set()
+	for (k, v) in res.items():
+		ucvs = unique_cell_values(v)
+		s |= set([ucv for ucv in ucvs if ucv is not None and len(ucv) > 0])
+	return list(s) if len(s) > 0 else [value]
+
 def cmp_hits(h1, h2):
 	if h1.span and h2.span:
 		c = h1.span[0] - h2.span[0] # Match beginning first
@@ -1207,21 +1742,35 @@ def cover_score(s1, s2):
 CONVERT_NAN_TO_EMPTY = True
 
 class Cell(object):
+	__slots__ = ('value', 'f', '_store', 'i')
 	def __init__(self, value, fieldName):
 		# Original value, of type string
 		self.value = value
 		if CONVERT_NAN_TO_EMPTY and self.value is np.nan:
 			self.value = ''
 		self.f = fieldName
-		# Map from type to a list of TypeInferences
-		self.tis = defaultdict(list)
-		# Negated types
-		self.nts = set()
-		# Posited (i.e. sufficiently diversified) types
-		self.pts = set()
-		# Mapping from normalized, augmented, or otherwise enriched field name to list of values for that field
-		self.values = dict()
+		# Store holding this cell's type inferences (shared by all cells of a field), and id of this cell in it
+		self._store = None
+		self.i = None
 	def __str__(self): return '{}: {}'.format(self.f, self.value)
+	@property
+	def store(self):
+		if self._store is None: self.attach(TypeInferenceStore(1), 0)
+		return self._store
+	def attach(self, store, i):
+		''' Binds this cell to id i of the given store (where its previous inferences, if any, should be copied). '''
+		if self._store is not None and self._store.count[self.i] > 0:
+			raise RuntimeError('Cannot move the type inferences of "{}" to another store'.format(self))
+		self._store = store
+		self.i = i
+	def snapshot(self):
+		''' Captures the matching state of this cell, which only grows as matchers run on it. '''
+		return int(self.store.count[self.i])
+	def restored(self, snapshot):
+		''' Returns a copy of this cell in the matching state it had when the given snapshot was taken. '''
+		c = Cell(self.value, self.f)
+		c.attach(self.store, self.store.copy_cell(self.i, snapshot))
+		return c
 	def value_to_match(self):
 		if self.value is not None:
 			s = stripped(self.value)
@@ -1229,16 +1778,17 @@ class Cell(object):
 		return None
 	def negate_type(self, t):
 		logging.debug('Negated type {} for "{}"'.format(t, self.value))
-		self.nts.add(t)
+		self.store.negate(self.i, t)
 	def posit_type(self, t):
 		''' Does the opposite of negating this type: more precisely, it indicates that there is enough diversity
 			across the entire value set, so that *if* any matcher for the type has enough recall, the field-wide
-			match will be accepted. '''
-		self.pts.add(t)
+			match will be accepted (hence the type gets posited for all cells sharing this cell's store). '''
+		self.store.posit(t)
 	def non_excluded_types(self):
-		return set(self.tis.keys()) & self.pts - self.nts
+		matched, negated = self.store.cell_types(self.i)
+		return matched & self.store.posited - negated
 	def matches(self, t, mm):
-		return [] if t not in self.non_excluded_types() else filter(lambda ti: ti.mm == mm, self.tis[t])
+		return [] if t not in self.non_excluded_types() else list([ti for ti in self.store.cell_inferences(self.i, t) if ti.mm == mm])
 	def normalized_type(self, t, outputFieldPrefix):
 		return '++{}++'.format(self.f if outputFieldPrefix is None or outputFieldPrefix == self.f else outputFieldPrefix + '.' + self.f)
 	def register_full_match(self, t, outputFieldPrefix, ms, hit = None):
@@ -1248,14 +1798,14 @@ class Cell(object):
 		if ms <= 0: return
 		t0 = self.normalized_type(t, outputFieldPrefix)
 		logging.debug('FULL MATCH of type <%s> for %s (p=%d): %s', t, self, ms, self.value if hit is None else hit)
-		self.tis[t].append(TypeInference(t0, FULL_MATCH, ms, self.value if hit is None else hit, 0, len(self.value)))
+		self.store.add(self.i, t, t0, FULL_MATCH, ms, self.value if hit is None else hit, 0, len(self.value))
 	def register_partial_match(self, t, outputFieldPrefix, ms, hit, span):
 		# TODO accept span = None and fetch start/end indices on-the-fly
 		if ms <= 0: return
 		checkSpan(hit, span)
 		t0 = self.normalized_type(t, outputFieldPrefix)
 		logging.debug('PARTIAL MATCH of type <%s> for %s (p=%d): %s', t, self, ms, hit)
-		self.tis[t].append(TypeInference(t0, PARTIAL_MATCH, ms, hit, span[0] if span else -1, span[1] if span else -1))
+		self.store.add(self.i, t, t0, PARTIAL_MATCH, ms, hit, span[0] if span else -1, span[1] if span else -1)
 	def register_cover_match(self, t, ms, tis):
 		if any(ti.mm == FULL_MATCH for ti in tis):
 			self.register_full_match(t, False, ms)
@@ -1269,50 +1819,17 @@ class Cell(object):
 				k = stis[j].span[1]
 			self.register_partial_match(t, False, ms, hit, (stis[0].span[0], stis[-1].span[1]))
 	def likeliest_type(self):
-		if len(self.tis) < 1: return None
-		scores = { t: max([ti.ms for ti in tis]) for (t, tis) in self.tis.items() }
+		scores = self.store.cell_scores(self.i)
+		if len(scores) < 1: return None
 		return sorted(scores.keys(), key = lambda t: scores[t], reverse = True)[0]
+	def normalized_hits(self, t):
+		return self.store.normalized_hits(t, self.store.cell_entries(self.i)).get(self.i, dict())
 	def normalized_values(self, t):
-		res = defaultdict(set)
-		nt = self.type_to_normalize(t)
-		if nt is not None:
-			for ti in self.tis[nt]:
-				if isinstance(ti.hit, list): res[ti.t] |= set(ti.hit)
-				else: res[ti.t].add(str(ti.hit))
-		nvs = dict()
-		for (k, v) in res.items():
-			ucvs = unique_cell_values(v)
-			for i, ucv in enumerate(filter(lambda ucv: ucv is not None and len(ucv) > 0, ucvs)):
-				if i == 0: nvs[k] = ucv
-				else: nvs['{}.{}'.format(k, i + 1)] = ucv
-		return nvs
+		return normalized_field_values(self.normalized_hits(t))
 	def normalized_values_in_place(self, t):
-		res = defaultdict(set)
-		s = set()
-		nt = self.type_to_normalize(t)
-		if nt is not None:
-			for ti in self.tis[nt]:
-				if isinstance(ti.hit, list): res[ti.t] |= set(ti.hit)
-				else: res[ti.t].add(str(ti.hit))
-			for (k, v) in res.items():
-				ucvs = unique_cell_values(v)
-				s |= set([ucv for ucv in ucvs if ucv is not None and len(ucv) > 0])
-		return list(s) if len(s) > 0 else [self.value]
-	def type_to_normalize(self, t):
-		if t in self.tis and t not in self.nts: 
-			whole_score = self.max_type_score(t)
-			if t in COMPOSITION_RELS:
-				for ct in COMPOSITION_RELS[t]:
-					if ct in self.tis and ct not in self.nts: 
-						part_score = self.max_type_score(ct)
-						if part_score > whole_score: return ct
-			return t
-		if t in SUBTYPING_RELS:
-			for ct in SUBTYPING_RELS[t]:
-				if ct in self.tis and ct not in self.nts: return ct
-		return None
+		return normalized_values_in_place(self.normalized_hits(t), self.value)
 	def max_type_score(self, t):
-		return 0 if t not in self.tis else max([ti.ms for ti in self.tis[t]])
+		return self.store.cell_scores(self.i).get(t, 0)
 
 def set_as_list_or_singleton(v):
 	s = set(v)
@@ -1334,40 +1851,81 @@ def unique_cell_values(vs, maxListLength = 3):
 		em[merger_by_token_list(v)].add(v)
 	return list([select_best_value(vs) for vs in em.values()])[:maxListLength]
 
-# TODO improve this custom date matcher if necessary by doing a first pass on all values at type inference time:
-# - matcher 1 with languages = ['fr', 'en'],
-#     settings = { 'DATE_ORDER': 'MDY', 'PREFER_LANGUAGE_DATE_ORDER': False } (the more likely one)
-# - matcher 2 with languages = ['fr', 'en'],
-#    settings = { 'DATE_ORDER': 'DMY', 'PREFER_LANGUAGE_DATE_ORDER': False }
-# - then retain the majority matcher for the subsequent type inference pass (and the normalization step as well)
 DDP = DateDataParser(languages = ['fr', 'en'], settings = { 'PREFER_LANGUAGE_DATE_ORDER': True })
 
+# Date formats tried on each column before falling back to dateparser, as (period, format with day-first order,
+# format with month-first order) triples (the second format being None when the order is not ambiguous)
+FAST_DATE_FORMATS = [
+	('day', '%Y-%m-%d', None), ('day', '%Y/%m/%d', None), ('day', '%Y.%m.%d', None),
+	('day', '%Y-%m-%d %H:%M:%S', None), ('day', '%Y-%m-%dT%H:%M:%S', None), ('day', '%Y-%m-%d %H:%M', None),
+	('day', '%d/%m/%Y', '%m/%d/%Y'), ('day', '%d-%m-%Y', '%m-%d-%Y'), ('day', '%d.%m.%Y', '%m.%d.%Y'),
+	('day', '%d/%m/%Y %H:%M:%S', '%m/%d/%Y %H:%M:%S'), ('day', '%d/%m/%Y %H:%M', '%m/%d/%Y %H:%M'),
+	('month', '%m/%Y', None), ('month', '%Y-%m', None)]
+# Number of distinct values of a column on which each format is tried to determine the dominant one
+DATE_FORMAT_SAMPLE_SIZE = 500
+# Min ratio (in percent) of sampled values which the dominant format should parse for the whole column to be parsed
+DATE_FORMAT_MIN_RATIO = 50
+
+def parse_date_format(values, fmt):
+	return pd.to_datetime(values, format = fmt, errors = 'coerce')
+
 class CustomDateMatcher(TypeMatcher):
+	''' Parses dates with dateparser, after a column-level pass parsing all values in the column's dominant format (if
+		any) at once, so that dateparser only runs on the values left over.
+
+		The day/month order of ambiguous dates in that format (e.g. 03/04/2014) is decided once per column, by a
+		majority of its unambiguous dates (e.g. 13/04/2014 vs. 04/13/2014). Without a majority, ambiguous dates are
+		left to dateparser. '''
 	def __init__(self):
 		super(CustomDateMatcher, self).__init__(F_DATE)
+		# Mapping from value (stripped of whitespace) to (period, year, month, day) for values parsed by the column-level pass
+		self.parsed = dict()
+	def prepare_field(self, f):
+		values = pd.Series(list(set(c.value.strip() for c in f.cells if c.value and not c.value.isdigit())), dtype = object)
+		self.parsed = dict()
+		if len(values) < 1: return
+		sample = values.sample(min(len(values), DATE_FORMAT_SAMPLE_SIZE), random_state = 0)
+		counts = [max(parse_date_format(sample, fmt).notna().sum() for fmt in fmts if fmt is not None)
+			for (_, *fmts) in FAST_DATE_FORMATS]
+		k = int(np.argmax(counts))
+		if counts[k] * 100 < len(sample) * DATE_FORMAT_MIN_RATIO: return
+		(period, dayFirst, monthFirst) = FAST_DATE_FORMATS[k]
+		dates = parse_date_format(values, dayFirst)
+		if monthFirst is not None:
+			mdDates = parse_date_format(values, monthFirst)
+			ambiguous = dates.notna() & mdDates.notna() & (dates != mdDates)
+			dmCount = (dates.notna() & mdDates.isna()).sum()
+			mdCount = (mdDates.notna() & dates.isna()).sum()
+			if mdCount > dmCount: dates = mdDates
+			if mdCount == dmCount: dates[ambiguous] = pd.NaT
+			logging.info('%s: %d day-first vs. %d month-first dates in %s format', self, dmCount, mdCount, dayFirst)
+		ok = dates.notna()
+		self.parsed = dict(zip(values[ok], zip(itertools.repeat(period), dates[ok].dt.year, dates[ok].dt.month, dates[ok].dt.day)))
+		logging.info('%s: parsed %d out of %d distinct values in %s format', self, len(self.parsed), len(values), dayFirst)
 	@timed
 	def match(self, c):
-		# TODO check prioritization of ambiguous dates: the most complex case would be first encountering some FR date(s),
-		# then an ambiguous date implicitly using US (not UK or AUS) locale (e.g. 03/04/2014 which should resolve to
-		# March 4th and not April 3rd)...
 		if c.value.isdigit():
 			raise TypeError('{} cannot parse date from numeric value "{}"'.format(self, c))
-		dd = DDP.get_date_data(c.value)
-		do, dp = dd['date_obj'], dd['period']
-		if do is None:
-			raise TypeError('{} found no date field from "{}"'.format(self, c))
-		y = do.year
+		v = c.value.strip()
+		if v in self.parsed:
+			(dp, y, m, d) = self.parsed[v]
+		else:
+			dd = DDP.get_date_data(c.value)
+			do, dp = dd['date_obj'], dd['period']
+			if do is None:
+				raise TypeError('{} found no date field from "{}"'.format(self, c))
+			(y, m, d) = (do.year, do.month, do.day)
 		if y < 1870 or 2120 < y:
 			raise ValueError('{} found no realistic date from "{}"'.format(self, c))
 		ds = str(y)
 		if dp == 'year':
 			self.register_full_match(c, F_YEAR, 100, ds)
 			return
-		ds = "{:02}/{}".format(do.month, ds)
+		ds = "{:02}/{}".format(m, ds)
 		if dp == 'month':
 			self.register_full_match(c, F_MONTH, 100, ds)
 		else:
-			self.register_full_match(c, F_DATE, 100, "{:02}/{}".format(do.day, ds))
+			self.register_full_match(c, F_DATE, 100, "{:02}/{}".format(d, ds))
 
 def score_phone_number(z): return 100 if phonenumbers.is_valid_number(z) else 75 if phonenumbers.is_possible_number(z) else 5
 
@@ -1403,7 +1961,7 @@ PAT_URL = "(https?|ftp)://[^\s/$.?#].[^\s]*"
 PRENOM_LEXICON = file_to_set('prenom')
 PATRONYME_LEXICON = file_to_set('patronyme_fr')
 
-PAT_FIRST_NAME = '(%s)' % '|'.join([p for p in PRENOM_LEXICON])
+PAT_FIRST_NAME = '(%s)' % trie_pattern(PRENOM_LEXICON)
 PAT_LAST_NAME = '([A-Z][A-Za-z]+\s?)+'
 PAT_LAST_NAME_ALLCAPS = '([A-Z][A-Z]+\s?)+'
 PAT_INITIAL = '([A-Z][\.\-\s]{1,3}){1,3}'
@@ -1584,14 +2142,20 @@ BAN_MAPPING = [
 
 
 class CustomAddressMatcher(TypeMatcher):
+	''' Parses addresses with libpostal, after a column-level pass parsing all values at once through the address parsing
+		service (which caches parse results and spreads cache misses over worker processes). '''
 	def __init__(self):
 		super(CustomAddressMatcher, self).__init__(F_ADDRESS)
+		# Mapping from value to its libpostal parse result, for the values of the current column
+		self.parsed = dict()
+	def prepare_field(self, f):
+		self.parsed = address_parsing.parse_addresses(c.value for c in f.cells if not c.value.isdigit())
 	@timed
 	def match(self, c):
 		if c.value.isdigit():
 			logging.debug('Bailing out of %s for numeric value: %s', self, c)
 			return
-		parsed = parse_address(c.value)
+		parsed = self.parsed[c.value] if c.value in self.parsed else address_parsing.parse_address(c.value)
 		if not parsed: return
 		ps = {key: value for (value, key) in parsed}
 		v = c.value.lower()
@@ -1618,30 +2182,51 @@ class CustomAddressMatcher(TypeMatcher):
 
 COMMUNE_LEXICON = file_to_set('commune')
 COUNTRY_FALLBACK = False
+# Number of values looked up by the geocoding backend at once (doubling with each lookup on a column, up to the max
+# batch size, so that few values get looked up in vain when the matcher bails out)
+MIN_GEOCODING_BATCH_SIZE = 8
+MAX_GEOCODING_BATCH_SIZE = 1024
 class FrenchAddressMatcher(LabelMatcher):
-	def __init__(self):
+	''' Matches French addresses against BAN features returned by a geocoding backend (by default the local BAN index if
+		present, the BAN search API otherwise), looking up the values of a column in batches. '''
+	def __init__(self, backend = None):
 		super(FrenchAddressMatcher, self).__init__(F_ADDRESS, COMMUNE_LEXICON, MATCH_MODE_EXACT)
+		self.backend = geocoding.default_backend() if backend is None else backend
+		self.prepare_field(None)
+	def prepare_field(self, f):
+		# Features by value looked up so far, values of the column left to look up and size of the next batch
+		self.features = dict()
+		self.pending = list() if f is None else list(dict.fromkeys(v for v in map(Cell.value_to_match, f.cells) if v and len(v) >= 4))
+		self.batchSize = MIN_GEOCODING_BATCH_SIZE
+	def search(self, v):
+		if v not in self.features:
+			pending = [u for u in self.pending[:self.batchSize] if u not in self.features]
+			self.pending = self.pending[self.batchSize:]
+			self.batchSize = min(2 * self.batchSize, MAX_GEOCODING_BATCH_SIZE)
+			try:
+				self.features.update(self.backend.search_all(pending + [v]))
+			except ConnectionError:
+				# Stop looking up values ahead, so that the requests sent before bailing out (after MAX_FATAL_COUNT
+				# connection errors) are only those of the values matched
+				self.batchSize = 0
+				raise
+		return self.features[v]
 	@timed
 	def match(self, c):
 		v = c.value_to_match()
 		if len(v) < 4: return
-		response = urllib.request.urlopen("http://api-adresse.data.gouv.fr/search/?q=" + urllib.parse.quote_plus(v))
-		resp = response.read().decode('utf-8')
-		data = json.loads(resp)
-		if not data or 'features' not in data: return
-		logging.debug('Returned %d results from api-adresse.data.gouv.fr for %s', len(data['features']), v)
+		features = self.search(v)
+		if features is None: return
 		# Quick and dirty way to have two-tier results since based on BAN address matching results, when parsing a
 		# coarse-grained entity (city or equivalent) the results at a finer level (street, etc.) are completely unreliable
 		# as basically they are random, if not made-up, street addresses and districts.
 		hits = [set(), set()]
-		for point in data['features']:
-			if 'properties' not in point: continue
-			props = point['properties']
+		iIdx = dict() # Build inverted index to register partial matches
+		for props in features:
 			if 'type' not in props:
-				logging.warning('Properties do not contain any geolocation feature type! %s', data)
+				logging.warning('Properties do not contain any geolocation feature type! %s', features)
 				continue
 			kind = props['type']
-			iIdx = dict() # Build inverted index to register partial matches
 			if kind in ['housenumber', 'street', 'place', 'locality']: # Accurate enough, trust the result
 				l = props['label']
 				if l not in iIdx: iIdx[l] = props
@@ -1722,6 +2307,7 @@ class VariantExpander(TypeMatcher):
 				self.tokenIdx[matchedVariantPhrase].add(altVariant)
 				if altVariant not in self.variantsMap:
 					raise RuntimeError('Alternative variant {} not found in variants map'.format(altVariant))
+		self.trie = TokenTrie(self.tokenIdx.keys())
 	@timed
 	def match(self, c):
 		if self.domainType is not None and self.domainType not in c.non_excluded_types():
@@ -1730,29 +2316,26 @@ class VariantExpander(TypeMatcher):
 		if tokens is None:
 			raise TypeError('{} found no non-trivial token sequence in "{}"'.format(self, c))
 		found_one = False
-		for k2 in range(self.maxTokens, 0, -1):
-			for k1 in range(0, len(tokens) + 1 - k2):
-				matchSrcTokens = tokens[k1:k1 + k2]
-				matchRefPhrase = ' '.join(matchSrcTokens)
-				if matchRefPhrase not in self.tokenIdx:
-					continue
-				for altVariant in self.tokenIdx[matchRefPhrase]:
-					score = self.scorer(matchSrcTokens, tokens, matchRefPhrase, altVariant)
-					v = case_phrase(c.value)
-					i1 = v.find(tokens[k1])
-					if i1 >= 0: i2 = v.find(tokens[k1 + k2 - 1], i1) if k2 > 1 else i1
-					mainVariant = self.variantsMap[altVariant]
-					logging.debug('%s matched on %s: "%s" expanded to main variant "%s"', self, matchRefPhrase, altVariant, mainVariant)
-					normedValue = ''.join([v[:i1], mainVariant, v[i2:]]) if self.keepContext else mainVariant
-					if i1 == 0 and k1 + k2 == len(tokens):
-						self.register_full_match(c, self.t, score, mainVariant)
-					elif i1 < 0 or i2 < 0:
-						logging.warning('%s could not find tokens "%s ... %s" in original "%s"', self, tokens[k1], tokens[k1 + k2 - 1], v)
-						self.register_full_match(c, self.t, score, mainVariant)
-					else:
-						span = (i1, i2 + len(tokens[k1 + k2 - 1]))
-						self.register_partial_match(c, self.t, score, mainVariant, span)
-					found_one = True
+		# All matching token sequences, longest first (then from left to right)
+		for (k1, k2, matchRefPhrase) in sorted(self.trie.matches(tokens), key = lambda m: (m[0] - m[1], m[0])):
+			matchSrcTokens = tokens[k1:k2]
+			for altVariant in self.tokenIdx[matchRefPhrase]:
+				score = self.scorer(matchSrcTokens, tokens, matchRefPhrase, altVariant)
+				v = case_phrase(c.value)
+				i1 = v.find(tokens[k1])
+				if i1 >= 0: i2 = v.find(tokens[k2 - 1], i1) if k2 - k1 > 1 else i1
+				mainVariant = self.variantsMap[altVariant]
+				logging.debug('%s matched on %s: "%s" expanded to main variant "%s"', self, matchRefPhrase, altVariant, mainVariant)
+				normedValue = ''.join([v[:i1], mainVariant, v[i2:]]) if self.keepContext else mainVariant
+				if i1 == 0 and k2 == len(tokens):
+					self.register_full_match(c, self.t, score, mainVariant)
+				elif i1 < 0 or i2 < 0:
+					logging.warning('%s could not find tokens "%s ... %s" in original "%s"', self, tokens[k1], tokens[k2 - 1], v)
+					self.register_full_match(c, self.t, score, mainVariant)
+				else:
+					span = (i1, i2 + len(tokens[k2 - 1]))
+					self.register_partial_match(c, self.t, score, mainVariant, span)
+				found_one = True
 		if not found_one:
 			raise ValueError('{} found no token sequence to expand in "{}"'.format(self, c))
 
@@ -1772,8 +2355,16 @@ def check_non_consecutive_subsequence(superStr, subStr):
 			pos += 1
 	return (res, i) if pos == len(b) else None
 
-def non_zero_ratio_score(scores, minRatio = 10):
-	r = sum([(100 if s > 0 else 0) for s in scores]) / len(scores)
+def non_zero_ratio_score(scores, minRatio = 10, weights = None):
+	if weights is None:
+		r = sum([(100 if s > 0 else 0) for s in scores]) / len(scores)
+	else:
+		r = sum([(100 * int(w) if s > 0 else 0) for (s, w) in zip(scores, weights)]) / int(sum(weights))
+	return r if r >= minRatio else 0
+
+def non_zero_ratio(count, total, minRatio = 10):
+	''' Same as non_zero_ratio_score given the (weighted) number of non-zero scores and the (weighted) total count. '''
+	r = float(100 * count) / total
 	return r if r >= minRatio else 0
 
 def header_matchers():
@@ -1852,8 +2443,8 @@ def generate_value_matchers(lvl = 1):
 
 	# from https://fr.wikipedia.org/wiki/Code_Insee#Identification_des_individus
 	if lvl >= 0: 
-		yield StdnumMatcher(F_NIR, stdnum.fr.nir.is_valid, stdnum.fr.nir.compact)
-		yield StdnumMatcher(F_NIF, stdnum.fr.nif.is_valid, stdnum.fr.nif.compact)
+		yield StdnumMatcher(F_NIR, stdnum.fr.nir.is_valid, stdnum.fr.nir.compact, partial(batch_digit_validator, ' .', 15, nir_checks))
+		yield StdnumMatcher(F_NIF, stdnum.fr.nif.is_valid, stdnum.fr.nif.compact, partial(batch_digit_validator, ' ', 13, nif_checks))
 		yield StdnumMatcher(F_TVA, stdnum.fr.tva.is_valid, stdnum.fr.tva.compact)
 	# if lvl >= 0: 
 	#     yield RegexMatcher(F_NIR, "[0-9]15")
@@ -1877,8 +2468,8 @@ def generate_value_matchers(lvl = 1):
 	PAT_SIREN = "[0-9]{9}"
 	PAT_SIRET = "[0-9]{14}"
 	if lvl >= 0: 
-		yield StdnumMatcher(F_SIREN, stdnum.fr.siren.is_valid, stdnum.fr.siren.compact)
-		yield StdnumMatcher(F_SIRET, stdnum.fr.siret.is_valid, stdnum.fr.siret.compact)
+		yield StdnumMatcher(F_SIREN, stdnum.fr.siren.is_valid, stdnum.fr.siren.compact, partial(batch_digit_validator, ' .', 9, siren_checks))
+		yield StdnumMatcher(F_SIRET, stdnum.fr.siret.is_valid, stdnum.fr.siret.compact, partial(batch_digit_validator, ' .', 14, siret_checks))
 	PAT_NNS = "[0-9]{9}[a-zA-Z]"
 	if lvl >= 0: 
 		yield RegexMatcher(F_NNS, PAT_NNS)
@@ -2100,17 +2691,119 @@ def post_process_headers(inferences, m):
 		logging.info('SINGLE HEADER MATCH on <%s>', m)
 		scores[0][0].boost(scores[0][1], m.t, .5)
 
+# Max number of distinct values recorded in a normalization memo (further values get normalized as usual)
+MAX_MEMO_SIZE = 2000000
+# Version of the layout of normalization memos (see save_versioned_pickle in storage.py)
+NORMALIZATION_MEMO_VERSION = 1
+
+class NormalizationMemo(object):
+	''' Memo of the in-place normalization of raw values by column type, which persists across the chunks of a
+		recode_types run and across runs of a project (from the MINI run to the full run, as well as re-runs): values
+		found in the memo are not matched again. A value gets the normalization of its first occurrence that went
+		through matching. The memo is tied to the source of this module and to the resource files, any change in which
+		starts it over. '''
+	FILE_NAME = 'normalization_memo.pickle'
+	def __init__(self, filePath = None):
+		self.filePath = filePath
+		# Mapping from type to a mapping from raw value to normalized value
+		self.values = defaultdict(dict)
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.modified = False
+		# Values recorded since the last call to drain (by type), if the memo is used in a worker process
+		self.recorded = None
+	@staticmethod
+	def version():
+		h = hashlib.sha1('{}|{}'.format(NORMALIZATION_MEMO_VERSION, file_digest(os.path.abspath(__file__))).encode('utf-8'))
+		for fileName in sorted(os.listdir(RESOURCE_PATH)):
+			filePath = os.path.join(RESOURCE_PATH, fileName)
+			if os.path.isfile(filePath): h.update('{}:{}'.format(fileName, file_digest(filePath)).encode('utf-8'))
+		return h.hexdigest()
+	@staticmethod
+	def load(filePath):
+		''' Reads the memo stored at filePath, or returns an empty one if it is missing, unreadable or stale. '''
+		memo = NormalizationMemo(filePath)
+		values = load_versioned_pickle(filePath, NormalizationMemo.version())
+		if values is None: return memo
+		memo.values.update(values)
+		memo.size = sum(len(d) for d in values.values())
+		logging.info('Loaded normalization memo %s with %d values', filePath, memo.size)
+		return memo
+	def save(self):
+		''' Writes this memo (atomically) if any value was recorded since it was loaded. '''
+		if self.filePath is None or not self.modified: return
+		try:
+			save_versioned_pickle(self.filePath, NormalizationMemo.version(), dict(self.values))
+			self.modified = False
+		except (OSError, pickle.PicklingError) as e:
+			logging.warning('Could not write normalization memo %s: %s', self.filePath, e)
+	def lookup(self, t, values):
+		''' Returns a boolean mask of the values (a Series) found in this memo for type t, along with their normalized
+			values, and updates hit and miss counts. '''
+		d = self.values.get(t, dict())
+		codes, uniques = pd.factorize(values)
+		# Missing values come last, and are looked up as their cells' value
+		nvs = [(d.get(v) if isinstance(v, str) else None) for v in uniques] + [d.get('') if CONVERT_NAN_TO_EMPTY else None]
+		known = np.array([nv is not None for nv in nvs])[codes]
+		hits = int(np.count_nonzero(known))
+		self.hits += hits
+		self.misses += len(known) - hits
+		return known, np.array(nvs, dtype = object)[codes][known]
+	def record(self, t, f, newValues):
+		''' Records the new value of each cell of field f which went through matching (given the list of new values
+			by cell). '''
+		d = self.values[t]
+		for j in np.flatnonzero(f.visited):
+			if self.size >= MAX_MEMO_SIZE:
+				logging.warning('Normalization memo is full (%d values)', self.size)
+				return
+			v = f.cells[j].value
+			if not isinstance(v, str) or v in d: continue
+			d[v] = newValues[j]
+			self.size += 1
+			self.modified = True
+			if self.recorded is not None: self.recorded[t][v] = newValues[j]
+	def for_worker(self):
+		''' Starts keeping track of the values recorded in this memo, for it to be used in a worker process whose updates
+			are merged into the memo of the parent process (see drain and merge). '''
+		self.recorded = defaultdict(dict)
+	def drain(self):
+		''' Returns the values recorded and the hit and miss counts since the last call (or the call to for_worker). '''
+		drained = (dict(self.recorded), self.hits, self.misses)
+		self.recorded = defaultdict(dict)
+		self.hits, self.misses = 0, 0
+		return drained
+	def merge(self, drained):
+		''' Merges the updates of a memo used in a worker process (as returned by its drain method). '''
+		(recorded, hits, misses) = drained
+		self.hits += hits
+		self.misses += misses
+		for (t, values) in recorded.items():
+			d = self.values[t]
+			for (v, nv) in values.items():
+				if self.size >= MAX_MEMO_SIZE:
+					logging.warning('Normalization memo is full (%d values)', self.size)
+					return
+				if v in d: continue
+				d[v] = nv
+				self.size += 1
+				self.modified = True
+	def stats(self):
+		return { 'hits': self.hits, 'misses': self.misses, 'size': self.size }
+
 ### API method implementations (using Pandas DataFrames as input/output)
 
 def infer_types(tab, params = None):
 	'''  Infers column types for the input array and produces a dictionary of column name to likeliest types. '''
-	fields = parse_fields_from_Panda(tab)
+	fields = parse_fields_from_Panda(tab, distinct = (params or dict()).get('distinct_values', GROUP_BY_DISTINCT_VALUE))
 	return { 
-		'column_types': fields.infer_types(), 
+		'column_types': fields.infer_types(processes = matching_processes(params), settled_types = settling_types(params)), 
 		'all_types': all_data_types(),
-		'type_tags': type_tags() }
+		'type_tags': type_tags(),
+		'skipped_matchers': fields.skippedMatchers }
 
-def normalize_values(tab, params):
+def normalize_values(tab, params, memo = None):
 	''' Normalizes the values in each column whose type has been identified, and returns the input array after adding the
 		resulting new columns.
 
@@ -2118,11 +2811,25 @@ def normalize_values(tab, params):
 		- extracted components for a composite type
 		- variants for a data type within a domain rich in lexical variations like synonyms, etc. '''
 	modified = pd.DataFrame(False, index=tab.index, columns=tab.columns)
-	fields = parse_fields_from_Panda(tab)
 	# Fetch results of previous step (type inference) so as to avoid duplicative work
 	trusted_types = params['column_types']
-	fields.match_by_types(trusted_types)
-	for (originalField, newCol) in fields.normalize_values_in_place(trusted_types):
+	# Values already normalized in a previous chunk or run (if a memo is specified) are only matched again
+	known, memoized = dict(), dict()
+	if memo is not None:
+		for (h, t) in trusted_types.items():
+			if h in tab.columns: known[h], memoized[h] = memo.lookup(t, tab[h])
+	rows = { h: ~k for (h, k) in known.items() }
+	newCols = dict()
+	if memo is None or any(r.any() for r in rows.values()):
+		fields = parse_fields_from_Panda(tab, distinct = params.get('distinct_values', GROUP_BY_DISTINCT_VALUE), rows = rows)
+		fields.match_by_types(trusted_types, processes = matching_processes(params))
+		newCols = dict(fields.normalize_values_in_place(trusted_types, memo))
+	for h in known.keys():
+		newCol = tab[h].to_numpy(dtype = object, copy = True)
+		newCol[known[h]] = memoized[h]
+		if h in newCols: newCol[rows[h]] = newCols[h]
+		newCols[h] = newCol
+	for (originalField, newCol) in newCols.items():
 		modified[originalField] = (tab[originalField] != newCol)
 		tab.loc[:, originalField] = newCol
 	return tab, modified
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Uniform random sample of the rows of an entire file, built while the file is
+read on upload (no second pass) and stored next to the uploaded file.
+
+Rows are selected by reservoir sampling (Algorithm R): the first `capacity`
+rows fill the reservoir, then the row at position t (starting at 0) replaces
+a random row of the reservoir with probability capacity / (t + 1). Draws are
+made for all rows of a chunk at once, and only the rows that enter the
+reservoir are kept in memory (these are dropped again once replaced), so
+memory is bounded by the capacity, whatever the size of the file.
+
+The sample (FILE__sample.json) holds the positions of the rows in the file
+along with their values, so that samplers (get_sample, make_mini) can use
+it without reading the file. The rows of a file produced by transforms on
+the uploaded file (which keep rows in place) are found at the same positions:
+they are collected while that file is written (see follower) and stored next
+to it.
+"""
+
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from storage import atomic_write
+
+# Max number of rows in samples (also the default size of MINI files)
+SAMPLE_CAPACITY = 3000
+
+
+class RowSample():
+    '''Reservoir sample of the rows of a file'''
+    FILE_SUFFIX = '__sample.json'
+
+    def __init__(self, file_path=None, capacity=SAMPLE_CAPACITY):
+        self.file_path = file_path
+        self.capacity = capacity
+        self.nrows = 0
+        # Position in the file of the row in each slot of the reservoir
+        self.slots = np.empty(0, dtype=np.int64)
+        # Rows that entered the reservoir (indexed by position), some of which
+        # may have been replaced since
+        self._parts = []
+        self._num_kept = 0
+        # Positions of the rows to collect (samples filled by follow)
+        self._followed = None
+
+    def update(self, tab):
+        '''Adds the rows of a chunk of the file (pandas DataFrame) and returns it'''
+        positions = np.arange(self.nrows, self.nrows + len(tab))
+        num_fill = max(min(self.capacity - len(self.slots), len(tab)), 0)
+        self.slots = np.concatenate([self.slots, positions[:num_fill]])
+        selected = positions[:num_fill]
+
+        rest = positions[num_fill:]
+        if len(rest):
+            draws = np.random.randint(0, rest + 1)
+            kept = draws < self.capacity
+            # When a slot is drawn several times, the last row drawn is kept
+            slots, last = np.unique(draws[kept][::-1], return_index=True)
+            winners = rest[kept][::-1][last]
+            self.slots[slots] = winners
+            selected = np.concatenate([selected, np.sort(winners)])
+
+        if len(selected):
+            part_tab = tab.iloc[selected - self.nrows]
+            part_tab.index = selected
+            self._parts.append(part_tab)
+            self._num_kept += len(part_tab)
+        self.nrows += len(tab)
+
+        if self._num_kept > 2 * self.capacity:
+            self._compact()
+        return tab
+
+    def _compact(self):
+        '''Drops the rows that were replaced'''
+        if len(self._parts) > 1 or self._num_kept != len(self.slots):
+            rows = pd.concat(self._parts).loc[self.index]
+            self._parts = [rows]
+            self._num_kept = len(rows)
+
+    @property
+    def index(self):
+        '''Positions of the rows of the sample in the file (sorted)'''
+        return np.sort(self.slots)
+
+    @property
+    def rows(self):
+        '''Rows of the sample, in file order and indexed by position (None
+        if no row was read)'''
+        if not self._parts:
+            return None
+        self._compact()
+        return self._parts[0]
+
+    def subsample(self, size):
+        '''Random rows of the sample (at most size), in file order'''
+        rows = self.rows
+        if rows is None or len(rows) <= size:
+            return rows
+        return rows.loc[np.sort(np.random.choice(rows.index, size, replace=False))]
+
+    def follower(self, file_path=None):
+        '''Empty sample of the rows at the same positions in another version
+        of the file (ex: after transforms), to be filled by follow as that
+        version is written'''
+        sample = RowSample(file_path, self.capacity)
+        sample._followed = self.index
+        return sample
+
+    def follow(self, tab):
+        '''Keeps the rows of a chunk of the file (pandas DataFrame) that are
+        at the positions followed and returns it'''
+        start = self.nrows
+        in_part = self._followed[(self._followed >= start) \
+                                 & (self._followed < start + len(tab))]
+        if len(in_part):
+            part_tab = tab.iloc[in_part - start]
+            part_tab.index = in_part
+            self._parts.append(part_tab)
+            self._num_kept += len(part_tab)
+            self.slots = np.concatenate([self.slots, in_part])
+        self.nrows += len(tab)
+        return tab
+
+    @classmethod
+    def load(cls, file_path):
+        '''Reads the sample stored at file_path (None if missing or unreadable)'''
+        try:
+            with open(file_path) as f:
+                sample_dict = json.load(f)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning('Could not load sample {0}: {1}'.format(file_path, e))
+            return None
+        sample = cls(file_path, sample_dict['capacity'])
+        sample.nrows = sample_dict['nrows']
+        sample.slots = np.array(sample_dict['index'], dtype=np.int64)
+        rows = pd.DataFrame(sample_dict['data'], index=sample.slots,
+                            columns=sample_dict['columns'], dtype=object)
+        sample._parts = [rows]
+        sample._num_kept = len(rows)
+        return sample
+
+    def save(self):
+        '''Writes the sample (atomically)'''
+        if (self.file_path is None) or (self.rows is None):
+            return
+        rows = self.rows.astype(object)
+        rows = rows.where(rows.notnull(), None)
+        try:
+            with atomic_write(self.file_path) as w:
+                json.dump({'capacity': self.capacity,
+                           'nrows': self.nrows,
+                           'columns': list(rows.columns),
+                           'index': rows.index.tolist(),
+                           'data': rows.values.tolist()}, w, default=str)
+        except OSError as e:
+            logging.warning('Could not write sample {0}: {1}'.format(self.file_path, e))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detection of the encoding and separator of uploaded CSV files from a bounded
+sample of their first bytes, so that files are then parsed only once.
+
+Encoding:
+    - a byte order mark decides (UTF-8 or UTF-16)
+    - otherwise UTF-8 if the sample is valid UTF-8
+    - otherwise windows-1252 if the sample has characters that are printable
+      in windows-1252 but control characters in ISO-8859-1 (bytes 0x80 to
+      0x9F: € ‘ ’ “ ” – — œ ...), ISO-8859-1 if not
+
+Separator: the records of the sample are split with each candidate separator
+(taking quotes into account). Separators for which records have more fields
+than the header (which pandas fails to parse) are rejected, and the separator
+that gives the most fields in the header is chosen (then the one for which
+the most records have as many fields as the header).
+"""
+
+import codecs
+import csv
+import io
+
+# Max number of bytes read to detect the encoding and separator
+SNIFF_BYTES = 512 * 1024
+
+SEPARATORS = [';', ',', '\t']
+
+# Bytes that are printable in windows-1252 but not in ISO-8859-1 (other
+# bytes in 0x80-0x9F are undefined in windows-1252 as well)
+WINDOWS_1252_BYTES = set(range(0x80, 0xA0)) - {0x81, 0x8D, 0x8F, 0x90, 0x9D}
+
+# Byte order marks, by encoding (as read with pandas)
+BOMS = [(codecs.BOM_UTF8, 'utf-8'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16')]
+
+
+class _PrefixedReader(io.RawIOBase):
+    '''Binary file object reading prefix, then the rest of file'''
+    def __init__(self, prefix, file):
+        self.prefix = prefix
+        self.file = file
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.file.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_sample(file):
+    '''
+    Reads the first bytes of a binary file object.
+
+    OUTPUT:
+        - sample: the first SNIFF_BYTES bytes (at most)
+        - file: file object from which the entire file can still be read
+    '''
+    if file.seekable():
+        start = file.tell()
+        sample = file.read(SNIFF_BYTES)
+        file.seek(start)
+        return sample, file
+    sample = file.read(SNIFF_BYTES)
+    return sample, io.BufferedReader(_PrefixedReader(sample, file))
+
+
+def sniff_encoding(sample):
+    '''Encoding of a file from a sample of its first bytes'''
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # The sample may end in the middle of a character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if WINDOWS_1252_BYTES.intersection(sample):
+        return 'windows-1252'
+    return 'ISO-8859-1'
+
+
+def _records(text, sep, truncated):
+    '''Records of text split with the separator sep (without blank lines,
+    and without the last record if text is truncated)'''
+    records = [record for record in csv.reader(io.StringIO(text), delimiter=sep) if record]
+    if truncated and len(records) > 1:
+        return records[:-1]
+    return records
+
+
+def separator_score(text, sep, truncated=True):
+    '''
+    How well sep splits the records of text: (number of fields of the
+    header, share of records with as many fields), None if pandas would
+    fail to parse the records with sep
+    '''
+    try:
+        records = _records(text, sep, truncated)
+    except csv.Error:
+        return None
+    if not records:
+        return None
+    num_fields = len(records[0])
+    rows = records[1:]
+    # Records with one more field than the header are read with the first
+    # field as index by pandas, if the first one has one more field
+    max_fields = num_fields + 1 if rows and len(rows[0]) == num_fields + 1 else num_fields
+    if any(len(row) > max_fields for row in rows):
+        return None
+    consistent = sum(len(row) == num_fields for row in rows) / len(rows) if rows else 1
+    return num_fields, consistent
+
+
+def sniff_separator(text, truncated=True):
+    '''Separator of CSV text (None if no separator can parse it)'''
+    best_sep = None
+    best_score = None
+    for sep in SEPARATORS:
+        score = separator_score(text, sep, truncated)
+        if (score is not None) and ((best_score is None) or (score >= best_score)):
+            best_sep = sep
+            best_score = score
+    return best_sep
+
+
+def sniff(sample):
+    '''
+    Encoding and separator of a CSV file from a sample of its first bytes
+
+    OUTPUT:
+        - encoding: as accepted by pandas.read_csv
+        - sep: separator
+    '''
+    encoding = sniff_encoding(sample)
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=False)
+    sep = sniff_separator(text.lstrip('\ufeff'), truncated=len(sample) >= SNIFF_BYTES)
+    if sep is None:
+        raise ValueError('Separator and/or Encoding not detected. Try uploading' \
+                         ' a csv with "," as separator with utf-8 encoding')
+    return encoding, sep
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storage backends for the tables that data projects write between modules.
+
+Data is always written from, and read back to, generators of pandas DataFrames
+of (at most) CHUNKSIZE rows with a continuous index across chunks, as produced
+by pandas.read_csv with chunksize (modules such as concat_with_init rely on
+chunks lining up across files).
+
+CSV is used for files read outside of the project (upload, final outputs for
+download, indexing and linking). Intermediate files, which are only read back
+by the next module, can be stored as Parquet (requires pyarrow): columns can
+be read selectively without parsing the entire file, types are kept, and
+string columns are dictionary-encoded on disk.
+
+In CSV files, __MODIFIED columns (mostly False) are written as bitmaps next
+to the data file (see modified_bitmaps.py) and expanded back to columns when
+read. Parquet already stores booleans as bit-packed, run-length encoded
+columns.
+
+Smaller files kept next to data files or in resource directories (samples,
+summaries, manifests, caches) are written atomically (atomic_write), so that
+concurrent readers never see a partial file. Caches and memos are pickled
+along with the version of their layout (save_versioned_pickle).
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import logging
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from modified_bitmaps import ModifiedBitmaps, is_modified_column, modified_path
+
+# Name of the backend used for intermediate files (None to use Parquet if
+# pyarrow is installed, CSV otherwise)
+INTERMEDIATE_STORAGE = None
+
+
+class ModifiedBitmapsWriter():
+    '''Writes DataFrames without their __MODIFIED columns, which are saved as
+    bitmaps when the writer is closed'''
+    def __init__(self, writer, file_path):
+        self.writer = writer
+        self.file_path = file_path
+        self.bitmaps = ModifiedBitmaps()
+
+    @property
+    def nrows(self):
+        return self.writer.nrows
+
+    def write(self, part_tab):
+        self.writer.write(self.bitmaps.append(part_tab))
+
+    def close(self):
+        self.writer.close()
+        if self.bitmaps.modified_columns:
+            self.bitmaps.save(modified_path(self.file_path))
+        elif os.path.isfile(modified_path(self.file_path)):
+            os.remove(modified_path(self.file_path))
+
+
+class Storage(ABC):
+    '''Base class of storage backends'''
+    EXTENSION = None
+    # Whether __MODIFIED columns are written as bitmaps (by default) rather
+    # than as columns of the data file
+    MODIFIED_BITMAPS = True
+
+    @abstractmethod
+    def _header(self, file_path):
+        '''Columns of the data file'''
+
+    @abstractmethod
+    def _read(self, file_path, dtype, columns=None, nrows=None, chunksize=None):
+        '''Generator of DataFrames from the data file (a single DataFrame if
+        chunksize is None)'''
+
+    @abstractmethod
+    def _writer(self, file_path):
+        '''Writer of the data file (with write, close and nrows)'''
+
+    @abstractmethod
+    def _concat(self, file_paths, file_path):
+        '''Writes the rows of the data files in file_paths to file_path'''
+
+    def header(self, file_path):
+        bitmaps = ModifiedBitmaps.load(modified_path(file_path))
+        if bitmaps is not None:
+            return bitmaps.columns
+        return self._header(file_path)
+
+    def read(self, file_path, dtype, columns=None, nrows=None, chunksize=None):
+        '''Generator of DataFrames from the file, with columns (all columns
+        if None) in the order of the file (dtype maps columns to types)'''
+        bitmaps = ModifiedBitmaps.load(modified_path(file_path))
+        if bitmaps is None:
+            return self._read(file_path, dtype, columns, nrows, chunksize)
+
+        if columns is not None:
+            columns = [col for col in bitmaps.columns if col in set(columns)]
+        else:
+            columns = bitmaps.columns
+        expanded = [col for col in columns if col in bitmaps.modified_columns]
+        # At least one column is read for the number of rows
+        to_read = [col for col in columns if col not in expanded] \
+                    or [col for col in bitmaps.columns if not is_modified_column(col)][:1]
+        if dtype is not None:
+            dtype = {col: dtype[col] for col in to_read if col in dtype}
+        tab_gen = self._read(file_path, dtype, to_read, nrows, chunksize)
+        if chunksize is None:
+            tab_gen = [tab_gen]
+
+        def _expand(tab_gen):
+            start = 0
+            for part_tab in tab_gen:
+                modified = pd.DataFrame({col: bitmaps.expand(col, start, start + len(part_tab)) \
+                                         for col in expanded}, index=part_tab.index)
+                start += len(part_tab)
+                yield pd.concat([part_tab, modified], axis=1)[columns]
+        if chunksize is None:
+            return next(_expand(tab_gen))
+        return _expand(tab_gen)
+
+    def writer(self, file_path, modified_bitmaps=None):
+        '''Writer to which DataFrames can be written one at a time (with the
+        columns of the first one), and which must be closed'''
+        if modified_bitmaps is None:
+            modified_bitmaps = self.MODIFIED_BITMAPS
+        if modified_bitmaps:
+            return ModifiedBitmapsWriter(self._writer(file_path), file_path)
+        return self._writer(file_path)
+
+    def write(self, file_path, tab_gen, modified_bitmaps=None):
+        '''Writes all DataFrames generated by tab_gen and returns the number of
+        rows written'''
+        writer = self.writer(file_path, modified_bitmaps)
+        try:
+            for i, part_tab in enumerate(tab_gen):
+                logging.debug('At part {0}'.format(i))
+                writer.write(part_tab)
+        finally:
+            writer.close()
+        return writer.nrows
+
+    def concat(self, file_paths, file_path):
+        '''Writes the rows of all files in file_paths (with the same columns)
+        to file_path, in order'''
+        self._concat(file_paths, file_path)
+        all_bitmaps = [ModifiedBitmaps.load(modified_path(path)) for path in file_paths]
+        if all_bitmaps and all(bitmaps is not None for bitmaps in all_bitmaps):
+            ModifiedBitmaps.concat(all_bitmaps).save(modified_path(file_path))
+
+    def modified_counts(self, file_path):
+        '''Number of modified values by column of a data file, computed from its
+        bitmaps (None if its modifications are not stored as bitmaps)'''
+        bitmaps = ModifiedBitmaps.load(modified_path(file_path))
+        if bitmaps is None:
+            return None
+        return bitmaps.counts()
+
+
+class CsvWriter():
+    def __init__(self, file_path):
+        self.file = open(file_path, 'w')
+        self.columns = None
+        self.nrows = 0
+
+    def write(self, part_tab):
+        # Write header with the first DataFrame only
+        header = self.columns is None
+        if header:
+            self.columns = part_tab.columns
+        part_tab[self.columns].to_csv(self.file, encoding='utf-8',
+                                      index=False,
+                                      header=header)
+        self.nrows += len(part_tab)
+
+    def close(self):
+        self.file.close()
+
+
+class CsvStorage(Storage):
+    EXTENSION = '.csv'
+
+    def _header(self, file_path):
+        return list(pd.read_csv(file_path, encoding='utf-8', nrows=0).columns)
+
+    def _read(self, file_path, dtype, columns=None, nrows=None, chunksize=None):
+        return pd.read_csv(file_path, encoding='utf-8', dtype=dtype,
+                           nrows=nrows, usecols=columns, chunksize=chunksize)
+
+    def _writer(self, file_path):
+        return CsvWriter(file_path)
+
+    def _concat(self, file_paths, file_path):
+        with open(file_path, 'wb') as w:
+            for i, path in enumerate(file_paths):
+                with open(path, 'rb') as r:
+                    # Keep the header of the first file only
+                    if i:
+                        r.readline()
+                    shutil.copyfileobj(r, w)
+
+
+class ParquetWriter():
+    '''Writes each DataFrame as a row group'''
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.writer = None
+        self.nrows = 0
+
+    @staticmethod
+    def _arrow_type(series):
+        import pyarrow as pa
+        if pd.api.types.is_bool_dtype(series.dtype):
+            return pa.bool_()
+        if pd.api.types.is_float_dtype(series.dtype):
+            return pa.float64()
+        if pd.api.types.is_integer_dtype(series.dtype):
+            return pa.int64()
+        return pa.string()
+
+    def write(self, part_tab):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self.writer is None:
+            self.columns = list(part_tab.columns)
+            # Columns of strings (as read with dtype=str) are typed as such
+            # even if they are empty in the first DataFrame
+            self.schema = pa.schema([(col, self._arrow_type(part_tab[col])) for col in self.columns])
+            self.writer = pq.ParquetWriter(self.file_path, self.schema, use_dictionary=True)
+        table = pa.Table.from_pandas(part_tab[self.columns], schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+        self.nrows += len(part_tab)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ParquetStorage(Storage):
+    EXTENSION = '.parquet'
+    MODIFIED_BITMAPS = False
+
+    def __init__(self):
+        # Fail early if pyarrow is missing
+        import pyarrow.parquet
+
+    def _header(self, file_path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file_path).schema_arrow.names
+
+    def _read(self, file_path, dtype, columns=None, nrows=None, chunksize=None):
+        '''Generator of DataFrames from the file (types are those stored:
+        dtype is ignored)'''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file_path)
+        num_rows = parquet_file.metadata.num_rows
+        if nrows is not None:
+            num_rows = min(num_rows, nrows)
+        chunksize = chunksize or max(num_rows, 1)
+        if columns is not None:
+            # Same column order as read_csv with usecols
+            columns = [col for col in parquet_file.schema_arrow.names if col in set(columns)]
+
+        # Batches do not cross row groups, so they are regrouped to match
+        # chunksize exactly
+        batches = parquet_file.iter_batches(batch_size=chunksize, columns=columns)
+        buffer = []
+        buffered = 0
+        start = 0
+        while start < num_rows:
+            while buffered < min(chunksize, num_rows - start):
+                batch = next(batches)
+                buffer.append(pa.Table.from_batches([batch]))
+                buffered += batch.num_rows
+            table = pa.concat_tables(buffer)
+            size = min(chunksize, num_rows - start)
+            part_tab = table.slice(0, size).to_pandas()
+            part_tab.index = pd.RangeIndex(start, start + size)
+            # Missing strings are None in columns of objects (pandas < 3), but
+            # NaN when reading CSV files with dtype=str
+            for col in part_tab.columns[(part_tab.dtypes == object).values]:
+                part_tab.loc[part_tab[col].isnull().values, col] = np.nan
+            buffer = [table.slice(size)]
+            buffered -= size
+            start += size
+            yield part_tab
+
+    def _writer(self, file_path):
+        return ParquetWriter(file_path)
+
+    def modified_counts(self, file_path):
+        '''Counts from the __MODIFIED columns (only these are read)'''
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        counts = super().modified_counts(file_path)
+        if counts is None:
+            columns = list(filter(is_modified_column, self.header(file_path)))
+            table = pq.read_table(file_path, columns=columns)
+            counts = {col.split('__MODIFIED')[0]: int(pc.sum(table[col]).as_py() or 0) \
+                      for col in columns}
+        return counts
+
+    def _concat(self, file_paths, file_path):
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for path in file_paths:
+                table = pq.read_table(path)
+                if writer is None:
+                    writer = pq.ParquetWriter(file_path, table.schema, use_dictionary=True)
+                # Types are those of the first file (columns that are empty 
+                # in a file may be typed differently)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+STORAGE_BACKENDS = {'csv': CsvStorage, 'parquet': ParquetStorage}
+
+def intermediate_storage():
+    '''Backend used for intermediate files'''
+    name = INTERMEDIATE_STORAGE
+    if name is None:
+        try:
+            import pyarrow.parquet
+            name = 'parquet'
+        except ImportError:
+            name = 'csv'
+    return STORAGE_BACKENDS[name]()
+
+def storage_for(file_path):
+    '''Backend of a file (from its extension)'''
+    if os.path.splitext(file_path)[1] == ParquetStorage.EXTENSION:
+        return ParquetStorage()
+    return CsvStorage()
+
+def move(file_path, new_file_path):
+    '''Moves a data file (and its bitmaps) to new_file_path, replacing any
+    file there'''
+    os.replace(file_path, new_file_path)
+    if os.path.isfile(modified_path(file_path)):
+        os.replace(modified_path(file_path), modified_path(new_file_path))
+    elif os.path.isfile(modified_path(new_file_path)):
+        os.remove(modified_path(new_file_path))
+
+def remove(file_path):
+    '''Removes a data file (and its bitmaps)'''
+    os.remove(file_path)
+    if os.path.isfile(modified_path(file_path)):
+        os.remove(modified_path(file_path))
+
+def modified_counts(file_path):
+    '''Number of modified values by column of a data file (None if they can
+    not be counted without reading the entire file)'''
+    return storage_for(file_path).modified_counts(file_path)
+
+@contextmanager
+def atomic_write(file_path, mode='w'):
+    '''Opens a temporary file next to file_path, which replaces file_path
+    once the block exits without error (and is removed otherwise)'''
+    tmp_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+
+# Versioned pickle files hold a (version, value) pair. The version of a kind
+# of file is to be bumped whenever the layout of its value changes (or the
+# code producing it, when the file is a cache), so that stale files get
+# ignored rather than misread.
+
+def save_versioned_pickle(file_path, version, value):
+    '''Writes value along with version to file_path (atomically), creating
+    its directory if needed'''
+    dir_path = os.path.dirname(file_path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    with atomic_write(file_path, 'wb') as f:
+        pickle.dump((version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_versioned_pickle(file_path, version):
+    '''Reads the value written by save_versioned_pickle to file_path (None if
+    missing, unreadable or of another version)'''
+    try:
+        with open(file_path, 'rb') as f:
+            file_version, value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logging.warning('Could not load {0}: {1}'.format(file_path, e))
+        return None
+    if file_version != version:
+        logging.info('Ignoring stale file {0}'.format(file_path))
+        return None
+    return value
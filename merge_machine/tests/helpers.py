@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Data shared by the tests of the modules that process data by chunks.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def make_tab(num_rows, start=0, modified=None):
+    '''
+    DataFrame of the rows at positions start to start + num_rows (excluded)
+    of a file, indexed by position
+
+    INPUT:
+        - modified: values of a "nom__MODIFIED" column (booleans, one per
+                row), which is omitted if None
+    OUTPUT:
+        - tab: DataFrame with columns "pos" (position of each row), "nom"
+                and "ville" (strings), and "nom__MODIFIED"
+    '''
+    positions = np.arange(start, start + num_rows)
+    tab = pd.DataFrame({'pos': positions,
+                        'nom': ['nom_{0}'.format(i) for i in positions],
+                        'ville': ['ville_{0}'.format(i % 7) for i in positions]},
+                       index=pd.RangeIndex(start, start + num_rows))
+    if modified is not None:
+        tab['nom__MODIFIED'] = np.array(modified, dtype=bool)
+    return tab
+
+
+def make_chunks(num_rows, chunksize, modified=None):
+    '''DataFrames of make_tab(num_rows, modified=modified) by chunks of (at
+    most) chunksize rows, with a continuous index as read by storage.py'''
+    tab = make_tab(num_rows, modified=modified)
+    return [tab.iloc[start:start + chunksize] for start in range(0, num_rows, chunksize)]
+
+
+def feed(method, chunks):
+    '''Calls method (ex: RowSample(...).update) on each chunk and returns the
+    object it is bound to'''
+    for part_tab in chunks:
+        method(part_tab)
+    return method.__self__
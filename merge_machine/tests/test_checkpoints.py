@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resuming and truncating checkpoints of interrupted jobs (checkpoints.py):
+a job that is interrupted after some chunks and run again writes the same
+file as a job that was not interrupted.
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from checkpoints import Checkpoint
+from helpers import make_chunks
+from storage import CsvStorage
+
+SIGNATURE = {'source': ['INIT/f.csv', 1000, 0.0], 'transforms': [['replace_mvs', {'thresh': 0.6}]]}
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'f.csv')
+        self.storage = CsvStorage()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def read(self):
+        return self.storage.read(self.file_path, dtype={'nom': str, 'ville': str})
+
+    def interrupt_after(self, chunks, num_chunks):
+        '''Runs a job that stops after writing num_chunks chunks'''
+        checkpoint = Checkpoint(self.file_path, SIGNATURE)
+        tab_gen = checkpoint.write_through(self.storage, chunks, 0,
+                                           get_info=lambda: {'chunks': num_chunks})
+        for _ in range(num_chunks):
+            next(tab_gen)
+        tab_gen.close()
+
+    def test_resume(self):
+        chunks = make_chunks(100, 30)
+        self.interrupt_after(chunks, 2)
+
+        checkpoint = Checkpoint(self.file_path, SIGNATURE)
+        self.assertEqual(checkpoint.rows, 60)
+        self.assertEqual(checkpoint.info, {'chunks': 2})
+        # Rows already written are skipped by the job
+        for _ in checkpoint.write_through(self.storage, chunks[2:], checkpoint.rows):
+            pass
+        self.assertEqual(checkpoint.finalize(self.storage), 100)
+
+        pd.testing.assert_frame_equal(self.read(), pd.concat(chunks))
+        self.assertEqual(os.listdir(self.dir_path), ['f.csv'])
+
+    def test_resume_from_earlier_row(self):
+        # Rows that the checkpoint holds are not written again
+        chunks = make_chunks(100, 30)
+        self.interrupt_after(chunks, 2)
+
+        checkpoint = Checkpoint(self.file_path, SIGNATURE)
+        for _ in checkpoint.write_through(self.storage, chunks[1:], 30):
+            pass
+        checkpoint.finalize(self.storage)
+        pd.testing.assert_frame_equal(self.read(), pd.concat(chunks))
+
+    def test_other_job(self):
+        chunks = make_chunks(100, 30)
+        self.interrupt_after(chunks, 2)
+
+        checkpoint = Checkpoint(self.file_path, dict(SIGNATURE, transforms=[]))
+        self.assertEqual(checkpoint.rows, 0)
+        self.assertIsNone(checkpoint.info)
+        self.assertEqual(os.listdir(self.dir_path), [])
+
+    def test_missing_segment(self):
+        chunks = make_chunks(100, 30)
+        self.interrupt_after(chunks, 2)
+        os.remove(os.path.join(self.file_path + '__segments', 'part-00001.csv'))
+
+        self.assertEqual(Checkpoint(self.file_path, SIGNATURE).rows, 0)
+
+    def test_truncate(self):
+        chunks = make_chunks(100, 30)
+        self.interrupt_after(chunks, 3)
+
+        checkpoint = Checkpoint(self.file_path, SIGNATURE)
+        self.assertEqual(checkpoint.truncate(100), 90)
+        # Whole segments are dropped
+        self.assertEqual(checkpoint.truncate(75), 60)
+        self.assertEqual(checkpoint.info, {'chunks': 3})
+        self.assertEqual(sorted(os.listdir(self.file_path + '__segments')),
+                         ['part-00000.csv', 'part-00001.csv'])
+        # The manifest was saved
+        self.assertEqual(Checkpoint(self.file_path, SIGNATURE).rows, 60)
+
+        for _ in checkpoint.write_through(self.storage, chunks[2:], 60):
+            pass
+        checkpoint.finalize(self.storage)
+        pd.testing.assert_frame_equal(self.read(), pd.concat(chunks))
+
+    def test_discard(self):
+        chunks = make_chunks(100, 30)
+        self.interrupt_after(chunks, 2)
+
+        checkpoint = Checkpoint(self.file_path, SIGNATURE)
+        checkpoint.discard()
+        self.assertEqual(checkpoint.rows, 0)
+        for _ in checkpoint.write_through(self.storage, chunks, 0):
+            pass
+        checkpoint.finalize(self.storage)
+        pd.testing.assert_frame_equal(self.read(), pd.concat(chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunk sizes chosen from the memory budget of workers (chunk_planner.py):
+chunks of the planned size fit in the budget, within the bounds of each use.
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import unittest
+
+import pandas as pd
+
+from chunk_planner import DEFAULT_VALUE_BYTES, MAX_CHUNKSIZES, MEMORY_FACTORS, \
+                          MIN_CHUNKSIZE, plan_chunksize, row_bytes
+
+BUDGET = 256 * 2**20
+
+
+class PlanChunksizeTest(unittest.TestCase):
+
+    def test_within_budget(self):
+        for use in MEMORY_FACTORS:
+            for bytes_per_row in [20000, 50000, 100000]:
+                with self.subTest(use=use, bytes_per_row=bytes_per_row):
+                    chunksize = plan_chunksize(bytes_per_row, use, budget=BUDGET)
+                    self.assertLessEqual(chunksize * bytes_per_row * MEMORY_FACTORS[use], BUDGET)
+                    self.assertGreater((chunksize + 1) * bytes_per_row * MEMORY_FACTORS[use], BUDGET)
+
+    def test_bounds(self):
+        for use in MEMORY_FACTORS:
+            with self.subTest(use=use):
+                # Narrow rows, large budget
+                self.assertEqual(plan_chunksize(1, use, budget=BUDGET), MAX_CHUNKSIZES[use])
+                # Wide rows, small budget
+                self.assertEqual(plan_chunksize(10**7, use, budget=BUDGET), MIN_CHUNKSIZE)
+                self.assertEqual(plan_chunksize(100, use, budget=0), MIN_CHUNKSIZE)
+
+    def test_no_row_size(self):
+        self.assertEqual(plan_chunksize(0, budget=BUDGET), plan_chunksize(1, budget=BUDGET))
+
+    def test_copies(self):
+        chunksize = plan_chunksize(10000, budget=BUDGET)
+        self.assertEqual(plan_chunksize(10000, copies=4, budget=BUDGET), chunksize // 4)
+        self.assertEqual(plan_chunksize(10000, copies=0, budget=BUDGET), chunksize)
+        self.assertEqual(plan_chunksize(10000, copies=10**6, budget=BUDGET), MIN_CHUNKSIZE)
+
+    def test_decreases_with_row_size(self):
+        chunksizes = [plan_chunksize(bytes_per_row, budget=BUDGET) \
+                      for bytes_per_row in [10, 100, 1000, 10000, 100000, 1000000]]
+        self.assertEqual(chunksizes, sorted(chunksizes, reverse=True))
+
+    def test_row_bytes(self):
+        narrow = pd.DataFrame({'a': ['x'] * 100})
+        wide = pd.DataFrame({'a': ['x' * 1000] * 100, 'b': ['y' * 1000] * 100})
+        self.assertGreater(row_bytes(wide), 2000)
+        self.assertLess(row_bytes(narrow), row_bytes(wide))
+        self.assertEqual(row_bytes(pd.DataFrame(columns=['a', 'b'])), 2 * DEFAULT_VALUE_BYTES)
+        self.assertEqual(row_bytes(pd.DataFrame()), DEFAULT_VALUE_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming reads of uploaded Excel files (excel_reader.py) and writes of xlsx
+files for download (excel_writer.py), compared with pandas.read_excel.
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import datetime
+import io
+import re
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from excel_reader import ExcelReader
+from excel_writer import write_xlsx
+from helpers import make_chunks
+
+try:
+    import xlwt
+except ImportError:
+    xlwt = None
+
+ROWS = [['nom', 'num', 'prix', 'date', 'ok', 'vide', None, 'nom']] \
+     + [[['Dupont', 'NA', '', None, 'N/A'][i % 5], i, i / 3, datetime.datetime(2017, 1, 1 + i % 28),
+         i % 2 == 0, None, None, 'x'] for i in range(60)]
+# Empty rows within the sheet
+ROWS[20] = [None] * 8
+ROWS[21] = []
+
+
+def xlsx_data(rows, cells={}):
+    '''xlsx file with rows (and values of cells by coordinate)'''
+    book = openpyxl.Workbook()
+    sheet = book.active
+    for row in rows:
+        sheet.append(row)
+    for coordinate, value in cells.items():
+        sheet[coordinate] = value
+    file = io.BytesIO()
+    book.save(file)
+    return file.getvalue()
+
+
+def without_dimension(data):
+    '''xlsx file without the dimension of its sheet'''
+    file = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as r, zipfile.ZipFile(file, 'w') as w:
+        for item in r.infolist():
+            content = r.read(item.filename)
+            if item.filename.endswith('sheet1.xml'):
+                content = re.sub(rb'<dimension[^>]*/>', b'', content)
+            w.writestr(item, content)
+    return file.getvalue()
+
+
+def xls_data(rows, cells={}):
+    '''xls file with rows (and values of cells by (row, column))'''
+    book = xlwt.Workbook()
+    sheet = book.add_sheet('sheet')
+    date_style = xlwt.easyxf(num_format_str='YYYY-MM-DD')
+    values = {(i, j): value for i, row in enumerate(rows) for j, value in enumerate(row)}
+    values.update(cells)
+    for (i, j), value in values.items():
+        if value is not None:
+            sheet.write(i, j, value, date_style if isinstance(value, datetime.datetime) else xlwt.Style.default_style)
+    file = io.BytesIO()
+    book.save(file)
+    return file.getvalue()
+
+
+def read_chunks(data, chunksize):
+    '''All rows read by chunks (the first one of 7 rows, as when sniffing)'''
+    reader = ExcelReader(io.BytesIO(data))
+    parts = [reader.get_chunk(7)]
+    while True:
+        try:
+            parts.append(reader.get_chunk(chunksize))
+        except StopIteration:
+            return pd.concat(parts)
+
+
+class ExcelReaderTest(unittest.TestCase):
+
+    def assert_same_as_pandas(self, data):
+        expected = pd.read_excel(io.BytesIO(data), dtype=str)
+        for chunksize in [3, 10, 1000]:
+            with self.subTest(chunksize=chunksize):
+                pd.testing.assert_frame_equal(read_chunks(data, chunksize), expected)
+
+    def test_xlsx(self):
+        # Including trailing empty rows and an error value
+        self.assert_same_as_pandas(xlsx_data(ROWS + [[], [None, None]], {'B40': '=1/0'}))
+
+    def test_xlsx_wide_row(self):
+        # A note to the right of the header, after the first chunk
+        self.assert_same_as_pandas(xlsx_data(ROWS, {'J50': 'total'}))
+        tab = read_chunks(xlsx_data(ROWS, {'J50': 'total'}), 10)
+        self.assertEqual(list(tab.columns)[-2:], ['Unnamed: 8', 'Unnamed: 9'])
+        self.assertEqual(tab['Unnamed: 9'].count(), 1)
+
+    def test_xlsx_wide_row_without_dimension(self):
+        data = without_dimension(xlsx_data(ROWS, {'J50': 'total'}))
+        with self.assertRaisesRegex(ValueError, 'Expected 8 fields in row 50 of the Excel sheet, saw 10'):
+            read_chunks(data, 10)
+        # Within the first chunk
+        self.assert_same_as_pandas(without_dimension(xlsx_data(ROWS, {'J5': 'total'})))
+
+    def test_empty(self):
+        tab = ExcelReader(io.BytesIO(xlsx_data([]))).get_chunk(7)
+        self.assertEqual(tab.shape, (0, 0))
+        tab = ExcelReader(io.BytesIO(xlsx_data([['a', 'b']]))).get_chunk(7)
+        self.assertEqual(list(tab.columns), ['a', 'b'])
+        self.assertEqual(len(tab), 0)
+
+    @unittest.skipIf(xlwt is None, 'xlwt is required to write xls files')
+    def test_xls(self):
+        self.assert_same_as_pandas(xls_data(ROWS))
+
+    @unittest.skipIf(xlwt is None, 'xlwt is required to write xls files')
+    def test_xls_wide_row(self):
+        self.assert_same_as_pandas(xls_data(ROWS, {(49, 9): 'total'}))
+
+
+class XlsxWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'f.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_same_as_pandas(self):
+        chunks = make_chunks(100, 30)
+        chunks[1] = chunks[1].assign(ville=np.nan, note='\x01sans\x02 contrôle')
+        chunks = [part_tab.assign(note=part_tab.get('note', 'ok')) for part_tab in chunks]
+        nrows = write_xlsx(self.file_path, iter(chunks), [('original_file', ['pos', 'nom']),
+                                                          ('normalization', ['ville', 'note'])])
+        self.assertEqual(nrows, 100)
+
+        expected = pd.concat(chunks)
+        expected['note'] = expected['note'].str.replace('[\x01\x02]', '', regex=True)
+        sheets = pd.read_excel(self.file_path, sheet_name=None)
+        self.assertEqual(list(sheets), ['original_file', 'normalization'])
+        pd.testing.assert_frame_equal(sheets['original_file'], expected[['pos', 'nom']].reset_index(drop=True))
+        pd.testing.assert_frame_equal(sheets['normalization'].astype(object),
+                                      expected[['ville', 'note']].reset_index(drop=True).astype(object))
+
+    def test_rollover(self):
+        # 10 rows per sheet, including the header
+        nrows = write_xlsx(self.file_path, iter(make_chunks(40, 7)),
+                           [('original_file', ['pos', 'nom']), ('a' * 40, ['ville'])], max_rows=10)
+        self.assertEqual(nrows, 40)
+        sheets = pd.read_excel(self.file_path, sheet_name=None)
+        self.assertEqual(list(sheets), ['original_file', 'original_file_2', 'original_file_3', 'original_file_4',
+                                        'original_file_5', 'a' * 31, 'a' * 29 + '_2', 'a' * 29 + '_3',
+                                        'a' * 29 + '_4', 'a' * 29 + '_5'])
+        self.assertEqual([len(sheets['original_file_{0}'.format(i)]) for i in range(2, 6)], [9, 9, 9, 4])
+        tab = pd.concat([sheets[name] for name in list(sheets)[:5]], ignore_index=True)
+        self.assertEqual(tab['pos'].tolist(), list(range(40)))
+        self.assertEqual(list(sheets['a' * 29 + '_5'].columns), ['ville'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Failures of the HTTP geocoding backend (geocoding.py): invalid responses
+leave their query ungeocoded, while a BAN search API that can not be reached
+raises ConnectionError (counted as fatal by matchers, which then bail out).
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import socket
+import threading
+import unittest
+import urllib.parse
+
+from geocoding import BanHttpBackend
+
+FEATURES = {'type': 'FeatureCollection',
+            'features': [{'properties': {'type': 'street', 'label': 'Rue de la Paix 75002 Paris'}}]}
+
+
+class FakeBanHandler(BaseHTTPRequestHandler):
+    '''Answers queries according to their text: "status 503", "invalid
+    json", or features otherwise'''
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)['q'][0]
+        if query.startswith('status '):
+            status, body = int(query.split()[1]), b'{}'
+        elif query == 'invalid json':
+            status, body = 200, b'{"features": ['
+        else:
+            status, body = 200, json.dumps(FEATURES).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def closed_port():
+    '''Port of the local host on which nothing listens'''
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class BanHttpBackendTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), FakeBanHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = '127.0.0.1:{0}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_search_all(self):
+        backend = BanHttpBackend(self.host, threads=4)
+        features = backend.search_all(['rue de la paix', 'status 404', 'invalid json', 'paris'])
+        self.assertEqual(features['rue de la paix'], [FEATURES['features'][0]['properties']])
+        self.assertEqual(features['paris'], features['rue de la paix'])
+        # Invalid responses leave their query ungeocoded
+        self.assertIsNone(features['status 404'])
+        self.assertIsNone(features['invalid json'])
+
+    def test_unavailable(self):
+        for threads in [1, 4]:
+            with self.subTest(threads=threads):
+                backend = BanHttpBackend(self.host, threads=threads)
+                with self.assertRaises(ConnectionError):
+                    backend.search_all(['rue de la paix', 'status 503'])
+
+    def test_unreachable_host(self):
+        backend = BanHttpBackend('127.0.0.1:{0}'.format(closed_port()), threads=4, timeout=1)
+        with self.assertRaises(ConnectionError):
+            backend.search('rue de la paix')
+        with self.assertRaises(ConnectionError):
+            backend.search_all(['rue de la paix', 'paris', 'lyon'])
+
+    def test_timeout(self):
+        # The host accepts connections but never answers
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            s.listen(8)
+            backend = BanHttpBackend('127.0.0.1:{0}'.format(s.getsockname()[1]), timeout=0.2)
+            with self.assertRaises(ConnectionError):
+                backend.search('rue de la paix')
+
+
+if __name__ == '__main__':
+    unittest.main()
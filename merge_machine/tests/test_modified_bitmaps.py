@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run-length encoded bitmaps of __MODIFIED columns (modified_bitmaps.py):
+columns appended by chunks and files put end to end expand back to the same
+values, with runs that continue across chunks merged.
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from helpers import feed, make_chunks, make_tab
+from modified_bitmaps import ModifiedBitmaps
+
+COLUMNS = ['pos', 'nom', 'ville', 'nom__MODIFIED']
+
+
+def from_chunks(values, chunksize):
+    '''Bitmaps of chunks with values as nom__MODIFIED'''
+    return feed(ModifiedBitmaps().append, make_chunks(len(values), chunksize, values))
+
+
+class ModifiedBitmapsTest(unittest.TestCase):
+
+    def test_append(self):
+        bitmaps = ModifiedBitmaps()
+        part_tab = bitmaps.append(make_tab(5, modified=[False, True, True, False, True]))
+        self.assertEqual(list(part_tab.columns), ['pos', 'nom', 'ville'])
+        self.assertEqual(bitmaps.columns, COLUMNS)
+        self.assertEqual(bitmaps.modified_columns, ['nom__MODIFIED'])
+        self.assertEqual(bitmaps.bounds('nom__MODIFIED').tolist(), [1, 3, 4, 5])
+        self.assertEqual(bitmaps.counts(), {'nom': 3})
+
+    def test_runs_across_chunks(self):
+        # Runs that end at the end of a chunk and start at the next one
+        values = [True, True, True, False, True, True, True, True, False, False, True, True]
+        bitmaps = from_chunks(values, 3)
+        self.assertEqual(bitmaps.bounds('nom__MODIFIED').tolist(), [0, 3, 4, 8, 10, 12])
+        self.assertEqual(bitmaps.nrows, len(values))
+
+    def test_expand(self):
+        np.random.seed(0)
+        values = np.random.random(1000) < 0.3
+        values[:10] = True
+        values[-10:] = True
+        bitmaps = from_chunks(values, 70)
+        self.assertEqual(bitmaps.expand('nom__MODIFIED', 0, 1000).tolist(), values.tolist())
+        # Ranges starting or stopping within runs, between runs and at bounds
+        for start, stop in [(0, 0), (5, 15), (3, 997), (999, 1000), (70, 140), (500, 501)]:
+            with self.subTest(start=start, stop=stop):
+                self.assertEqual(bitmaps.expand('nom__MODIFIED', start, stop).tolist(),
+                                 values[start:stop].tolist())
+
+    def test_no_modification(self):
+        bitmaps = from_chunks([False] * 50, 20)
+        self.assertEqual(bitmaps.bounds('nom__MODIFIED').tolist(), [])
+        self.assertEqual(bitmaps.expand('nom__MODIFIED', 10, 30).tolist(), [False] * 20)
+        self.assertEqual(bitmaps.counts(), {'nom': 0})
+
+    def test_concat(self):
+        # First file ends with a run, that the second file continues
+        first = from_chunks([False, True, True], 2)
+        second = from_chunks([True, False, False, True], 3)
+        bitmaps = ModifiedBitmaps.concat([first, second])
+        self.assertEqual(bitmaps.nrows, 7)
+        self.assertEqual(bitmaps.columns, COLUMNS)
+        self.assertEqual(bitmaps.bounds('nom__MODIFIED').tolist(), [1, 4, 6, 7])
+        self.assertEqual(bitmaps.expand('nom__MODIFIED', 0, 7).tolist(),
+                         [False, True, True, True, False, False, True])
+
+    def test_save_load(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, 'f.csv__modified.npz')
+            values = [True, False, True, True, False]
+            from_chunks(values, 2).save(file_path)
+            bitmaps = ModifiedBitmaps.load(file_path)
+            self.assertEqual(bitmaps.columns, COLUMNS)
+            self.assertEqual(bitmaps.nrows, 5)
+            self.assertEqual(bitmaps.expand('nom__MODIFIED', 0, 5).tolist(), values)
+            self.assertIsNone(ModifiedBitmaps.load(os.path.join(dir_path, 'missing.npz')))
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
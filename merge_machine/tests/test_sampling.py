@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reservoir sample of the rows of a file (sampling.py): rows are selected
+uniformly whatever the chunks, and are found at the same positions in other
+versions of the file.
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from helpers import feed, make_chunks
+from sampling import RowSample
+
+
+def sample_of(chunks, capacity):
+    return feed(RowSample(capacity=capacity).update, chunks)
+
+
+class RowSampleTest(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_fill(self):
+        # Files with fewer rows than the capacity are sampled entirely
+        sample = sample_of(make_chunks(30, 7), 50)
+        self.assertEqual(sample.nrows, 30)
+        self.assertEqual(sample.index.tolist(), list(range(30)))
+        self.assertEqual(sample.rows['pos'].tolist(), list(range(30)))
+
+    def test_update(self):
+        for chunksize in [1, 13, 200, 5000]:
+            with self.subTest(chunksize=chunksize):
+                sample = sample_of(make_chunks(5000, chunksize), 100)
+                self.assertEqual(sample.nrows, 5000)
+                self.assertEqual(len(set(sample.index)), 100)
+                # Rows are those at the positions of the sample, in file order
+                self.assertEqual(sample.rows.index.tolist(), sample.index.tolist())
+                self.assertEqual(sample.rows['pos'].tolist(), sample.index.tolist())
+
+    def test_uniform(self):
+        # Each row is in the sample with probability capacity / num_rows
+        counts = np.zeros(1000)
+        for _ in range(300):
+            counts[sample_of(make_chunks(1000, 70), 50).index] += 1
+        self.assertAlmostEqual(counts.mean(), 15, places=6)
+        for part in np.split(counts, 10):
+            self.assertLess(abs(part.mean() - 15), 1.5)
+
+    def test_memory_bounded(self):
+        sample = RowSample(capacity=10)
+        for part_tab in make_chunks(10000, 10):
+            sample.update(part_tab)
+            self.assertLessEqual(sample._num_kept, 2 * sample.capacity)
+
+    def test_follow(self):
+        sample = sample_of(make_chunks(1000, 70), 40)
+        follower = sample.follower()
+        for part_tab in make_chunks(1000, 90):
+            self.assertIs(follower.follow(part_tab), part_tab)
+        self.assertEqual(follower.nrows, 1000)
+        self.assertEqual(follower.index.tolist(), sample.index.tolist())
+        self.assertEqual(follower.rows['pos'].tolist(), sample.index.tolist())
+
+    def test_subsample(self):
+        sample = sample_of(make_chunks(1000, 70), 40)
+        rows = sample.subsample(10)
+        self.assertEqual(len(rows), 10)
+        self.assertTrue(rows.index.is_monotonic_increasing)
+        self.assertTrue(set(rows.index) <= set(sample.index))
+        self.assertEqual(len(sample.subsample(100)), 40)
+
+    def test_save_load(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, 'f.csv' + RowSample.FILE_SUFFIX)
+            sample = RowSample(file_path, capacity=20)
+            for part_tab in make_chunks(500, 30):
+                sample.update(part_tab.assign(nom=np.where(part_tab['pos'] % 3, 'a', None)))
+            sample.save()
+            loaded = RowSample.load(file_path)
+            self.assertEqual((loaded.capacity, loaded.nrows), (20, 500))
+            self.assertEqual(loaded.index.tolist(), sample.index.tolist())
+            self.assertEqual(loaded.rows['pos'].tolist(), sample.index.tolist())
+            self.assertEqual(loaded.rows['nom'].isnull().tolist(),
+                             (sample.index % 3 == 0).tolist())
+            self.assertIsNone(RowSample.load(os.path.join(dir_path, 'missing.json')))
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Encoding and separator detection (sniffer.py) on a corpus of tricky CSV
+files, compared with the decisions of the former detection on upload (trial
+parses with each encoding and separator).
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir) 
+
+import io
+import unittest
+
+import pandas as pd
+
+from sniffer import read_sample, sniff
+
+CORPUS = {
+    'semicolon': 'nom;ville;code\nDupont;Paris;75001\nMartin;Lyon;69001\n'.encode('utf-8'),
+    'comma_quoted_semicolons': 'nom,adresse\nDupont,"1; rue de la Paix"\nMartin,"2; quai, Lyon"\n'.encode('utf-8'),
+    'tab': 'nom\tville\nDupont\tParis\nMartin, Jean\tLyon\n'.encode('utf-8'),
+    'quoted_newlines': 'id;commentaire\n1;"ligne 1\nligne 2; suite"\n2;"a, b"\n'.encode('utf-8'),
+    'semicolon_with_commas': 'nom;adresse\nDupont;1, rue de la Paix\nMartin;2, quai Saint-Antoine\n'.encode('utf-8'),
+    'single_column_with_commas': 'nom\nDupont, Jean\nMartin\n'.encode('utf-8'),
+    'trailing_separator': 'a;b;\n1;2;\n3;4;\n'.encode('utf-8'),
+    'ragged_rows': 'a,b,c\n1,2\n3,4,5\n6\n'.encode('utf-8'),
+    'implicit_index': 'a,b\n0,1,2\n1,3,4\n'.encode('utf-8'),
+    'blank_lines': 'a;b\n\n1;2\n\n3;4\n'.encode('utf-8'),
+    'latin_1': 'nom;ville\nLefèvre;Besançon\nGaëlle;Orléans\n'.encode('ISO-8859-1'),
+    'utf_8_bom': 'nom,ville\nLefèvre,Besançon\n'.encode('utf-8-sig'),
+    'utf_8_accents': 'nom\tville\nLefèvre\tBesançon\nŒuvre\tSaint-Étienne\n'.encode('utf-8'),
+    'header_only': 'a;b;c\n'.encode('utf-8'),
+    'wide': (';'.join('col_{}'.format(i) for i in range(300)) + '\n' \
+             + ';'.join('v,{}'.format(i) for i in range(300)) + '\n').encode('utf-8'),
+}
+
+
+def former_decision(data):
+    '''Encoding and separator chosen by the former detection'''
+    for encoding in ['utf-8', 'ISO-8859-1', 'windows-1252']:
+        best_sep = None
+        best_sep_num_cols = 0
+        for sep in [';', ',', '\t']:
+            try:
+                columns = pd.read_csv(io.BytesIO(data), sep=sep, encoding=encoding, dtype=str).columns
+                if len(columns) >= best_sep_num_cols:
+                    best_sep = sep
+                    best_sep_num_cols = len(columns)
+            except Exception:
+                pass
+        if best_sep is not None:
+            return encoding, best_sep
+
+
+class SnifferTest(unittest.TestCase):
+
+    def test_same_decisions(self):
+        for name, data in CORPUS.items():
+            with self.subTest(name=name):
+                self.assertEqual(sniff(data), former_decision(data))
+
+    def test_windows_1252(self):
+        # Formerly read as ISO-8859-1, with control characters instead of € and ’
+        data = 'prix;commentaire\n10 €;l’été\n'.encode('windows-1252')
+        encoding, sep = sniff(data)
+        self.assertEqual((encoding, sep), ('windows-1252', ';'))
+        tab = pd.read_csv(io.BytesIO(data), sep=sep, encoding=encoding, dtype=str)
+        self.assertEqual(list(tab.iloc[0]), ['10 €', 'l’été'])
+
+    def test_utf_16(self):
+        data = 'nom;ville\nLefèvre;Besançon\n'.encode('utf-16')
+        encoding, sep = sniff(data)
+        tab = pd.read_csv(io.BytesIO(data), sep=sep, encoding=encoding, dtype=str)
+        self.assertEqual(list(tab.columns), ['nom', 'ville'])
+        self.assertEqual(list(tab.iloc[0]), ['Lefèvre', 'Besançon'])
+
+    def test_truncated_sample(self):
+        # The sample ends in the middle of a record (and of a character)
+        data = 'nom;ville\n'.encode('utf-8') + 'Lefèvre;"Besançon, Doubs"\n'.encode('utf-8') * 40000
+        sample, file = read_sample(io.BytesIO(data))
+        self.assertLess(len(sample), len(data))
+        self.assertEqual(sniff(sample), ('utf-8', ';'))
+
+    def test_read_sample(self):
+        data = CORPUS['quoted_newlines']
+        for file in [io.BytesIO(data), io.BufferedReader(io.BytesIO(data), 4)]:
+            sample, file = read_sample(file)
+            self.assertEqual(sample, data)
+            self.assertEqual(file.read(), data)
+
+    def test_not_seekable(self):
+        class Stream(io.RawIOBase):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+            def readable(self):
+                return True
+            def readinto(self, buffer):
+                chunk = self.data.read(len(buffer))
+                buffer[:len(chunk)] = chunk
+                return len(chunk)
+        data = CORPUS['semicolon'] * 3
+        sample, file = read_sample(Stream(data))
+        self.assertEqual(file.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Atomic writes and versioned pickle files (storage.py): a file is either
+entirely written or left as it was, and files of another version are ignored.
+"""
+
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import shutil
+import tempfile
+import unittest
+
+from storage import atomic_write, load_versioned_pickle, save_versioned_pickle
+
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'f.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def read(self):
+        with open(self.file_path) as f:
+            return f.read()
+
+    def test_write(self):
+        with atomic_write(self.file_path) as f:
+            f.write('old')
+        with atomic_write(self.file_path) as f:
+            f.write('new')
+            # Not replaced until the block exits
+            self.assertEqual(self.read(), 'old')
+        self.assertEqual(self.read(), 'new')
+        self.assertEqual(os.listdir(self.dir_path), ['f.json'])
+
+    def test_error(self):
+        with atomic_write(self.file_path) as f:
+            f.write('old')
+        with self.assertRaises(ValueError):
+            with atomic_write(self.file_path) as f:
+                f.write('new')
+                raise ValueError()
+        self.assertEqual(self.read(), 'old')
+        self.assertEqual(os.listdir(self.dir_path), ['f.json'])
+
+
+class VersionedPickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.dir_path, 'cache', 'f.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_save_load(self):
+        value = {'a': [1, 2], 'b': None}
+        save_versioned_pickle(self.file_path, 3, value)
+        self.assertEqual(load_versioned_pickle(self.file_path, 3), value)
+
+    def test_stale(self):
+        save_versioned_pickle(self.file_path, 'v1', 'value')
+        self.assertIsNone(load_versioned_pickle(self.file_path, 'v2'))
+
+    def test_missing_or_unreadable(self):
+        self.assertIsNone(load_versioned_pickle(self.file_path, 1))
+        os.makedirs(os.path.dirname(self.file_path))
+        with open(self.file_path, 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertIsNone(load_versioned_pickle(self.file_path, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()